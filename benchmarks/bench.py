@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+
+"""
+Overhead benchmarks for ptimeout.
+
+Measures ptimeout against direct exec and GNU timeout:
+  startup         wall time of a complete `ptimeout 5s -- /bin/true`
+  spawn           time from invocation until the child is running
+  exit_detection  time from the child exiting until ptimeout returns
+  kill_latency    time past the deadline until ptimeout returns
+  throughput      high-rate stdout producer, piped and under a pseudo-terminal
+
+Every case is run a few times as warm-up before the measured runs, and
+reports p50/p95/p99. Results can be saved as a JSON baseline and compared
+against on a later run to catch regressions in the hot loop:
+
+    python benchmarks/bench.py --save baseline.json
+    python benchmarks/bench.py --compare baseline.json
+"""
+
+import argparse
+import contextlib
+import fcntl
+import io
+import json
+import math
+import os
+import platform
+import pty
+import shlex
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import termios
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_ROOT, "src")
+DEFAULT_PTIMEOUT = [sys.executable, os.path.join(SRC_DIR, "ptimeout.py")]
+
+CASES = ["startup", "spawn", "exit_detection", "kill_latency", "throughput"]
+
+# Targets that exist only to put ptimeout's numbers in context. They are
+# reported, but never count as a regression when comparing to a baseline.
+REFERENCE_TARGETS = {"direct", "gnu_timeout", "direct_pty"}
+
+PERCENTILES = (50, 95, 99)
+
+# Deadline used by the kill latency case; the CLI only accepts whole seconds
+KILL_TIMEOUT_CLI = 1
+KILL_TIMEOUT_IN_PROCESS = 0.2
+
+THROUGHPUT_LINE = "x" * 99  # 100 bytes with the newline
+PTY_SIZE = (40, 120)  # rows, columns
+
+TIMESTAMP_COMMAND = ["date", "+%s.%N"]
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of samples."""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """p50/p95/p99 and mean of samples, in seconds."""
+    summary = {f"p{pct}": percentile(samples, pct) for pct in PERCENTILES}
+    summary["mean"] = statistics.mean(samples)
+    summary["runs"] = len(samples)
+    return summary
+
+
+def measure(sample, runs, warmup):
+    """Call sample() warmup times, then runs times; return the measured values."""
+    for _ in range(warmup):
+        sample()
+    return [sample() for _ in range(runs)]
+
+
+def wall_time(args, **kwargs):
+    """Seconds taken to run args to completion with no terminal attached."""
+    kwargs.setdefault("stdout", subprocess.DEVNULL)
+    start = time.perf_counter()
+    subprocess.run(args, stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
+    return time.perf_counter() - start
+
+
+def timestamped_run(args):
+    """
+    Run args, whose command prints a wall-clock timestamp, and return
+    (spawn seconds, exit detection seconds) relative to that timestamp.
+    """
+    start = time.time()
+    result = subprocess.run(
+        args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    end = time.time()
+    stamp = float(result.stdout.split()[-1])
+    return stamp - start, end - stamp
+
+
+@contextlib.contextmanager
+def quiet_non_interactive():
+    """Make in-process run_command calls take the non-interactive path, silently."""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(
+        io.StringIO()
+    ):
+        yield
+
+
+def in_process_timestamped_run(run_command):
+    """Like timestamped_run, but through run_command in this process."""
+    with tempfile.NamedTemporaryFile("r") as out:
+        start = time.time()
+        with quiet_non_interactive():
+            run_command(TIMESTAMP_COMMAND, 5, 0, stdout_file=out.name)
+        end = time.time()
+        stamp = float(out.read().split()[-1])
+    return stamp - start, end - stamp
+
+
+def open_pty():
+    """A pseudo-terminal pair sized so the interactive UI has room to draw."""
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack("HHHH", *PTY_SIZE, 0, 0))
+    return master, slave
+
+
+def pty_wall_time(args):
+    """Seconds taken to run args with stdout on a terminal we keep draining."""
+    master, slave = open_pty()
+
+    def drain():
+        try:
+            while os.read(master, 65536):
+                pass
+        except OSError:
+            pass  # EIO once every slave end is closed
+
+    reader = threading.Thread(target=drain)
+    start = time.perf_counter()
+    try:
+        proc = subprocess.Popen(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=slave,
+            stderr=slave,
+        )
+        os.close(slave)
+        slave = None
+        reader.start()
+        proc.wait()
+        elapsed = time.perf_counter() - start
+        reader.join()
+    finally:
+        if slave is not None:
+            os.close(slave)
+        os.close(master)
+    return elapsed
+
+
+class Bench:
+    def __init__(self, ptimeout, runs, warmup, lines):
+        self.ptimeout = ptimeout
+        self.runs = runs
+        self.warmup = warmup
+        self.lines = lines
+        self.gnu_timeout = shutil.which("timeout")
+        self._run_command = None
+        self._timestamped_samples = None
+
+    @property
+    def run_command(self):
+        if self._run_command is None:
+            sys.path.insert(0, SRC_DIR)
+            from ptimeout import run_command
+
+            self._run_command = run_command
+        return self._run_command
+
+    def time_targets(self, targets):
+        """Measure each (name, sample function) pair; return name -> samples."""
+        return {
+            name: measure(sample, self.runs, self.warmup) for name, sample in targets
+        }
+
+    def wrap(self, args, timeout="5"):
+        """args run under every wrapper, as (target name, argv) pairs."""
+        wrapped = [("direct", args)]
+        if self.gnu_timeout:
+            wrapped.append(("gnu_timeout", [self.gnu_timeout, timeout] + args))
+        wrapped.append(("ptimeout", self.ptimeout + [f"{timeout}s", "--"] + args))
+        return wrapped
+
+    def startup(self):
+        targets = [
+            (name, lambda argv=argv: wall_time(argv))
+            for name, argv in self.wrap(["/bin/true"])
+        ]
+        targets.append(
+            ("ptimeout_version", lambda: wall_time(self.ptimeout + ["--version"]))
+        )
+        return self.time_targets(targets)
+
+    def _timestamped(self):
+        """Spawn and exit detection samples per target, from the same runs."""
+        targets = [
+            (name, lambda argv=argv: timestamped_run(argv))
+            for name, argv in self.wrap(TIMESTAMP_COMMAND)
+        ]
+        targets.append(
+            ("run_command", lambda: in_process_timestamped_run(self.run_command))
+        )
+        return self.time_targets(targets)
+
+    def spawn(self):
+        return {name: [s for s, _ in pairs] for name, pairs in self._pairs().items()}
+
+    def exit_detection(self):
+        return {name: [e for _, e in pairs] for name, pairs in self._pairs().items()}
+
+    def _pairs(self):
+        if self._timestamped_samples is None:
+            self._timestamped_samples = self._timestamped()
+        return self._timestamped_samples
+
+    def kill_latency(self):
+        sleeper = ["sleep", "30"]
+        targets = []
+        if self.gnu_timeout:
+            argv = [self.gnu_timeout, str(KILL_TIMEOUT_CLI)] + sleeper
+            targets.append(("gnu_timeout", lambda: wall_time(argv) - KILL_TIMEOUT_CLI))
+        argv = self.ptimeout + [f"{KILL_TIMEOUT_CLI}s", "--"] + sleeper
+        targets.append(("ptimeout", lambda: wall_time(argv) - KILL_TIMEOUT_CLI))
+
+        def in_process():
+            start = time.perf_counter()
+            with quiet_non_interactive():
+                self.run_command(sleeper, KILL_TIMEOUT_IN_PROCESS, 0)
+            return time.perf_counter() - start - KILL_TIMEOUT_IN_PROCESS
+
+        targets.append(("run_command", in_process))
+        return self.time_targets(targets)
+
+    def throughput(self):
+        producer = [
+            "sh",
+            "-c",
+            f"yes {THROUGHPUT_LINE} | head -n {self.lines}",
+        ]
+        targets = [
+            (name, lambda argv=argv: wall_time(argv))
+            for name, argv in self.wrap(producer, timeout="60")
+        ]
+        interactive = self.ptimeout + ["60s", "--"] + producer
+        minimal = self.ptimeout + ["--progress-style", "minimal", "60s", "--"]
+        targets += [
+            ("direct_pty", lambda: pty_wall_time(producer)),
+            ("ptimeout_pty", lambda: pty_wall_time(interactive)),
+            ("ptimeout_pty_minimal", lambda: pty_wall_time(minimal + producer)),
+        ]
+        return self.time_targets(targets)
+
+
+def run_cases(bench, cases):
+    """Run the selected cases; return {case: {target: summary}}."""
+    results = {}
+    for case in cases:
+        print(f"Running {case}...", file=sys.stderr)
+        samples = getattr(bench, case)()
+        results[case] = {}
+        for target, values in samples.items():
+            summary = summarize(values)
+            if case == "throughput":
+                summary["lines_per_s"] = bench.lines / summary["p50"]
+                summary["mb_per_s"] = (
+                    bench.lines * (len(THROUGHPUT_LINE) + 1) / summary["p50"] / 1e6
+                )
+            results[case][target] = summary
+    return results
+
+
+def format_results(results):
+    rows = []
+    for case, targets in results.items():
+        rows.append(f"{case}")
+        for target, summary in targets.items():
+            row = f"  {target:<22}" + "".join(
+                f" p{pct} {summary[f'p{pct}'] * 1000:9.2f}ms" for pct in PERCENTILES
+            )
+            if "lines_per_s" in summary:
+                row += (
+                    f"  {summary['lines_per_s']:>12,.0f} lines/s"
+                    f"  {summary['mb_per_s']:8.1f} MB/s"
+                )
+            rows.append(row)
+    return "\n".join(rows)
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare p50s against a baseline.
+
+    Returns (report lines, regressions), where regressions lists the
+    non-reference targets whose p50 grew by more than threshold.
+    """
+    lines = []
+    regressions = []
+    for case, targets in results.items():
+        for target, summary in targets.items():
+            before = baseline.get("results", {}).get(case, {}).get(target)
+            if not before:
+                continue
+            change = summary["p50"] / before["p50"] - 1 if before["p50"] > 0 else 0.0
+            marker = ""
+            if target not in REFERENCE_TARGETS and change > threshold:
+                regressions.append(f"{case}/{target}")
+                marker = "  REGRESSION"
+            lines.append(
+                f"{case}/{target}: p50 {before['p50'] * 1000:.2f}ms -> "
+                f"{summary['p50'] * 1000:.2f}ms ({change:+.1%}){marker}"
+            )
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark ptimeout overhead against direct exec and GNU timeout."
+    )
+    parser.add_argument(
+        "cases",
+        nargs="*",
+        metavar="CASE",
+        help=f"Cases to run (default: all of {', '.join(CASES)}).",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=20, help="Measured runs per target."
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=3, help="Warm-up runs per target."
+    )
+    parser.add_argument(
+        "--lines",
+        type=int,
+        default=200_000,
+        help="Lines written by the throughput producer.",
+    )
+    parser.add_argument(
+        "--ptimeout",
+        help="Command used to invoke ptimeout, e.g. a built binary "
+        "(default: this interpreter running src/ptimeout.py).",
+    )
+    parser.add_argument("--save", metavar="FILE", help="Write results as JSON.")
+    parser.add_argument(
+        "--compare", metavar="FILE", help="Compare p50s against a saved baseline."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Relative p50 increase counted as a regression (default: 0.25).",
+    )
+    args = parser.parse_args(argv)
+    unknown = sorted(set(args.cases) - set(CASES))
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+
+    ptimeout = shlex.split(args.ptimeout) if args.ptimeout else DEFAULT_PTIMEOUT
+    bench = Bench(ptimeout, args.runs, args.warmup, args.lines)
+    cases = [case for case in CASES if case in args.cases] or CASES
+
+    results = run_cases(bench, cases)
+    print(format_results(results))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "ptimeout": ptimeout,
+            "runs": args.runs,
+            "warmup": args.warmup,
+            "lines": args.lines,
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.save}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        lines, regressions = compare(results, baseline, args.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,33 @@
 #!/bin/bash
 # Script to build the ptimeout standalone binary
+# Usage: build_binary.sh [auto|onefile|onedir|zipapp]
+#
+#   onefile  PyInstaller single executable. Unpacks itself to a temp dir on
+#            every run, which is the slowest to start.
+#   onedir   PyInstaller directory build. Nothing to unpack at startup.
+#   zipapp   Python zip application with precompiled bytecode, run by the
+#            system python3. Smallest, but needs python3 on the target, so it
+#            is only ever built when asked for by name.
+#   auto     Build onefile and onedir, benchmark their startup and keep the
+#            fastest (default). Both run without python3 on the target.
+#
+# The chosen build ends up at dist/ptimeout.
 
 set -e
 
-echo "Building ptimeout binary..."
+BUILD_FORMAT="${1:-${PTIMEOUT_BUILD_FORMAT:-auto}}"
+case "$BUILD_FORMAT" in
+    auto|onefile|onedir|zipapp) ;;
+    *) echo "Error: Unknown build format '$BUILD_FORMAT'. Use auto, onefile, onedir or zipapp."; exit 1 ;;
+esac
+
+echo "Building ptimeout binary (format: $BUILD_FORMAT)..."
 
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" &> /dev/null && pwd )"
 PROJECT_ROOT="$SCRIPT_DIR/../" # Go up one level from 'scripts'
-PTIMEOUT_MODULE_DIR="$PROJECT_ROOT/src" 
+PTIMEOUT_MODULE_DIR="$PROJECT_ROOT/src"
 PTIMEOUT_SCRIPT="$PTIMEOUT_MODULE_DIR/ptimeout.py"
+BENCH_SCRIPT="$PROJECT_ROOT/benchmarks/bench.py"
 
 # Define paths for the build artifacts (now at project root)
 DIST_DIR="$PROJECT_ROOT/dist"
@@ -30,8 +49,10 @@ else
 fi
 
 # Activate the temporary virtual environment and install dependencies
-echo "Installing PyInstaller and application dependencies into temporary venv..."
-"$BUILD_VENV_PYTHON" -m pip install PyInstaller || { echo "Error: Failed to install PyInstaller."; exit 1; }
+if [ "$BUILD_FORMAT" != "zipapp" ]; then
+    echo "Installing PyInstaller and application dependencies into temporary venv..."
+    "$BUILD_VENV_PYTHON" -m pip install PyInstaller || { echo "Error: Failed to install PyInstaller."; exit 1; }
+fi
 
 if [ -f "$PTIMEOUT_MODULE_DIR/requirements.txt" ]; then
     "$BUILD_VENV_PYTHON" -m pip install -r "$PTIMEOUT_MODULE_DIR/requirements.txt" || { echo "Error: Failed to install application dependencies."; exit 1; }
@@ -39,16 +60,98 @@ else
     echo "Warning: requirements.txt not found at $PTIMEOUT_MODULE_DIR/requirements.txt. Proceeding without specific application dependencies."
 fi
 
-# Run PyInstaller using the temporary venv's Python
-echo "Running PyInstaller..."
-"$BUILD_VENV_PYTHON" -m PyInstaller --onefile --distpath "$DIST_DIR" --workpath "$BUILD_DIR" "$PTIMEOUT_SCRIPT" || { echo "Error: PyInstaller failed."; exit 1; }
+mkdir -p "$DIST_DIR" "$BUILD_DIR"
+
+# Each format is built into its own directory under dist/ and recorded here
+# as "name path" so the chosen one can be installed as dist/ptimeout.
+CANDIDATES=()
+
+build_pyinstaller() {
+    local mode="$1"
+    echo "Running PyInstaller (--$mode)..."
+    "$BUILD_VENV_PYTHON" -m PyInstaller --noconfirm "--$mode" --name ptimeout \
+        --distpath "$DIST_DIR/$mode" --workpath "$BUILD_DIR/$mode" --specpath "$BUILD_DIR/$mode" \
+        "$PTIMEOUT_SCRIPT" || { echo "Error: PyInstaller failed."; exit 1; }
+    if [ "$mode" = "onedir" ]; then
+        CANDIDATES+=("onedir $DIST_DIR/onedir/ptimeout/ptimeout")
+    else
+        CANDIDATES+=("onefile $DIST_DIR/onefile/ptimeout")
+    fi
+}
+
+build_zipapp() {
+    local staging="$BUILD_DIR/zipapp"
+    echo "Building zipapp with precompiled bytecode..."
+    rm -rf "$staging" "$DIST_DIR/zipapp"
+    mkdir -p "$staging" "$DIST_DIR/zipapp"
+
+    # ptimeout.py and the modules it imports lazily (ptimeout_*.py)
+    cp "$PTIMEOUT_MODULE_DIR"/ptimeout*.py "$staging/"
+    if [ -f "$PTIMEOUT_MODULE_DIR/requirements.txt" ]; then
+        "$BUILD_VENV_PYTHON" -m pip install --quiet --target "$staging" -r "$PTIMEOUT_MODULE_DIR/requirements.txt" || { echo "Error: Failed to vendor application dependencies."; exit 1; }
+    fi
+    rm -rf "$staging"/bin "$staging"/*.dist-info
+    printf 'from ptimeout import main\n\nmain()\n' > "$staging/__main__.py"
+
+    # zipimport only loads bytecode stored next to its source (-b). Sources stay
+    # in the archive as the fallback when run by a different Python version.
+    find "$staging" -name __pycache__ -prune -exec rm -rf {} +
+    python3 -m compileall -q -b "$staging" || { echo "Error: Failed to compile bytecode."; exit 1; }
+
+    python3 -m zipapp "$staging" -p "/usr/bin/env python3" -o "$DIST_DIR/zipapp/ptimeout.pyz" || { echo "Error: zipapp failed."; exit 1; }
+    CANDIDATES+=("zipapp $DIST_DIR/zipapp/ptimeout.pyz")
+}
+
+case "$BUILD_FORMAT" in
+    onefile|onedir) build_pyinstaller "$BUILD_FORMAT" ;;
+    zipapp) build_zipapp ;;
+    auto)
+        # Standalone builds only: auto must never hand out a zipapp
+        build_pyinstaller onefile
+        build_pyinstaller onedir
+        ;;
+esac
+
+# Pick the build with the lowest median startup for `ptimeout 5s -- /bin/true`
+CHOSEN_NAME=""
+CHOSEN_PATH=""
+if [ "${#CANDIDATES[@]}" -gt 1 ]; then
+    BEST_P50=""
+    for candidate in "${CANDIDATES[@]}"; do
+        read -r name path <<< "$candidate"
+        echo "Benchmarking startup of the $name build..."
+        python3 "$BENCH_SCRIPT" startup --runs 15 --warmup 3 --ptimeout "$path" \
+            --save "$BUILD_DIR/startup-$name.json" > /dev/null || { echo "Error: Startup benchmark failed for $name."; exit 1; }
+        p50=$(python3 -c 'import json, sys; print(json.load(open(sys.argv[1]))["results"]["startup"]["ptimeout"]["p50"])' "$BUILD_DIR/startup-$name.json")
+        echo "  $name: p50 startup $(python3 -c "print(f'{$p50 * 1000:.1f}ms')")"
+        if [ -z "$BEST_P50" ] || python3 -c "import sys; sys.exit(not $p50 < $BEST_P50)"; then
+            BEST_P50="$p50"
+            CHOSEN_NAME="$name"
+            CHOSEN_PATH="$path"
+        fi
+    done
+    echo "Fastest startup: $CHOSEN_NAME"
+else
+    read -r CHOSEN_NAME CHOSEN_PATH <<< "${CANDIDATES[0]}"
+fi
+
+# Install the chosen build as dist/ptimeout. Single-file builds are copied so
+# dist/ptimeout can be moved around; the onedir executable needs its directory.
+rm -f "$DIST_DIR/ptimeout"
+if [ "$CHOSEN_NAME" = "onedir" ]; then
+    ln -s "onedir/ptimeout/ptimeout" "$DIST_DIR/ptimeout"
+else
+    cp "$CHOSEN_PATH" "$DIST_DIR/ptimeout"
+    chmod +x "$DIST_DIR/ptimeout"
+fi
+echo "$CHOSEN_NAME" > "$DIST_DIR/BUILD_FORMAT"
 
 # Ensure host user has full permissions on generated files
 echo "Setting permissions on generated build artifacts..."
 chmod -R a+rwx "$DIST_DIR" "$BUILD_DIR" || true # Use 'true' to not fail if directories don't exist
 
-echo "Binary built successfully at $DIST_DIR/ptimeout"
+echo "Binary built successfully at $DIST_DIR/ptimeout ($CHOSEN_NAME)"
 
 # Deactivate and remove the temporary virtual environment
 echo "Cleaning up temporary virtual environment..."
-rm -rf "$BUILD_VENV_DIR"
\ No newline at end of file
+rm -rf "$BUILD_VENV_DIR"
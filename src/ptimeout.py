@@ -1,18 +1,14 @@
 #!/usr/bin/env python3
 
-import argparse
-import configparser
+# Only modules every code path needs are imported here. Everything else (click,
+# rich, argparse, configparser, subprocess, threading, ...) is imported where it
+# is used, so --version, --dry-run, non-interactive runs and `systemd generate`
+# only pay for what they actually touch.
+import codecs
+import math
 import os
-import queue
-import signal
-import subprocess
 import sys
-import threading
 import time
-from datetime import datetime
-from collections import deque
-import click
-import shutil
 
 # Exit code constants following GNU timeout conventions
 EXIT_SUCCESS = 0  # Command completed successfully within timeout
@@ -22,93 +18,116 @@ EXIT_COMMAND_NOT_INVOKABLE = 126  # Command found but cannot be invoked
 EXIT_COMMAND_NOT_FOUND = 127  # Command cannot be found
 EXIT_KILL_SIGNAL = 137  # Command killed by KILL signal (128+9)
 EXIT_INTERRUPTED = 130  # Interrupted by user (Ctrl+C, 128+2)
+EXIT_CIRCUIT_OPEN = 75  # Not run: the command keeps failing (EX_TEMPFAIL)
 
-# Import rich components conditionally
-if sys.stdout.isatty():
-    from rich.console import Console
-    from rich.layout import Layout
-    from rich.live import Live
-    from rich.panel import Panel
-    from rich.progress import (
-        Progress,
-        BarColumn,
-        TextColumn,
-        TimeElapsedColumn,
-        TimeRemainingColumn,
-    )
-    from rich.text import Text
-else:
-    # Dummy classes/functions for rich if not interactive
-    class Console:
-        def __init__(self, file=sys.stderr):
-            self._file = file
-
-        def print(self, *args, **kwargs):
-            text = " ".join(str(arg) for arg in args)
-            # Remove rich-specific markup for plain output
-            text = (
-                text.replace("[bold red]", "")
-                .replace("[green]", "")
-                .replace("[yellow]", "")
-                .replace("[/bold red]", "")
-                .replace("[/green]", "")
-                .replace("[/yellow]", "")
-            )
-            print(text, file=self._file, **kwargs)
+# rich is only needed for the full-screen interactive UI. It is imported on first
+# use by load_rich(); until then (and for good in non-interactive or minimal-style
+# runs) these plain stand-ins are used.
+RICH_MARKUP_TAG = r"\[/?(?:(?:bold|dim|red|green|yellow|blue|cyan) ?)+\]"
+markup_tag_pattern = None  # RICH_MARKUP_TAG, compiled on first plain print
 
-    class Layout:
-        def __init__(self):
-            pass
 
-        def split(self, *args, **kwargs):
-            pass
+class Console:
+    def __init__(self, file=sys.stderr):
+        self._file = file
 
-        def update(self, *args, **kwargs):
-            pass
+    def print(self, *args, **kwargs):
+        global markup_tag_pattern
+        if markup_tag_pattern is None:
+            import re
 
-        def __getitem__(self, key):
-            # Dummy method to support layout["key"] syntax
-            return self
+            markup_tag_pattern = re.compile(RICH_MARKUP_TAG)
 
-    class Live:
-        def __init__(self, *args, **kwargs):
-            pass
+        text = " ".join(str(arg) for arg in args)
+        # Remove rich-specific markup for plain output
+        text = markup_tag_pattern.sub("", text)
+        print(text, file=self._file, **kwargs)
 
-        def __enter__(self):
-            return self
 
-        def __exit__(self, exc_type, exc_val, exc_tb):
-            pass
+class Layout:
+    def __init__(self):
+        pass
 
-        def stop(self):
-            pass
+    def split(self, *args, **kwargs):
+        pass
 
-        def refresh(self):
-            pass
+    def update(self, *args, **kwargs):
+        pass
 
-    class Panel:
-        def __init__(self, *args, **kwargs):
-            pass
+    def __getitem__(self, key):
+        # Dummy method to support layout["key"] syntax
+        return self
 
-    class Progress:
-        def __init__(self, *args, **kwargs):
-            return self  # return self for add_task to work
 
-        def add_task(self, *args, **kwargs):
-            return 0
+class Live:
+    def __init__(self, *args, **kwargs):
+        pass
 
-        def update(self, *args, **kwargs):
-            pass
+    def __enter__(self):
+        return self
 
-    class Text:
-        def __init__(self, *args, **kwargs):
-            pass
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
 
-        def append(self, text, *args, **kwargs):
-            # In non-interactive mode, append to actual stdout/stderr if used directly.
-            # This is specifically for output_text.append(q_stdout.get()) and q_stderr.get()
-            # For non-interactive, this is handled by direct sys.stdout/err writes.
-            pass
+    def stop(self):
+        pass
+
+    def refresh(self):
+        pass
+
+
+class Panel:
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class Progress:
+    def __init__(self, *args, **kwargs):
+        return self  # return self for add_task to work
+
+    def add_task(self, *args, **kwargs):
+        return 0
+
+    def update(self, *args, **kwargs):
+        pass
+
+
+class Text:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def append(self, text, *args, **kwargs):
+        # In non-interactive mode, append to actual stdout/stderr if used directly.
+        # This is specifically for output_text.append(q_stdout.get()) and q_stderr.get()
+        # For non-interactive, this is handled by direct sys.stdout/err writes.
+        pass
+
+
+rich_loaded = False
+
+
+def load_rich():
+    """Replace the plain stand-ins with the real rich components."""
+    global Console, Group, Layout, Live, Panel, Progress, Text, rich_loaded
+    global BarColumn, TextColumn, TimeElapsedColumn, TimeRemainingColumn
+
+    if rich_loaded:
+        return
+
+    from rich.console import Console, Group
+    from rich.layout import Layout
+    from rich.live import Live
+    from rich.panel import Panel
+    from rich.progress import (
+        Progress,
+        BarColumn,
+        TextColumn,
+        TimeElapsedColumn,
+        TimeRemainingColumn,
+    )
+    from rich.text import Text
+
+    rich_loaded = True
 
 
 # Maximum lines to display in the rich output panel for live scrolling
@@ -117,9 +136,135 @@ MAX_DISPLAY_LINES = 20
 # Terminal height threshold for enabling interactive scrolling
 SCROLLING_THRESHOLD_LINES = 30
 
+# Maximum bytes taken from a child's stdout/stderr pipe per read
+READ_CHUNK_SIZE = 65536
+
+# Display style for each captured stream in the interactive output panel
+STREAM_STYLES = {"stdout": "none", "stderr": "red"}
+
+# Output throughput and child CPU/RSS sampling for the progress header (seconds)
+GAUGE_SAMPLE_INTERVAL = 1.0
+GAUGE_MAX_SAMPLE_INTERVAL = 8.0
+GAUGE_SLOW_SCAN_SECONDS = 0.02
+
+# Units for /proc/<pid>/stat CPU and memory fields
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# How often the supervision loop checks the child and the deadline (seconds)
+SUPERVISION_INTERVAL = 0.05
+
+# Frame rate bounds for the interactive render thread
+DEFAULT_MAX_FPS = 20
+MIN_FPS = 2
+
+# Lines arriving within one frame above which rendering backs off
+HEAVY_OUTPUT_LINES_PER_FRAME = 200
+
+PROGRESS_STYLES = ["unicode", "ascii", "minimal", "fancy"]
+
+# Delay before the first retry, and how much it grows with each further retry
+DEFAULT_BACKOFF = 1
+DEFAULT_BACKOFF_FACTOR = 1.0
+
+# Signal sent when the deadline passes, and the grace period before SIGKILL
+# follows when that signal is something other than KILL (seconds)
+DEFAULT_KILL_SIGNAL = "KILL"
+DEFAULT_KILL_AFTER = 5
+
+# TIMEOUT 'auto' on its own: p99 of the command's recent successful runs, times 1.5
+DEFAULT_AUTO_PERCENTILE = 99
+DEFAULT_AUTO_FACTOR = 1.5
+# --circuit-breaker: failures must fall within the window to count as in a row,
+# and an open circuit lets a probe through after the cooldown (seconds)
+DEFAULT_BREAKER_WINDOW = 600
+DEFAULT_BREAKER_COOLDOWN = 30
+
+# Environment variables that tell the command its deadline. A ptimeout started
+# inside the command reads DEADLINE_ENV and never runs past it.
+DEADLINE_ENV = "PTIMEOUT_DEADLINE"  # Unix time
+DEADLINE_MONOTONIC_ENV = "PTIMEOUT_DEADLINE_MONOTONIC"  # CLOCK_MONOTONIC
+REMAINING_ENV = "PTIMEOUT_REMAINING"  # Seconds left when the command started
+DEADLINE_FD_ENV = "PTIMEOUT_DEADLINE_FD"  # With --deadline-fd: EOF at the deadline
+# Side channel through which a ptimeout inside the command reports its timers
+# to our UI instead of drawing its own (see ptimeout_progress)
+PROGRESS_FD_ENV = "PTIMEOUT_PROGRESS_FD"
+PROGRESS_PARENT_ENV = "PTIMEOUT_PROGRESS_PARENT"  # Timer id of the spawning level
+# An inner ptimeout stops its command this much before the inherited deadline:
+# the command has its own process group, which the outer kill does not reach
+INHERITED_DEADLINE_MARGIN = 0.25
+
+# With --events-fd/--events-file, deadline_warning is sent once this much of an
+# attempt's timeout has passed
+DEADLINE_WARNING_FRACTION = 0.9
+# How often --progress-fd gets a progress record (seconds)
+DEFAULT_PROGRESS_INTERVAL = 1
+# How far SIGUSR1/SIGUSR2 move the deadline of the running attempt (seconds)
+DEFAULT_ADJUST_STEP = 300
+# Heartbeat fd announced to the command with --heartbeat (see ptimeout_heartbeat)
+HEARTBEAT_FD_ENV = "PTIMEOUT_HEARTBEAT_FD"
+# sd_notify(3) socket; with --heartbeat, the command's points at us
+NOTIFY_SOCKET_ENV = "NOTIFY_SOCKET"
+
+# Values of every ptimeout option when it is not given on the command line
+CLI_DEFAULTS = {
+    "config": None,
+    "verbose": False,
+    "retries": 0,
+    "count_direction": "up",
+    "progress_style": "unicode",
+    "max_fps": DEFAULT_MAX_FPS,
+    "timeout_option": None,
+    "backoff": None,
+    "backoff_factor": None,
+    "kill_signal": None,
+    "kill_after": None,
+    "dry_run": False,
+    "background": False,
+    "stdout": None,
+    "stderr": None,
+    "cache": None,
+    "cache_env": (),
+    "singleflight": False,
+    "lock": None,
+    "max_concurrent": None,
+    "count_wait": False,
+    "rate": None,
+    "circuit_breaker": None,
+    "breaker_window": None,
+    "breaker_cooldown": None,
+    "deadline_fd": False,
+    "events_fd": None,
+    "events_file": None,
+    "progress_fd": None,
+    "progress_interval": None,
+    "control_socket": None,
+    "adjust_step": None,
+    "heartbeat": None,
+    "heartbeat_pattern": None,
+    "sd_notify": False,
+    "ready_pattern": None,
+}
+
 # Default configuration file path following XDG Base Directory Specification
 DEFAULT_CONFIG_FILE = os.path.expanduser("~/.config/ptimeout/config.ini")
 
+# Parsed configuration files are cached here, keyed by path, mtime and size
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "ptimeout"
+)
+CONFIG_CACHE_FILE = "config.cache"
+CONFIG_CACHE_VERSION = 1
+
+# Suffixes accepted by parse_size
+SIZE_UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3}
+
+# Units accepted by parse_rate, in seconds
+RATE_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+# Config keys accepted under other names, for compatibility
+CONFIG_KEY_ALIASES = {"countdown_direction": "count_direction", "signal": "kill_signal"}
+
 # Global variable to store current subprocess for signal handling
 current_subprocess = None
 
@@ -130,6 +275,8 @@ def signal_handler(signum, frame):
 
     This function will terminate the current subprocess and exit with appropriate exit code.
     """
+    import signal
+
     global current_subprocess
 
     # Print message about received signal
@@ -160,71 +307,363 @@ def register_signal_handlers():
     """
     Register signal handlers for SIGTERM and SIGINT.
     """
+    import signal
+
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
 
 
+def parse_config_value(key, value):
+    """
+    Convert one config value to the type of the matching CLI option.
+
+    Returns:
+        The converted value, or None if the key is unknown or the value invalid
+    """
+    value = value.strip()
+    lowered = value.lower()
+    try:
+        if key in (
+            "verbose",
+            "dry_run",
+            "background",
+            "history",
+            "singleflight",
+            "count_wait",
+            "deadline_fd",
+            "sd_notify",
+        ):
+            return lowered in ["true", "1", "yes", "on"]
+        if key == "timeout":
+            if value.startswith("auto"):
+                parse_auto_timeout(value)
+            else:
+                parse_timeout(value)
+            return value
+        if key == "retries":
+            retries = int(value)
+            return retries if retries >= 0 else None
+        if key == "count_direction":
+            return lowered if lowered in ["up", "down"] else None
+        if key == "progress_style":
+            return lowered if lowered in PROGRESS_STYLES else None
+        if key == "max_fps":
+            max_fps = int(value)
+            return max_fps if MIN_FPS <= max_fps <= 120 else None
+        if key in (
+            "backoff",
+            "kill_after",
+            "auto_fallback",
+            "cache",
+            "breaker_window",
+            "breaker_cooldown",
+            "progress_interval",
+            "adjust_step",
+            "heartbeat",
+        ):
+            return parse_timeout(value)
+        if key == "cache_env":
+            return tuple(value.replace(",", " ").split())
+        if key == "cache_max_size":
+            return parse_size(value)
+        if key == "lock":
+            from ptimeout_sync import validate_name
+
+            return validate_name(value)
+        if key == "rate":
+            parse_rate(value)
+            return value
+        if key in ("heartbeat_pattern", "ready_pattern"):
+            compile_output_pattern(value, "--" + key.replace("_", "-"))
+            return value
+        if key == "progress_fd":
+            fd = int(value)
+            return fd if fd >= 0 else None
+        if key in ("max_concurrent", "circuit_breaker"):
+            count = int(value)
+            return count if count >= 1 else None
+        if key == "backoff_factor":
+            factor = float(value)
+            return factor if factor >= 1 else None
+        if key == "kill_signal":
+            parse_signal(value)
+            return value.upper()
+        if key in ("stdout", "stderr", "events_file", "control_socket"):
+            return os.path.expanduser(value)
+    except ValueError:
+        pass
+    return None
+
+
+def parse_config_section(section):
+    """Typed settings from one INI section, skipping unknown keys and invalid values."""
+    settings = {}
+    for key, value in section.items():
+        key = key.replace("-", "_")
+        key = CONFIG_KEY_ALIASES.get(key, key)
+        parsed = parse_config_value(key, value)
+        if parsed is not None:
+            settings[key] = parsed
+    return settings
+
+
+def parse_config_file(config_path):
+    """
+    Parse an INI config file into plain data that can be cached with marshal.
+
+    Returns:
+        dict: [defaults] settings at the top level, plus a "profiles" list of
+              (name, settings, glob regexes, regexes, literal first words)
+              when [profile:NAME] sections exist
+    """
+    import configparser
+
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read(config_path)
+
+    config = {}
+    if "defaults" in parser:
+        config.update(parse_config_section(parser["defaults"]))
+
+    profiles = []
+    for section_name in parser.sections():
+        if not section_name.startswith("profile:"):
+            continue
+        section = dict(parser[section_name])
+        globs = section.pop("match", "").split("\n")
+        regexes = [r for r in section.pop("regex", "").split("\n") if r.strip()]
+        globs = [g.strip() for g in globs if g.strip()]
+        if not globs and not regexes:
+            continue  # A profile without patterns could never apply
+        profiles.append(
+            (
+                section_name[len("profile:") :].strip(),
+                parse_config_section(section),
+                [fnmatch_translate(g) for g in globs],
+                [r.strip() for r in regexes],
+                # Index keys: a glob's first word, when it has no wildcards
+                [
+                    g.split()[0]
+                    for g in globs
+                    if not any(c in g.split()[0] for c in "*?[")
+                ],
+            )
+        )
+    if profiles:
+        config["profiles"] = profiles
+    return config
+
+
+def fnmatch_translate(pattern):
+    """fnmatch.translate, imported on first use."""
+    import fnmatch
+
+    return fnmatch.translate(pattern)
+
+
+class ProfileIndex:
+    """
+    [profile:NAME] sections with their command patterns compiled once.
+
+    Globs whose first word is literal are indexed by that word, so a command
+    is only tested against profiles that could match it plus those whose
+    patterns start with a wildcard or are regexes. The first matching
+    profile in file order wins.
+    """
+
+    def __init__(self, profiles):
+        import re
+
+        self.by_first_word = {}
+        self.unindexed = []
+        for order, (name, settings, globs, regexes, first_words) in enumerate(profiles):
+            compiled_regexes = []
+            for regex in regexes:
+                try:
+                    compiled_regexes.append(re.compile(regex))
+                except re.error:
+                    pass  # Skipped like any other invalid config value
+            profile = (
+                order,
+                name,
+                settings,
+                [re.compile(g) for g in globs],
+                compiled_regexes,
+            )
+            if regexes or len(first_words) != len(globs):
+                self.unindexed.append(profile)
+            else:
+                for word in set(first_words):
+                    self.by_first_word.setdefault(word, []).append(profile)
+
+    def match(self, command_args):
+        """
+        Find the profile for a command.
+
+        Patterns are tried against the command line as given and with the
+        program reduced to its base name, so `rsync *` also matches
+        `/usr/bin/rsync -a src dst`.
+
+        Returns:
+            tuple: (name, settings) of the first matching profile, or None
+        """
+        if not command_args:
+            return None
+        program = os.path.basename(command_args[0])
+        subjects = [" ".join(command_args)]
+        if program != command_args[0]:
+            subjects.append(" ".join([program] + list(command_args[1:])))
+
+        candidates = {profile[0]: profile for profile in self.unindexed}
+        for word in {command_args[0], program}:
+            for profile in self.by_first_word.get(word, ()):
+                candidates[profile[0]] = profile
+        # Globs must match the whole command line; regexes may match anywhere
+        for order in sorted(candidates):
+            _, name, settings, globs, regexes = candidates[order]
+            for subject in subjects:
+                if any(g.match(subject) for g in globs) or any(
+                    r.search(subject) for r in regexes
+                ):
+                    return name, settings
+        return None
+
+
+# Parsed configs already loaded by this process, keyed by path
+_config_cache = {}
+
+
+def config_cache_path():
+    cache_dir = os.environ.get("PTIMEOUT_CACHE_DIR", DEFAULT_CACHE_DIR)
+    return os.path.join(cache_dir, CONFIG_CACHE_FILE)
+
+
+def read_config_cache(config_path, stamp):
+    """The cached parse of config_path if it was made from the same file version."""
+    import marshal
+
+    try:
+        with open(config_cache_path(), "rb") as f:
+            cache = marshal.load(f)
+        entry = cache["entries"][config_path]
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        return None
+    if cache.get("version") != CONFIG_CACHE_VERSION or entry[0] != stamp:
+        return None
+    return entry[1]
+
+
+def write_config_cache(config_path, stamp, config):
+    """Store a parse in the cache file; failures only cost a reparse next time."""
+    import marshal
+
+    path = config_cache_path()
+    try:
+        with open(path, "rb") as f:
+            cache = marshal.load(f)
+        if cache.get("version") != CONFIG_CACHE_VERSION:
+            raise ValueError
+    except (OSError, EOFError, ValueError, TypeError, AttributeError):
+        cache = {"version": CONFIG_CACHE_VERSION, "entries": {}}
+    # Drop entries for config files that no longer exist
+    cache["entries"] = {p: e for p, e in cache["entries"].items() if os.path.exists(p)}
+    cache["entries"][config_path] = (stamp, config)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            marshal.dump(cache, f)
+        os.replace(tmp_path, path)
+    except (OSError, ValueError):
+        pass
+
+
 def load_config(config_path=None):
     """
     Load configuration from an INI file.
 
+    The parsed result is cached in memory and on disk, keyed by the file's
+    mtime and size, so an unchanged config is not parsed again.
+
     Args:
         config_path: Path to the configuration file. If None, uses PTIMEOUT_CONFIG env var or DEFAULT_CONFIG_FILE.
 
     Returns:
         dict: Dictionary containing configuration settings. Empty dict if file not found or invalid.
+              [profile:NAME] sections are available as a ProfileIndex under "profiles".
     """
     if config_path is None:
         config_path = os.environ.get("PTIMEOUT_CONFIG", DEFAULT_CONFIG_FILE)
 
-    config = {}
-
     # Check if config file exists
-    if not os.path.exists(config_path):
-        return config
-
     try:
-        parser = configparser.ConfigParser()
-        parser.read(config_path)
+        info = os.stat(config_path)
+    except OSError:
+        return {}
+    config_path = os.path.abspath(config_path)
+    stamp = (info.st_mtime_ns, info.st_size)
 
-        # Look for [defaults] section
-        if "defaults" in parser:
-            defaults_section = parser["defaults"]
+    cached = _config_cache.get(config_path)
+    if cached and cached[0] == stamp:
+        return cached[1]
 
-            # Parse timeout if present
-            if "timeout" in defaults_section:
-                config["timeout"] = defaults_section["timeout"]
+    config = read_config_cache(config_path, stamp)
+    if config is None:
+        import configparser
 
-            # Parse retries if present
-            if "retries" in defaults_section:
-                try:
-                    config["retries"] = int(defaults_section["retries"])
-                except ValueError:
-                    # Invalid retries value, skip it
-                    pass
+        try:
+            config = parse_config_file(config_path)
+        except (configparser.Error, IOError, UnicodeDecodeError):
+            # If config file is malformed or unreadable, return empty config
+            config = {}
+        write_config_cache(config_path, stamp, config)
+
+    config = dict(config)
+    if config.get("profiles"):
+        config["profiles"] = ProfileIndex(config["profiles"])
+    _config_cache[config_path] = (stamp, config)
+    return config
 
-            # Parse countdown_direction if present
-            if "countdown_direction" in defaults_section:
-                direction = defaults_section["countdown_direction"].lower()
-                if direction in ["up", "down"]:
-                    config["countdown_direction"] = direction
 
-            # Parse verbose if present
-            if "verbose" in defaults_section:
-                verbose_str = defaults_section["verbose"].lower()
-                config["verbose"] = verbose_str in ["true", "1", "yes", "on"]
+def resolve_settings(config, command_args):
+    """
+    Settings for a command: [defaults] overlaid with its matching profile.
 
-    except (configparser.Error, IOError):
-        # If config file is malformed or unreadable, return empty config
-        pass
+    Returns:
+        tuple: (settings dict, name of the matching profile or None)
+    """
+    settings = {key: value for key, value in config.items() if key != "profiles"}
+    profiles = config.get("profiles")
+    match = profiles.match(command_args) if profiles else None
+    if match is None:
+        return settings, None
+    name, profile_settings = match
+    settings.update(profile_settings)
+    return settings, name
 
-    return config
 
+def read_stream(stream, q, counters=None, raw=False):
+    """
+    Reads a stream in chunks and puts the decoded text into a queue.
 
-def read_stream(stream, q):
-    """Reads lines from a stream and puts them into a queue."""
-    for line in iter(stream.readline, b""):
-        q.put(line.decode("utf-8", errors="replace"))
+    Reading whatever is available (rather than whole lines) means output that is
+    rewritten in place with carriage returns never piles up waiting for a newline.
+    If counters (a StreamCounters) is given, raw bytes read are added to it.
+    With raw, each item is a (text, bytes) pair instead: the text decoded so
+    far and the bytes exactly as read, for whatever must not be re-encoded.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in iter(lambda: stream.read1(READ_CHUNK_SIZE), b""):
+        if counters is not None:
+            counters.bytes += len(chunk)
+        text = decoder.decode(chunk)
+        if raw:
+            q.put((text, chunk))
+        elif text:
+            q.put(text)
+    text = decoder.decode(b"", final=True)
+    if text:
+        q.put((text, b"") if raw else text)
     stream.close()
 
 
@@ -239,6 +678,201 @@ def write_stream(input_data, proc_stdin):
         proc_stdin.close()  # Important: close stdin to signal EOF to the child process
 
 
+class StreamCounters:
+    """Running byte and line totals for one child output stream."""
+
+    __slots__ = ("bytes", "lines")
+
+    def __init__(self):
+        self.bytes = 0  # Updated by the read_stream thread
+        self.lines = 0  # Updated by the supervision loop as output is drained
+
+
+def read_process_group_usage(pgid):
+    """
+    Sum CPU time and resident memory over every process in a process group.
+
+    Args:
+        pgid: Process group ID (the child runs in its own session, so this covers
+              everything it spawned)
+
+    Returns:
+        tuple: (cpu_seconds, rss_bytes), or None if /proc is not available
+    """
+    try:
+        pids = os.listdir("/proc")
+    except OSError:
+        return None
+
+    cpu_ticks = 0
+    rss_pages = 0
+    for pid in pids:
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue  # Exited while we were scanning
+        # The command name may contain spaces and parentheses; fields start after the last ')'
+        fields = stat[stat.rindex(b")") + 2 :].split()
+        if int(fields[2]) != pgid:
+            continue
+        cpu_ticks += int(fields[11]) + int(fields[12])  # utime + stime
+        rss_pages += int(fields[21])
+
+    return cpu_ticks / CLOCK_TICKS, rss_pages * PAGE_SIZE
+
+
+def format_bytes(count):
+    """Format a byte count compactly, e.g. 1.5 MB."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024 or unit == "GB":
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+
+
+class ResourceGauges:
+    """
+    Live output throughput and child resource usage for the progress header.
+
+    Rates come from the StreamCounters the I/O path already maintains; CPU and
+    RSS come from /proc for the child's whole process group. Sampling is cheap
+    to call often: it only does work once the sample interval has passed, and
+    the interval backs off when scanning /proc itself becomes slow.
+    """
+
+    def __init__(self, counters, pgid=None, interval=GAUGE_SAMPLE_INTERVAL):
+        self.counters = counters  # stream name -> StreamCounters
+        self.pgid = pgid
+        self.base_interval = interval
+        self.interval = interval
+        self.rates = {name: (0.0, 0.0) for name in counters}  # (bytes/s, lines/s)
+        self.cpu_percent = None
+        self.rss_bytes = None
+        self.peak_rss_bytes = None  # Largest rss_bytes sampled
+        self._last_time = None
+        self._last_totals = None
+        self._last_cpu = None
+
+    def sample(self, now=None):
+        """Take a sample if one is due. Returns True if the gauges changed."""
+        now = time.monotonic() if now is None else now
+        if self._last_time is not None and now - self._last_time < self.interval:
+            return False
+
+        totals = {
+            name: (counter.bytes, counter.lines)
+            for name, counter in self.counters.items()
+        }
+        scan_start = time.monotonic()
+        usage = read_process_group_usage(self.pgid) if self.pgid else None
+        scan_time = time.monotonic() - scan_start
+
+        if self._last_time is not None:
+            span = now - self._last_time
+            for name, (total_bytes, total_lines) in totals.items():
+                last_bytes, last_lines = self._last_totals[name]
+                self.rates[name] = (
+                    (total_bytes - last_bytes) / span,
+                    (total_lines - last_lines) / span,
+                )
+            if usage and self._last_cpu is not None:
+                self.cpu_percent = max(usage[0] - self._last_cpu, 0) / span * 100
+        if usage:
+            self._last_cpu = usage[0]
+            self.rss_bytes = usage[1]
+            self.peak_rss_bytes = max(self.peak_rss_bytes or 0, usage[1])
+
+        # A slow /proc scan (many processes on the host) means sample less often
+        if scan_time > GAUGE_SLOW_SCAN_SECONDS:
+            self.interval = min(self.interval * 2, GAUGE_MAX_SAMPLE_INTERVAL)
+        else:
+            self.interval = max(self.interval / 2, self.base_interval)
+
+        self._last_time = now
+        self._last_totals = totals
+        return True
+
+    def describe(self):
+        """Render the gauges as a compact one-line summary."""
+        parts = []
+        for name, (byte_rate, line_rate) in self.rates.items():
+            label = "out" if name == "stdout" else "err"
+            parts.append(f"{label} {format_bytes(byte_rate)}/s {line_rate:.0f} l/s")
+        if self.cpu_percent is not None:
+            parts.append(f"cpu {self.cpu_percent:.0f}%")
+        if self.rss_bytes is not None:
+            parts.append(f"rss {format_bytes(self.rss_bytes)}")
+        return " · ".join(parts)
+
+
+def wait_for_exit(proc, timeout, wakeup_fds=()):
+    """
+    Block until proc exits or timeout seconds pass, or any of wakeup_fds
+    becomes readable.
+
+    Uses a pidfd where the platform has one, so the exit is seen immediately
+    instead of at the next poll. Returns True if the process has exited.
+    """
+    import subprocess
+
+    if proc.poll() is not None:
+        return True
+    timeout = max(timeout, 0)
+
+    pidfd_open = getattr(os, "pidfd_open", None)
+    if pidfd_open is not None:
+        try:
+            pidfd = pidfd_open(proc.pid)
+        except OSError:
+            pidfd = None
+        if pidfd is not None:
+            import select
+
+            try:
+                select.select([pidfd, *wakeup_fds], [], [], timeout)
+            finally:
+                os.close(pidfd)
+            return proc.poll() is not None
+
+    if wakeup_fds:
+        timeout = min(timeout, 1.0)  # Cannot wait on them too; look again soon
+    try:
+        proc.wait(timeout=timeout)
+        return True
+    except subprocess.TimeoutExpired:
+        return False
+
+
+def terminate_process_group(
+    proc, kill_signal=DEFAULT_KILL_SIGNAL, kill_after=None, events=None
+):
+    """
+    Stop proc's process group at the deadline.
+
+    Sends kill_signal, then SIGKILL to whatever is left of the group once the
+    process has exited or kill_after seconds have passed. With the default
+    KILL there is nothing to wait for. Each signal sent is an event on events.
+    """
+    pgid = os.getpgid(proc.pid)
+    signal_number = (
+        9 if kill_signal == DEFAULT_KILL_SIGNAL else parse_signal(kill_signal)
+    )
+    os.killpg(pgid, signal_number)
+    if events:
+        events.emit("signal_sent", signal=signal_number, pgid=pgid)
+    if signal_number == 9:
+        return
+    wait_for_exit(proc, DEFAULT_KILL_AFTER if kill_after is None else kill_after)
+    try:
+        os.killpg(pgid, 9)
+    except ProcessLookupError:
+        return  # The whole group exited on the first signal
+    if events:
+        events.emit("signal_sent", signal=9, pgid=pgid)
+
+
 def get_terminal_height():
     """
     Get the current terminal height in lines.
@@ -246,6 +880,8 @@ def get_terminal_height():
     Returns:
         int: Terminal height in lines, or default if cannot determine
     """
+    import shutil
+
     try:
         # Use shutil.get_terminal_size for cross-platform terminal size detection
         terminal_size = shutil.get_terminal_size()
@@ -269,6 +905,214 @@ def should_enable_scrolling(output_lines_count):
     return output_lines_count > min(terminal_height - 5, SCROLLING_THRESHOLD_LINES)
 
 
+class CaptureBuffer:
+    """
+    Captured child output for the interactive panel, one entry per physical line.
+
+    Carriage returns rewind to the start of the current line and subsequent text
+    overwrites it, as on a terminal. Progress output from tools like curl or pip
+    therefore keeps only the final state of each line instead of accumulating
+    every intermediate rewrite.
+
+    Lines are stored raw, ANSI escape codes included. They are only parsed into
+    styled Text when they are actually drawn, and the result is cached per line.
+    """
+
+    def __init__(self):
+        self.lines = []  # [text, stream, (parsed text, styled Text) or None]
+        # stream -> [line index, cursor column] of its unterminated line
+        self._open = {}
+
+    def __len__(self):
+        return len(self.lines)
+
+    def feed(self, text, stream="stdout"):
+        """Apply a chunk of decoded output from stream. Returns the number of completed lines."""
+        state = self._open.pop(stream, None)
+        segments = text.split("\n")
+        for i, segment in enumerate(segments):
+            last_segment = i == len(segments) - 1
+            if state is None:
+                if last_segment and not segment:
+                    break
+                self.lines.append(["", stream, None])
+                state = [len(self.lines) - 1, 0]
+            self._write(state, segment)
+            if not last_segment:
+                state = None
+        if state is not None:
+            self._open[stream] = state
+        return len(segments) - 1
+
+    def _write(self, state, segment):
+        index, cursor = state
+        line = self.lines[index][0]
+        for j, part in enumerate(segment.split("\r")):
+            if j > 0:
+                cursor = 0
+            if part:
+                line = line[:cursor] + part + line[cursor + len(part) :]
+                cursor += len(part)
+        self.lines[index][0] = line
+        state[1] = cursor
+
+    def tail(self, count):
+        """Return the last count lines."""
+        return self.lines[-count:]
+
+    @staticmethod
+    def styled(entry, text):
+        """
+        Return entry's line parsed for ANSI styling, reusing the cached parse.
+
+        text is the line as it was when the caller took its snapshot; the cache
+        is keyed on it so a line rewritten since then is simply parsed again.
+        """
+        cached = entry[2]
+        if cached is None or cached[0] is not text:
+            cached = (text, Text.from_ansi(text, style=STREAM_STYLES[entry[1]]))
+            entry[2] = cached
+        return cached[1]
+
+
+class MinimalRenderer:
+    """
+    Single status line for --progress-style minimal, drawn without rich.
+
+    The line is written to stderr with raw ANSI escape codes and only rewritten
+    when the integer percentage or the displayed second changes. Child output
+    passes straight through: the status line is erased before it is written and
+    redrawn once the output is back at the start of a line.
+    """
+
+    def __init__(self, description, timeout, count_direction="up", stream=None):
+        self.description = description
+        self.timeout = timeout
+        self.count_direction = count_direction
+        self.stream = stream or sys.stderr
+        self.enabled = self.stream.isatty()
+        self._last_key = None
+        self._visible = False
+        self._at_line_start = True
+
+    def update(self, elapsed):
+        """Redraw the status line if what it shows has changed. Returns True if drawn."""
+        if not self.enabled or not self._at_line_start:
+            return False
+
+        elapsed = min(max(elapsed, 0), self.timeout)
+        percent = int(elapsed * 100 / self.timeout) if self.timeout > 0 else 100
+        if self.count_direction == "down":
+            seconds = math.ceil(self.timeout - elapsed)
+        else:
+            seconds = int(elapsed)
+        key = (percent, seconds)
+        if self._visible and key == self._last_key:
+            return False
+
+        minutes, secs = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        self.stream.write(
+            f"\r\x1b[2K\x1b[1;34m{self.description}\x1b[0m "
+            f"\x1b[32m{percent:>3d}%\x1b[0m {hours}:{minutes:02d}:{secs:02d}"
+        )
+        self.stream.flush()
+        self._last_key = key
+        self._visible = True
+        return True
+
+    def clear(self):
+        """Erase the status line if it is currently shown."""
+        if self._visible:
+            self.stream.write("\r\x1b[2K")
+            self.stream.flush()
+            self._visible = False
+
+    def write_output(self, data, stream):
+        """Write child output to stream, keeping the status line out of its way."""
+        self.clear()
+        stream.write(data)
+        stream.flush()
+        self._at_line_start = data.endswith("\n")
+
+
+class RenderScheduler:
+    """
+    Render the interactive UI from a dedicated thread at a bounded frame rate.
+
+    The supervision loop only marks the UI as dirty; frames are drawn here, so a
+    slow terminal never delays deadline enforcement. Frames are skipped when
+    nothing changed, output arriving between frames is coalesced into the next
+    frame, and the frame rate backs off when output is heavy or rendering is slow.
+    """
+
+    def __init__(self, render, max_fps=DEFAULT_MAX_FPS):
+        import threading
+
+        self._render = render
+        self.max_fps = max(MIN_FPS, max_fps)
+        self.frame_interval = 1.0 / self.max_fps
+        self.frames_rendered = 0
+        self.frames_skipped = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._pending_lines = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def mark_dirty(self, new_lines=0):
+        """Request a frame, recording how many output lines arrived since the last one."""
+        with self._lock:
+            self._dirty = True
+            self._pending_lines += new_lines
+
+    def start(self):
+        import threading
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the render thread; the caller draws the final frame itself."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.frame_interval):
+            with self._lock:
+                dirty = self._dirty
+                new_lines = self._pending_lines
+                self._dirty = False
+                self._pending_lines = 0
+
+            if not dirty:
+                self.frames_skipped += 1
+                continue
+
+            frame_start = time.monotonic()
+            try:
+                self._render()
+            except Exception:
+                # A failed frame must never take down supervision
+                pass
+            self.frames_rendered += 1
+            self._adapt(time.monotonic() - frame_start, new_lines)
+
+    def _adapt(self, render_time, new_lines):
+        """Halve the frame rate under pressure, recover gradually once it eases."""
+        fastest = 1.0 / self.max_fps
+        slowest = 1.0 / MIN_FPS
+        if (
+            render_time > self.frame_interval / 2
+            or new_lines > HEAVY_OUTPUT_LINES_PER_FRAME
+        ):
+            self.frame_interval = min(self.frame_interval * 2, slowest)
+        else:
+            self.frame_interval = max(self.frame_interval * 0.75, fastest)
+
+
 def extract_nested_ptimeout(command_args):
     """
     Extract nested ptimeout command and its arguments from command list.
@@ -303,6 +1147,158 @@ def extract_nested_ptimeout(command_args):
         return False, None, None
 
 
+# Options of a nested level that are honoured in-process; the rest belong to
+# the whole run and may only be given to the outermost ptimeout
+NESTED_LEVEL_OPTIONS = (
+    "timeout_arg",
+    "timeout_option",
+    "command",
+    "verbose",
+    "retries",
+    "backoff",
+    "backoff_factor",
+    "kill_signal",
+    "kill_after",
+    "stdout",
+    "stderr",
+)
+
+
+# Outcomes of a nested level that retrying it cannot change
+NESTED_FINAL_EXIT_CODES = (
+    EXIT_SUCCESS,
+    EXIT_PTIMEOUT_ERROR,
+    EXIT_COMMAND_NOT_INVOKABLE,
+    EXIT_COMMAND_NOT_FOUND,
+    EXIT_INTERRUPTED,
+)
+
+
+def parse_nested_level(level_args):
+    """
+    Parse the options of a nested ptimeout level, e.g. ['-r', '2', '5s'].
+
+    Args:
+        level_args: The level's arguments between 'ptimeout' and its '--'
+
+    Returns:
+        dict: timeout and retries, plus verbose, backoff, backoff_factor,
+              kill_signal, kill_after, stdout and stderr, None where not given
+
+    Raises:
+        ValueError: If the arguments are invalid or use an option that only
+                    the outermost ptimeout supports
+    """
+    import click
+
+    try:
+        ctx = build_cli().make_context("ptimeout", list(level_args))
+    except click.MissingParameter:
+        raise ValueError(
+            "Nested ptimeout: each level needs its own TIMEOUT; it is not read from the config."
+        )
+    except click.ClickException as e:
+        raise ValueError(f"Nested ptimeout: {e.format_message()}")
+    params = ctx.params
+    given = given_options(ctx)
+    outer_only = [
+        key for key in params if key in given and key not in NESTED_LEVEL_OPTIONS
+    ]
+    if outer_only:
+        option = "--" + outer_only[0].replace("_", "-")
+        raise ValueError(
+            f"Nested ptimeout: {option} can only be given to the outermost ptimeout."
+        )
+    if params["timeout_arg"] is not None and params["timeout_option"] is not None:
+        raise ValueError(
+            "Nested ptimeout: give the timeout either as TIMEOUT or with --timeout, not both."
+        )
+    validate_retries(params["retries"])
+    timeout_arg = params["timeout_option"] or params["timeout_arg"]
+    level = {
+        "timeout": parse_timeout(timeout_arg),
+        "retries": params["retries"],
+        "verbose": params["verbose"],
+        "backoff_factor": params["backoff_factor"],
+        "kill_signal": params["kill_signal"],
+        "stdout": params["stdout"],
+        "stderr": params["stderr"],
+    }
+    if level["kill_signal"]:
+        parse_signal(level["kill_signal"])
+    for key in ("backoff", "kill_after"):
+        level[key] = parse_timeout(params[key]) if params[key] else None
+    return level
+
+
+def command_environment(
+    timeout, deadline_reader=None, progress_channel=None, heartbeat=None
+):
+    """
+    Build the command's environment: ours, plus its deadline timeout seconds from now.
+
+    deadline_reader is the fd to announce in DEADLINE_FD_ENV, and
+    progress_channel the (fd, parent timer id) of the progress side channel,
+    if any. With heartbeat, the command is told where to send its heartbeats.
+    Fds inherited from an enclosing ptimeout are not passed on.
+    """
+    env = dict(os.environ)
+    for name in (
+        DEADLINE_FD_ENV,
+        PROGRESS_FD_ENV,
+        PROGRESS_PARENT_ENV,
+        HEARTBEAT_FD_ENV,
+    ):
+        env.pop(name, None)
+    env[DEADLINE_ENV] = f"{time.time() + timeout:.3f}"
+    env[DEADLINE_MONOTONIC_ENV] = f"{time.monotonic() + timeout:.3f}"
+    env[REMAINING_ENV] = f"{timeout:.3f}"
+    if deadline_reader is not None:
+        env[DEADLINE_FD_ENV] = str(deadline_reader)
+    if progress_channel:
+        env[PROGRESS_FD_ENV] = str(progress_channel[0])
+        env[PROGRESS_PARENT_ENV] = progress_channel[1]
+    if heartbeat:
+        env[HEARTBEAT_FD_ENV] = str(heartbeat.writer)
+        env[NOTIFY_SOCKET_ENV] = heartbeat.socket_path
+    return env
+
+
+def compile_output_pattern(pattern, option):
+    """Compile the regex given to option, raising ValueError if it is not valid."""
+    import re
+
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        raise ValueError(f"Invalid {option} '{pattern}': {e}")
+
+
+def progress_reporter():
+    """The progress side channel of the ptimeout our command runs under, if any."""
+    if PROGRESS_FD_ENV not in os.environ:
+        return None
+    import stat
+
+    try:
+        fd = int(os.environ[PROGRESS_FD_ENV])
+        if not stat.S_ISFIFO(os.fstat(fd).st_mode):
+            return None
+    except (ValueError, OSError):
+        return None
+    from ptimeout_progress import ProgressReporter
+
+    return ProgressReporter(fd, os.environ.get(PROGRESS_PARENT_ENV))
+
+
+def inherited_deadline():
+    """The deadline (Unix time) to keep to inside an enclosing ptimeout, or None."""
+    try:
+        return float(os.environ[DEADLINE_ENV]) - INHERITED_DEADLINE_MARGIN
+    except (KeyError, ValueError):
+        return None
+
+
 def run_command(
     command_args,
     timeout,
@@ -315,20 +1311,146 @@ def run_command(
     stdout_file=None,
     stderr_file=None,
     progress_style="unicode",
+    max_fps=DEFAULT_MAX_FPS,
+    backoff=DEFAULT_BACKOFF,
+    backoff_factor=DEFAULT_BACKOFF_FACTOR,
+    kill_signal=DEFAULT_KILL_SIGNAL,
+    kill_after=DEFAULT_KILL_AFTER,
+    summary=None,
+    cache_ttl=None,
+    cache_env=(),
+    cache_max_size=None,
+    singleflight=False,
+    lock_name=None,
+    max_concurrent=1,
+    count_wait=False,
+    rate_limit=None,
+    circuit_breaker=None,
+    deadline=None,
+    deadline_fd=False,
+    progress_sink=None,
+    events=None,
+    progress_stream=None,
+    progress_interval=DEFAULT_PROGRESS_INTERVAL,
+    control=None,
+    heartbeat=None,
+    notifier=None,
 ):
-    """Runs the command, managing retries and UI updates."""
+    """
+    Runs the command, managing retries and UI updates.
+
+    Retry n waits backoff * backoff_factor ** (n - 1) seconds. At the deadline
+    the process group gets kill_signal, then SIGKILL kill_after seconds later
+    if it is still running.
+
+    If summary is a dict, it receives started_at, duration and timed_out of
+    the last attempt, the number of attempts, the exit code and peak_rss, the
+    largest resident memory sampled for the command's process group (bytes,
+    or None if it ran too briefly to be sampled).
+
+    With cache_ttl (seconds), a successful run's output is stored, keyed by
+    the arguments, working directory, stdin and the cache_env variables, and
+    replayed without running anything while it is younger than cache_ttl.
+
+    With singleflight, an identical run (same key) already in progress on this
+    host is joined instead: its output is relayed as it is produced and its
+    exit code returned, unless our own timeout expires first.
+
+    With lock_name, the command waits (in arrival order) until fewer than
+    max_concurrent invocations with that lock name are running on this host.
+    The wait counts against the timeout only if count_wait is set.
+
+    rate_limit is (bucket name, launches per second, burst) as returned by
+    parse_rate; the command starts once the host-wide bucket has a token.
+
+    circuit_breaker is (failures, window, cooldown): once the command has
+    failed that many times in a row within window seconds (on any ptimeout on
+    this host), it is not run and EXIT_CIRCUIT_OPEN is returned, until a single
+    probe run after cooldown seconds succeeds.
+
+    deadline (Unix time) is the deadline of the enclosing nested levels, if
+    any: no attempt runs past it, so the effective timeout is the smallest of
+    all levels'. A nested ptimeout in command_args is run as the next level in
+    this process, with its own timeout and retries.
+
+    The command finds its own deadline in DEADLINE_ENV, DEADLINE_MONOTONIC_ENV
+    and REMAINING_ENV. With deadline_fd, it also inherits the read end of a
+    pipe, numbered in DEADLINE_FD_ENV, that reaches EOF when the deadline passes.
+
+    progress_sink receives the timers of this level (see ptimeout_progress);
+    it is passed down to in-process nested levels. At the top it is the side
+    channel of an outer ptimeout, if any, in which case nothing is drawn here,
+    or else, with the full UI, the tree of timers shown in the header.
+
+    events, an EventStream (see ptimeout_events), receives the run's events
+    as they happen. progress_stream, another one, receives a progress record
+    every progress_interval seconds while the command runs.
+
+    control, a DeadlineControl (see ptimeout_control), moves the running
+    attempt's deadline on SIGUSR1/SIGUSR2 or a control socket command; it is
+    started here, in the process that supervises the command.
+
+    heartbeat, a Heartbeat (see ptimeout_heartbeat), stops an attempt as timed
+    out once the command has not checked in for heartbeat.interval seconds.
+    It is opened here too, after any fork into the background.
+
+    notifier, a Notifier (see ptimeout_notify), gets READY=1 once the command
+    has started (or printed a line matching its ready_pattern), WATCHDOG=1
+    while it is running and checking in, and STATUS= with the time it has left.
+    """
+    import subprocess
 
     global current_subprocess
-    is_interactive = sys.stdout.isatty()
+    if progress_sink is None:
+        progress_sink = progress_reporter()
+    # Under another ptimeout's UI, our timers are drawn there
+    is_interactive = sys.stdout.isatty() and not (
+        progress_sink and not progress_sink.local
+    )
+    # The minimal style draws its own status line; only the full UI needs rich
+    use_minimal_renderer = is_interactive and progress_style == "minimal"
+    use_rich = is_interactive and not use_minimal_renderer
+    # Without a UI the child writes straight to our stdout/stderr: no pipes,
+    # reader threads or polling, and its exit is noticed as soon as it happens.
+    # Output that is to be cached, watched for events or counted for progress
+    # records has to pass through us.
+    passthrough = not (
+        is_interactive
+        or cache_ttl
+        or singleflight
+        or events
+        or progress_stream
+        or (heartbeat and heartbeat.pattern)
+        or (notifier and notifier.ready_pattern)
+    )
+    if not passthrough or piped_stdin_data:
+        # Reader threads and their queues, and the stdin feeder thread
+        import queue
+        import threading
+    if use_rich:
+        load_rich()
+        if progress_sink is None:
+            from ptimeout_progress import NestedTimers
+
+            progress_sink = NestedTimers()
     console = Console(file=sys.stderr)
     final_exit_code = EXIT_PTIMEOUT_ERROR  # Default to ptimeout error
 
-    # Check for nested ptimeout command
+    # A nested `ptimeout [OPTIONS] TIMEOUT -- COMMAND` is not run as another
+    # process: each of our attempts runs its level in-process, bounded by the
+    # attempt's deadline, so there is one supervisor and one child however deep
     is_nested, nested_args, remaining_args = extract_nested_ptimeout(command_args)
-
+    inner_level = None
     if is_nested:
-        # Handle nested ptimeout by executing it as a subprocess
-        # This allows proper timeout handling for each nested ptimeout instance
+        try:
+            inner_level = parse_nested_level(nested_args[1:-1])
+            if cache_ttl or singleflight:
+                raise ValueError(
+                    "--cache and --singleflight cannot wrap a nested ptimeout."
+                )
+        except ValueError as e:
+            console.print(f"[bold red]Error: {e}")
+            return EXIT_PTIMEOUT_ERROR
 
         if verbose:
             indent = "  " * nesting_level
@@ -339,26 +1461,6 @@ def run_command(
                 f"{indent}[bold cyan]Nested command: {' '.join(nested_args + remaining_args)}"
             )
 
-        # Construct the full nested ptimeout command
-        # Use the same executable path but include all the nested arguments
-        nested_command = [sys.executable] + nested_args + (remaining_args or [])
-
-        # Execute the nested ptimeout with the outer's timeout
-        # This ensures the outer timeout can kill the inner ptimeout if needed
-        return run_command(
-            nested_command,  # Execute the nested ptimeout command directly
-            timeout,  # Use outer timeout (outer can kill inner)
-            retries,
-            count_direction,
-            piped_stdin_data,
-            verbose,
-            nesting_level + 1,
-            background,
-            stdout_file,
-            stderr_file,
-            progress_style,
-        )
-
     # Handle background execution
     if background and nesting_level == 0:
         # For background mode, we need to fork the process and run the command in the background
@@ -393,12 +1495,50 @@ def run_command(
                     stdout_file=stdout_file,
                     stderr_file=stderr_file,
                     progress_style=progress_style,
+                    max_fps=max_fps,
+                    backoff=backoff,
+                    backoff_factor=backoff_factor,
+                    kill_signal=kill_signal,
+                    kill_after=kill_after,
+                    summary=summary,
+                    cache_ttl=cache_ttl,
+                    cache_env=cache_env,
+                    cache_max_size=cache_max_size,
+                    singleflight=singleflight,
+                    lock_name=lock_name,
+                    max_concurrent=max_concurrent,
+                    count_wait=count_wait,
+                    rate_limit=rate_limit,
+                    circuit_breaker=circuit_breaker,
+                    deadline=deadline,
+                    deadline_fd=deadline_fd,
+                    events=events,
+                    progress_stream=progress_stream,
+                    progress_interval=progress_interval,
+                    control=control,
+                    heartbeat=heartbeat,
+                    notifier=notifier,
                 )
 
         except OSError as e:
             console.print(f"[red]Failed to create background process: {e}")
             return EXIT_PTIMEOUT_ERROR
 
+    if control and nesting_level == 0:
+        try:
+            control.start()
+        except OSError as e:
+            console.print(f"[bold red]Error: Cannot open the control socket: {e}")
+            return EXIT_PTIMEOUT_ERROR
+    if heartbeat and nesting_level == 0:
+        from ptimeout_sync import runtime_dir
+
+        try:
+            heartbeat.open(runtime_dir())
+        except OSError as e:
+            console.print(f"[bold red]Error: Cannot open the heartbeat socket: {e}")
+            return EXIT_PTIMEOUT_ERROR
+
     if verbose:
         indent = "  " * nesting_level
         if nesting_level > 0:
@@ -416,46 +1556,305 @@ def run_command(
                 f"{indent}[bold blue]Piped input data length: {len(piped_stdin_data)} bytes"
             )
 
+    result_cache = None
+    if cache_ttl:
+        from ptimeout_cache import ResultCache, run_key
+
+        result_cache = ResultCache(max_size=cache_max_size)
+        cache_key = run_key(command_args, piped_stdin_data, cache_env)
+        cached = result_cache.lookup(cache_key, cache_ttl)
+        if cached:
+            if verbose:
+                age = time.time() - cached["created"]
+                console.print(
+                    f"[bold blue]Replaying cached result from {age:.0f}s ago (key {cache_key[:12]})"
+                )
+            replay_output(cached["stdout"], sys.stdout, stdout_file)
+            replay_output(cached["stderr"], sys.stderr, stderr_file)
+            return cached["exit_code"]
+    captured_output = None  # Output of the current attempt, when caching
+
+    breaker = None
+    if circuit_breaker:
+        from ptimeout_history import fingerprint
+        from ptimeout_sync import CircuitBreaker
+
+        breaker = CircuitBreaker(fingerprint(command_args), *circuit_breaker)
+        allowed, probe, retry_in = breaker.admit()
+        if not allowed:
+            next_probe = (
+                f"next probe in {math.ceil(retry_in)}s"
+                if retry_in
+                else "a probe run is in progress"
+            )
+            console.print(
+                f"[bold red]Circuit open: the command failed {breaker.failures} times in a row; not running it ({next_probe})."
+            )
+            return EXIT_CIRCUIT_OPEN
+        if probe:
+            # One quick verdict; the retries are what the circuit saves callers from
+            retries = 0
+            if verbose:
+                console.print("[bold yellow]Circuit half-open: this run is the probe")
+
+    def waiting(status):
+        """time.sleep, or with --sd-notify one that keeps the service manager informed."""
+        if not notifier:
+            return time.sleep
+        return lambda seconds: notifier.sleep(seconds, status)
+
+    flight = None
+    if singleflight and timeout > 0:
+        from ptimeout_cache import run_key
+        from ptimeout_sync import Flight
+
+        flight = Flight(run_key(command_args, piped_stdin_data, cache_env))
+        relayed = {}
+
+        def relay_output(stream_name, data):
+            """Pass on the joined run's output, to the redirect file if any."""
+            file_path = stdout_file if stream_name == "stdout" else stderr_file
+            if file_path:
+                if stream_name not in relayed:
+                    relayed[stream_name] = open(file_path, "wb")
+                relayed[stream_name].write(data)
+                return
+            stream = sys.stdout if stream_name == "stdout" else sys.stderr
+            stream.flush()
+            stream.buffer.write(data)
+            stream.buffer.flush()
+
+        try:
+            leader_exit_code = flight.join(
+                time.time() + timeout,
+                relay_output,
+                waiting("Waiting for an identical run to finish"),
+            )
+        except TimeoutError:
+            flight.close()
+            console.print(
+                f"[bold red]Timeout of {timeout}s reached while waiting for an identical run (pid {flight.leader_pid})."
+            )
+            return EXIT_TIMEOUT
+        finally:
+            for handle in relayed.values():
+                handle.close()
+        if leader_exit_code is not None:
+            flight.close()
+            if verbose:
+                console.print(
+                    f"[bold blue]Joined an identical run in progress (pid {flight.leader_pid}), exit code {leader_exit_code}"
+                )
+            return leader_exit_code
+
+    semaphore = None
+    if lock_name and timeout > 0:
+        from ptimeout_sync import Semaphore
+
+        semaphore = Semaphore(lock_name, max_concurrent)
+        try:
+            waited = semaphore.acquire(
+                time.time() + timeout if count_wait else None,
+                waiting(f"Waiting for lock '{lock_name}'"),
+            )
+        except TimeoutError:
+            if flight:
+                flight.abandon()
+            console.print(
+                f"[bold red]Timeout of {timeout}s reached while waiting for lock '{lock_name}'."
+            )
+            return EXIT_TIMEOUT
+        if verbose:
+            console.print(
+                f"[bold blue]Lock '{lock_name}': got slot {semaphore.slot + 1} of {max_concurrent} after waiting {waited:.2f}s"
+            )
+        if count_wait:
+            timeout = max(timeout - waited, 0.001)
+
+    if rate_limit and timeout > 0:
+        from ptimeout_sync import RateLimiter
+
+        bucket = rate_limit[0]
+        try:
+            waited = RateLimiter(*rate_limit).reserve(
+                max_wait=timeout if count_wait else None
+            )
+        except TimeoutError as e:
+            if semaphore:
+                semaphore.release()
+            if flight:
+                flight.abandon()
+            console.print(
+                f"[bold red]Timeout of {timeout}s would be reached waiting {e.args[0]:.2f}s for rate limit '{bucket}'. Command not executed."
+            )
+            return EXIT_TIMEOUT
+        if waited:
+            waiting(f"Waiting for rate limit '{bucket}'")(waited)
+        if verbose:
+            console.print(
+                f"[bold blue]Rate limit '{bucket}': waited {waited:.3f}s for a token"
+            )
+        if count_wait:
+            timeout = max(timeout - waited, 0.001)
+
+    attempts_made = 0
+    first_started_at = None
+    last_duration = 0.0
+    last_timed_out = False
+    peak_rss = None
+    level_timeout = timeout
+
+    def end_attempt(attempt, code, timed_out=False):
+        if events:
+            events.emit(
+                "attempt_end",
+                level=nesting_level,
+                attempt=attempt + 1,
+                code=code,
+                timed_out=timed_out,
+            )
+
     for attempt in range(retries + 1):
         if attempt > 0:
+            if deadline is not None and time.time() >= deadline:
+                final_exit_code = EXIT_TIMEOUT
+                break  # An enclosing level's time is up; no retry fits
+            if control and control.kill_now:
+                final_exit_code = EXIT_TIMEOUT
+                break  # Stopped on request; that is the end of the run
             console.print(f"[yellow]Retrying ({attempt}/{retries})...")
-            time.sleep(1)
+            delay = backoff * backoff_factor ** (attempt - 1)
+            if deadline is not None:
+                delay = min(delay, max(deadline - time.time(), 0))
+            if events:
+                events.emit("retry_scheduled", attempt=attempt + 1, delay=delay)
+            waiting(f"Retrying ({attempt}/{retries}) in {delay:g}s")(delay)
+
+        if deadline is not None and level_timeout > 0:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                final_exit_code = EXIT_TIMEOUT
+                break
+            timeout = min(level_timeout, max(round(remaining, 3), 0.001))
+
+        if events:
+            events.emit(
+                "attempt_start",
+                level=nesting_level,
+                attempt=attempt + 1,
+                retries=retries,
+                timeout=timeout,
+            )
+
+        if inner_level:
+            # This attempt is the whole next level: its own timeout and
+            # retries, none of it past our attempt's deadline
+            start_time = time.time()
+            attempts_made = attempt + 1
+            if first_started_at is None:
+                first_started_at = start_time
+            if progress_sink:
+                progress_sink.start(
+                    nesting_level, " ".join(command_args), timeout, attempt + 1, retries
+                )
+            inner_summary = None if summary is None else {}
+            final_exit_code = run_command(
+                remaining_args,
+                inner_level["timeout"],
+                inner_level["retries"],
+                count_direction,
+                piped_stdin_data,
+                verbose or inner_level["verbose"],
+                nesting_level + 1,
+                stdout_file=inner_level["stdout"] or stdout_file,
+                stderr_file=inner_level["stderr"] or stderr_file,
+                progress_style=progress_style,
+                max_fps=max_fps,
+                backoff=(
+                    DEFAULT_BACKOFF
+                    if inner_level["backoff"] is None
+                    else inner_level["backoff"]
+                ),
+                backoff_factor=inner_level["backoff_factor"] or DEFAULT_BACKOFF_FACTOR,
+                kill_signal=inner_level["kill_signal"] or kill_signal,
+                kill_after=(
+                    kill_after
+                    if inner_level["kill_after"] is None
+                    else inner_level["kill_after"]
+                ),
+                summary=inner_summary,
+                deadline=start_time + timeout,
+                deadline_fd=deadline_fd,
+                progress_sink=progress_sink,
+                events=events,
+                progress_stream=progress_stream,
+                progress_interval=progress_interval,
+                control=control,
+                heartbeat=heartbeat,
+                notifier=notifier,
+            )
+            last_duration = time.time() - start_time
+            last_timed_out = final_exit_code == EXIT_TIMEOUT
+            if inner_summary and inner_summary["peak_rss"]:
+                peak_rss = max(peak_rss or 0, inner_summary["peak_rss"])
+            end_attempt(attempt, final_exit_code, last_timed_out)
+            if final_exit_code in NESTED_FINAL_EXIT_CODES or attempt >= retries:
+                break
+            continue
 
         proc = None
+        scheduler = None
+        renderer = None
+        deadline_reader = deadline_writer = None
+        timer_rows = None  # Snapshot of the timer tree, for the render thread
         timed_out_by_ptimeout = (
             False  # Flag to indicate if ptimeout terminated the process
         )
-        # Use unlimited list for full output buffering, but keep deque for display
-        line_buffer_full = []  # Complete output buffer for scrolling
-        line_buffer_display = deque(
-            maxlen=MAX_DISPLAY_LINES
-        )  # Display buffer for current view
+        # Full output buffer for scrolling; the panel shows its tail when scrolling
+        capture_buffer = CaptureBuffer()
+        # Byte/line totals per stream, shared by the readers, drains and gauges
+        stream_counters = {"stdout": StreamCounters(), "stderr": StreamCounters()}
+        # Guards the buffer, which the render thread reads while we append
+        buffer_lock = threading.Lock() if use_rich else None
+        if result_cache:
+            captured_output = {"stdout": [], "stderr": []}
+        # Cached and shared output is kept byte for byte; decoding is for display
+        keep_raw = bool(result_cache or flight)
+        output_seen = []  # Stream of the first output, once there has been some
         scroll_offset = 0  # Current scroll position for large outputs
         scrolling_enabled = False  # Flag to enable scrolling mode
+        start_time = None
         try:
+            # Create task description with nesting level info for verbose display
+            task_description = f"timeout (level {nesting_level})"
+            if nesting_level > 0:
+                task_description = (
+                    f"  " * (nesting_level - 1) + "└─ " + task_description
+                )
+
             # Initialize UI components if interactive
-            if is_interactive:
+            if use_rich:
                 layout = Layout()
                 layout.split(
                     Layout(name="header", size=3), Layout(name="main", ratio=1)
                 )
 
-                # Create task description with nesting level info for verbose display
-                task_description = f"timeout (level {nesting_level})"
-                if nesting_level > 0:
-                    task_description = (
-                        f"  " * (nesting_level - 1) + "└─ " + task_description
-                    )
-
-                progress_columns = get_progress_columns(progress_style, count_direction)
+                progress_columns = get_progress_columns(
+                    progress_style, count_direction, show_gauges=True
+                )
 
                 progress = Progress(*progress_columns, console=console)
                 task_id = progress.add_task(
-                    task_description, total=timeout if timeout > 0 else 1
+                    task_description, total=timeout if timeout > 0 else 1, gauges=""
                 )
                 layout["header"].update(progress)
+                # Refreshes are driven by the RenderScheduler, not by Live's own timer
                 live_context = Live(
-                    layout, screen=True, redirect_stderr=True, console=console
+                    layout,
+                    screen=True,
+                    redirect_stderr=True,
+                    console=console,
+                    auto_refresh=False,
                 )
             else:
                 # Dummy context manager for non-interactive mode
@@ -486,6 +1885,168 @@ def run_command(
                     "timeout", total=timeout if timeout > 0 else 1
                 )
                 # In non-interactive mode, child process stdout/stderr will go directly to sys.stdout/sys.stderr
+                if use_minimal_renderer:
+                    renderer = MinimalRenderer(
+                        task_description, timeout, count_direction
+                    )
+
+            def drain_output(q, stream_name, stream):
+                """
+                Move everything queued on q into the capture buffer.
+
+                Without the full UI the chunks are passed through untouched,
+                coalesced into one write and flush on our own stream instead.
+                Returns the number of completed lines.
+                """
+                nonlocal scrolling_enabled
+                chunks = []
+                while True:
+                    try:
+                        chunks.append(q.get_nowait())
+                    except queue.Empty:
+                        break
+                if not chunks:
+                    return 0
+
+                raw_data = None
+                if keep_raw:
+                    chunks, raw_chunks = zip(*chunks)
+                    raw_data = b"".join(raw_chunks)
+                data = "".join(chunks)
+                if heartbeat and heartbeat.pattern:
+                    heartbeat.feed(stream_name, data)
+                if notifier and notifier.ready_pattern and not notifier.is_ready:
+                    notifier.feed(stream_name, data)
+                if events and not output_seen:
+                    output_seen.append(stream_name)
+                    events.emit(
+                        "first_output",
+                        stream=stream_name,
+                        after=round(time.time() - start_time, 6),
+                    )
+                stream_counters[stream_name].lines += data.count("\n")
+                if captured_output is not None:
+                    captured_output[stream_name].append(raw_data)
+                if flight:
+                    flight.publish(stream_name, raw_data)
+                if use_rich:
+                    with buffer_lock:
+                        new_lines = capture_buffer.feed(data, stream_name)
+                        scrolling_enabled = should_enable_scrolling(len(capture_buffer))
+                    # In-place rewrites still need a frame, even without a newline
+                    return max(new_lines, 1)
+                if renderer:
+                    renderer.write_output(data, stream)
+                elif raw_data is not None:
+                    write_raw(raw_data, stream)
+                else:
+                    stream.write(data)
+                    stream.flush()
+                return data.count("\n")
+
+            def build_output_panel(show_help=False):
+                """Build the output panel from a snapshot of the line buffers."""
+                with buffer_lock:
+                    # Show only the tail when scrolling is enabled, otherwise everything
+                    buffer_to_use = [
+                        (entry, entry[0])
+                        for entry in (
+                            capture_buffer.tail(MAX_DISPLAY_LINES)
+                            if scrolling_enabled
+                            else capture_buffer.lines
+                        )
+                    ]
+                    total_lines = len(capture_buffer)
+                    scrolling = scrolling_enabled
+
+                # ANSI parsing happens here, outside the lock and only for visible lines
+                display_text = Text()
+                for entry, line in buffer_to_use:
+                    display_text.append(CaptureBuffer.styled(entry, line))
+                    display_text.append("\n")
+
+                # Update title to indicate scrolling mode
+                title = f"Output (Attempt {attempt + 1})"
+                if scrolling:
+                    title += f" [Scrolling: {total_lines} lines]"
+
+                    # Add scrolling instructions
+                    if show_help and total_lines > MAX_DISPLAY_LINES:
+                        help_text = Text(
+                            "\n[dim yellow]Scroll mode enabled:[/dim yellow]\n"
+                            "- Full output saved to buffer (25 lines shown)[/dim yellow]\n"
+                            "- Press Ctrl+C to exit and view full output in terminal[/dim yellow]\n"
+                            "- Consider redirecting output to file: ptimeout --output file.log[/dim yellow]",
+                            style="dim yellow",
+                        )
+                        display_text.append(help_text)
+
+                return Panel(
+                    display_text,
+                    border_style="blue" if scrolling else "green",
+                    title=title,
+                )
+
+            shown_rows = None  # The timer_rows snapshot the header shows
+            timer_bars = []  # (Progress, task id, record) of the other levels
+
+            def timer_progress(rows):
+                """One progress bar per (depth, timer record) in rows."""
+                bars = Progress(
+                    *get_progress_columns(progress_style, count_direction),
+                    console=console,
+                )
+                for depth, record in rows:
+                    label = record["label"]
+                    if record["retries"]:
+                        label += f" ({record['attempt']}/{record['retries'] + 1})"
+                    if depth:
+                        label = "  " * (depth - 1) + "└─ " + label
+                    bar = bars.add_task(label, total=record["timeout"] or 1)
+                    # Elapsed since that level's attempt began, not since now
+                    bars.tasks[-1].start_time = record["started"]
+                    timer_bars.append((bars, bar, record))
+                return bars
+
+            def build_header():
+                """Our timer, with the enclosing levels' above and nested ones' below."""
+                nonlocal shown_rows
+                from ptimeout_progress import timer_id
+
+                shown_rows = timer_rows
+                own = timer_id(nesting_level)
+                ids = [record["id"] for _, record in shown_rows]
+                split = ids.index(own) if own in ids else 0
+                above, below = shown_rows[:split], shown_rows[split + (own in ids) :]
+                timer_bars.clear()
+                parts = [timer_progress(above)] if above else []
+                parts.append(progress)
+                if below:
+                    parts.append(timer_progress(below))
+                layout["header"].update(Group(*parts))
+                layout["header"].size = len(above) + len(below) + 3
+
+            def render_frame():
+                """Draw one frame; runs on the RenderScheduler thread."""
+                elapsed = min(time.time() - start_time, timeout)
+                if timer_rows is not shown_rows:
+                    build_header()
+                for bars, bar, record in timer_bars:
+                    bars.update(
+                        bar,
+                        completed=min(
+                            time.monotonic() - record["started"], record["timeout"]
+                        ),
+                    )
+                # Sampling /proc happens here rather than in the supervision loop
+                if gauges.sample():
+                    progress.update(
+                        task_id, completed=elapsed, gauges=gauges.describe()
+                    )
+                else:
+                    progress.update(task_id, completed=elapsed)
+                layout["main"].update(build_output_panel(show_help=True))
+                live.refresh()
 
             with live_context as live:
                 if timeout == 0:
@@ -502,21 +2063,59 @@ def run_command(
                     # Handle output redirection
                     if stdout_file:
                         stdout_handle = open(stdout_file, "w")
-                    else:
+                    elif not passthrough:
                         stdout_handle = subprocess.PIPE
 
                     if stderr_file:
                         stderr_handle = open(stderr_file, "w")
-                    else:
+                    elif not passthrough:
                         stderr_handle = subprocess.PIPE
 
+                    if passthrough:
+                        # Anything we printed must land before the child's output
+                        sys.stdout.flush()
+                        sys.stderr.flush()
+
+                    if deadline_fd:
+                        deadline_reader, deadline_writer = os.pipe()
+                    progress_channel = (
+                        progress_sink.child_channel(nesting_level)
+                        if progress_sink
+                        else None
+                    )
+                    if events:
+                        usage_before = events.usage()
+                        spawn_started = time.monotonic()
                     proc = subprocess.Popen(
                         command_args,
                         stdin=subprocess.PIPE if piped_stdin_data else None,
                         stdout=stdout_handle,
                         stderr=stderr_handle,
                         preexec_fn=os.setsid,  # To kill the whole process group
+                        env=command_environment(
+                            timeout, deadline_reader, progress_channel, heartbeat
+                        ),
+                        pass_fds=tuple(
+                            fd
+                            for fd in (
+                                deadline_reader,
+                                progress_channel and progress_channel[0],
+                                heartbeat and heartbeat.writer,
+                            )
+                            if fd is not None
+                        ),
                     )
+                    if progress_sink:
+                        progress_sink.spawned()
+                    if notifier and not notifier.ready_pattern:
+                        notifier.ready()
+                    if events:
+                        events.emit(
+                            "spawned",
+                            pid=proc.pid,
+                            pgid=proc.pid,  # Leader of its own session
+                            spawn_latency=round(time.monotonic() - spawn_started, 6),
+                        )
 
                     # Update global subprocess reference for signal handling
                     current_subprocess = proc
@@ -527,6 +2126,7 @@ def run_command(
                     else:
                         console.print(f"[red]Command not found: {command_args[0]}")
                     final_exit_code = EXIT_COMMAND_NOT_FOUND
+                    end_attempt(attempt, final_exit_code)
                     break  # Exit retry loop
                 except PermissionError:
                     # Command found but cannot be invoked (permissions)
@@ -535,6 +2135,7 @@ def run_command(
                     else:
                         console.print(f"[red]Permission denied: {command_args[0]}")
                     final_exit_code = EXIT_COMMAND_NOT_INVOKABLE
+                    end_attempt(attempt, final_exit_code)
                     break  # Exit retry loop
                 except OSError as e:
                     # Other OS-level errors when trying to invoke command
@@ -547,6 +2148,7 @@ def run_command(
                             f"[red]Cannot execute command {command_args[0]}: {e}"
                         )
                     final_exit_code = EXIT_COMMAND_NOT_INVOKABLE
+                    end_attempt(attempt, final_exit_code)
                     break  # Exit retry loop
 
                 # Thread to feed stdin to the subprocess if data is available
@@ -558,35 +2160,143 @@ def run_command(
                     stdin_feeder_thread.start()
 
                 # Queues and threads to read stdout and stderr only when using pipes
-                q_stdout = queue.Queue()
-                q_stderr = queue.Queue()
+                q_stdout = q_stderr = None
                 t_stdout = None
                 t_stderr = None
 
                 # Only create reader threads when output goes to pipes (not files)
-                if not stdout_file:
+                if stdout_handle is subprocess.PIPE:
+                    q_stdout = queue.Queue()
                     t_stdout = threading.Thread(
-                        target=read_stream, args=(proc.stdout, q_stdout)
+                        target=read_stream,
+                        args=(
+                            proc.stdout,
+                            q_stdout,
+                            stream_counters["stdout"],
+                            keep_raw,
+                        ),
                     )
                     t_stdout.start()
 
-                if not stderr_file:
+                if stderr_handle is subprocess.PIPE:
+                    q_stderr = queue.Queue()
                     t_stderr = threading.Thread(
-                        target=read_stream, args=(proc.stderr, q_stderr)
+                        target=read_stream,
+                        args=(
+                            proc.stderr,
+                            q_stderr,
+                            stream_counters["stderr"],
+                            keep_raw,
+                        ),
                     )
                     t_stderr.start()
 
+                # Throughput and child CPU/RSS for the header, sampled by the render
+                # thread; without one, the loop samples it for the run's peak RSS
+                gauges = ResourceGauges(
+                    {
+                        name: stream_counters[name]
+                        for name, reader in (("stdout", t_stdout), ("stderr", t_stderr))
+                        if reader
+                    },
+                    pgid=proc.pid,
+                )
+
                 start_time = time.time()
+                attempts_made = attempt + 1
+                if first_started_at is None:
+                    first_started_at = start_time
+                if heartbeat:
+                    heartbeat.reset()
+                if control:
+                    control.attempt = {
+                        "level": nesting_level,
+                        "attempt": attempt + 1,
+                        "retries": retries,
+                        "pid": proc.pid,
+                        "timeout": timeout,
+                        "started": start_time,
+                    }
+                if progress_sink:
+                    progress_sink.start(
+                        nesting_level,
+                        " ".join(command_args),
+                        timeout,
+                        attempt + 1,
+                        retries,
+                    )
+                    if progress_sink.local:
+                        progress_sink.poll()
+                        timer_rows = progress_sink.tree()
+
+                # Rendering runs on its own thread so it can never hold up the deadline
+                if use_rich:
+                    scheduler = RenderScheduler(render_frame, max_fps=max_fps)
+                    scheduler.start()
+                    scheduler.mark_dirty()
 
                 # The main loop: run until the process finishes or timeout is reached
                 last_verbose_update = 0  # Track last verbose update time
+                last_frame_key = None  # Visible progress state at the last request
+                # When to send deadline_warning; never without an event stream
+                warn_at = timeout * DEADLINE_WARNING_FRACTION if events else math.inf
+                # When the next progress record is due; never without a stream
+                progress_at = 0 if progress_stream else math.inf
+                heartbeat_missed = False
                 while proc.poll() is None and time.time() - start_time < timeout:
+                    if control and control.poll():
+                        # The deadline moved: re-arm everything that follows it
+                        timeout = (
+                            round(time.time() - start_time, 3)
+                            if control.kill_now
+                            else max(timeout + control.take(), 0)
+                        )
+                        control.attempt["timeout"] = timeout
+                        if events:
+                            events.emit(
+                                "deadline_changed",
+                                attempt=attempt + 1,
+                                timeout=round(timeout, 3),
+                                kill_now=control.kill_now,
+                            )
+                            if warn_at != math.inf:
+                                warn_at = timeout * DEADLINE_WARNING_FRACTION
+                        if use_rich:
+                            progress.update(task_id, total=max(timeout, 0.001))
+                        elif renderer:
+                            renderer.timeout = timeout
+                        if verbose:
+                            console.print(
+                                f"{'  ' * nesting_level}[yellow]Timeout changed to {timeout:g}s (level {nesting_level})"
+                            )
+                        continue
+
                     elapsed = time.time() - start_time
                     remaining = timeout - elapsed
 
-                    # Update progress for interactive mode
-                    if is_interactive:
-                        progress.update(task_id, completed=elapsed)
+                    if elapsed >= warn_at:
+                        events.emit(
+                            "deadline_warning",
+                            attempt=attempt + 1,
+                            remaining=round(remaining, 3),
+                        )
+                        warn_at = math.inf
+
+                    if elapsed >= progress_at:
+                        progress_stream.emit(
+                            "progress",
+                            level=nesting_level,
+                            attempt=attempt + 1,
+                            retries=retries,
+                            elapsed=round(elapsed, 3),
+                            remaining=round(remaining, 3),
+                            stdout_bytes=stream_counters["stdout"].bytes,
+                            stderr_bytes=stream_counters["stderr"].bytes,
+                        )
+                        # The next slot still ahead: after a stall, no burst of catch-up records
+                        progress_at = (
+                            elapsed // progress_interval + 1
+                        ) * progress_interval
 
                     # Show countdown in verbose mode (update every 1 second to avoid spam)
                     if (
@@ -611,78 +2321,85 @@ def run_command(
                         last_verbose_update = elapsed
 
                     # Non-blocking read from queues (only when using pipes)
+                    new_lines = 0
                     if t_stdout:
-                        while not q_stdout.empty():
-                            line = q_stdout.get()
-                            if is_interactive:
-                                line_buffer_full.append(
-                                    Text(line, style="none")
-                                )  # Store in full buffer
-                                line_buffer_display.append(
-                                    Text(line, style="none")
-                                )  # Add to display buffer
-                                # Check if scrolling should be enabled
-                                scrolling_enabled = should_enable_scrolling(
-                                    len(line_buffer_full)
-                                )
-                            else:
-                                sys.stdout.write(line)
-                                sys.stdout.flush()
+                        new_lines += drain_output(q_stdout, "stdout", sys.stdout)
                     if t_stderr:
-                        while not q_stderr.empty():
-                            line = q_stderr.get()
-                            if is_interactive:
-                                line_buffer_full.append(
-                                    Text(line, style="red")
-                                )  # Store in full buffer
-                                line_buffer_display.append(
-                                    Text(line, style="red")
-                                )  # Add to display buffer
-                                # Check if scrolling should be enabled
-                                scrolling_enabled = should_enable_scrolling(
-                                    len(line_buffer_full)
-                                )
-                            else:
-                                sys.stderr.write(line)
-                                sys.stderr.flush()
-
-                    if is_interactive:
-                        # Reconstruct output_text from buffer for scrolling effect
-                        display_text = Text()
-                        # Use display buffer when scrolling is enabled, otherwise use full buffer
-                        buffer_to_use = (
-                            line_buffer_display
-                            if scrolling_enabled
-                            else line_buffer_full
+                        new_lines += drain_output(q_stderr, "stderr", sys.stderr)
+
+                    if heartbeat:
+                        heartbeat.poll()
+                        if time.time() >= heartbeat.expires_at():
+                            heartbeat_missed = True
+                            break
+
+                    if summary is not None and not scheduler:
+                        gauges.sample()  # For the peak RSS; the render thread samples its own
+
+                    if notifier:
+                        # Liveness only while the command keeps checking in
+                        notifier.tick(
+                            f"Attempt {attempt + 1}/{retries + 1}: {remaining:.0f}s of {timeout:g}s left",
+                            progressing=not heartbeat
+                            or heartbeat.last > notifier.last_watchdog,
                         )
-                        for buffered_line in buffer_to_use:
-                            display_text.append(buffered_line)
-
-                        # Update title to indicate scrolling mode
-                        title = f"Output (Attempt {attempt + 1})"
-                        if scrolling_enabled:
-                            title += f" [Scrolling: {len(line_buffer_full)} lines]"
-
-                            # Add scrolling instructions
-                            if len(line_buffer_full) > MAX_DISPLAY_LINES:
-                                help_text = Text(
-                                    "\n[dim yellow]Scroll mode enabled:[/dim yellow]\n"
-                                    "- Full output saved to buffer (25 lines shown)[/dim yellow]\n"
-                                    "- Press Ctrl+C to exit and view full output in terminal[/dim yellow]\n"
-                                    "- Consider redirecting output to file: ptimeout --output file.log[/dim yellow]",
-                                    style="dim yellow",
-                                )
-                                display_text.append(help_text)
-
-                        layout["main"].update(
-                            Panel(
-                                display_text,
-                                border_style="blue" if scrolling_enabled else "green",
-                                title=title,
-                            )
+
+                    if scheduler:
+                        # Only ask for a frame when something visible changed:
+                        # new output, a nested ptimeout's timer coming or going,
+                        # or the displayed second/percentage ticked over
+                        timers_changed = progress_sink.poll()
+                        if timers_changed:
+                            timer_rows = progress_sink.tree()
+                        frame_key = (int(elapsed), int(elapsed * 100 / timeout))
+                        if new_lines or timers_changed or frame_key != last_frame_key:
+                            scheduler.mark_dirty(new_lines)
+                            last_frame_key = frame_key
+                    elif renderer:
+                        renderer.update(elapsed)
+
+                    if passthrough:
+                        # Nothing to drain or draw: block until the child exits,
+                        # the deadline passes or the next verbose countdown is due
+                        wait = min(remaining, 1.0) if verbose else remaining
+                        wakeup_fds = control.wakeup_fds() if control else []
+                        if heartbeat:
+                            wait = min(wait, heartbeat.expires_at() - time.time())
+                            wakeup_fds += heartbeat.wakeup_fds()
+                        if notifier:
+                            wait = min(wait, notifier.next_due() - time.time())
+                        if summary is not None:
+                            wait = min(wait, gauges.interval)
+                        wait_for_exit(proc, wait, wakeup_fds)
+                    else:
+                        time.sleep(min(SUPERVISION_INTERVAL, max(remaining, 0)))
+
+                # Enforce the deadline before any UI or reader-thread cleanup
+                if (
+                    proc.poll() is None
+                ):  # Process still running, timeout was truly reached
+                    timed_out_by_ptimeout = True  # Set the flag
+                    if deadline_writer is not None:
+                        os.close(deadline_writer)  # EOF on the command's end
+                        deadline_writer = None
+                    elapsed = time.time() - start_time
+                    # Signal first: nothing written to a reader may delay it
+                    terminate_process_group(proc, kill_signal, kill_after, events)
+                    if events:
+                        events.emit(
+                            "timed_out",
+                            attempt=attempt + 1,
+                            timeout=timeout,
+                            elapsed=round(elapsed, 6),
+                            reason="heartbeat" if heartbeat_missed else "timeout",
                         )
+                last_duration = time.time() - start_time
+                last_timed_out = timed_out_by_ptimeout
+                if gauges.peak_rss_bytes:
+                    peak_rss = max(peak_rss or 0, gauges.peak_rss_bytes)
 
-                    time.sleep(0.05)  # UI refresh rate for interactive mode
+                if scheduler:
+                    scheduler.stop()
 
                 # Wait for stdin feeder to finish if it's still running
                 if stdin_feeder_thread:
@@ -696,71 +2413,35 @@ def run_command(
 
                 # Final drain of queues (only when using pipes)
                 if t_stdout:
-                    while not q_stdout.empty():
-                        line = q_stdout.get()
-                        if is_interactive:
-                            line_buffer_full.append(
-                                Text(line, style="none")
-                            )  # Store in full buffer
-                            line_buffer_display.append(
-                                Text(line, style="none")
-                            )  # Add to display buffer
-                            # Update scrolling status
-                            scrolling_enabled = should_enable_scrolling(
-                                len(line_buffer_full)
-                            )
-                        else:
-                            sys.stdout.write(line)
-                            sys.stdout.flush()
+                    drain_output(q_stdout, "stdout", sys.stdout)
                 if t_stderr:
-                    while not q_stderr.empty():
-                        line = q_stderr.get()
-                        if is_interactive:
-                            line_buffer_full.append(
-                                Text(line, style="red")
-                            )  # Store in full buffer
-                            line_buffer_display.append(
-                                Text(line, style="red")
-                            )  # Add to display buffer
-                            # Update scrolling status
-                            scrolling_enabled = should_enable_scrolling(
-                                len(line_buffer_full)
-                            )
-                        else:
-                            sys.stderr.write(line)
-                            sys.stderr.flush()
-
-                if is_interactive:
-                    display_text = Text()
-                    # Use display buffer when scrolling is enabled, otherwise use full buffer
-                    buffer_to_use = (
-                        line_buffer_display if scrolling_enabled else line_buffer_full
-                    )
-                    for buffered_line in buffer_to_use:
-                        display_text.append(buffered_line)
-
-                    # Update title to indicate scrolling mode
-                    title = f"Output (Attempt {attempt + 1})"
-                    if scrolling_enabled:
-                        title += f" [Scrolling: {len(line_buffer_full)} lines]"
-
-                    layout["main"].update(
-                        Panel(
-                            display_text,
-                            border_style="blue" if scrolling_enabled else "green",
-                            title=title,
-                        )
-                    )
+                    drain_output(q_stderr, "stderr", sys.stderr)
+
+                if use_rich:
+                    layout["main"].update(build_output_panel())
                     live.refresh()
+                elif renderer:
+                    renderer.clear()
 
                 # Determine outcome after loop
-                if (
-                    proc.poll() is None
-                ):  # Process still running, timeout was truly reached
-                    timed_out_by_ptimeout = True  # Set the flag
-                    os.killpg(os.getpgid(proc.pid), 9)
                 proc.wait()  # Clean up zombie process
+                if events:
+                    events.exited(
+                        proc.returncode,
+                        usage_before,
+                        pid=proc.pid,
+                        duration=round(last_duration, 6),
+                    )
+                    end_attempt(
+                        attempt,
+                        EXIT_TIMEOUT if timed_out_by_ptimeout else proc.returncode,
+                        timed_out_by_ptimeout,
+                    )
                 live.stop()  # Explicitly stop Live
+                if heartbeat_missed and timed_out_by_ptimeout:
+                    console.print(
+                        f"[bold red]No heartbeat for {heartbeat.interval}s. Command terminated."
+                    )
                 if verbose:
                     indent = "  " * nesting_level
                     console.print(
@@ -779,7 +2460,7 @@ def run_command(
                         continue  # Go to next retry
                 else:  # Process finished on its own (proc.poll() is not None, and not timed_out_by_ptimeout)
                     if proc.returncode == 0:
-                        if is_interactive:
+                        if use_rich:
                             progress.update(
                                 task_id, completed=timeout, description="[green]Success"
                             )
@@ -795,7 +2476,7 @@ def run_command(
                         final_exit_code = EXIT_SUCCESS
                         break  # Exit retry loop on success
                     else:
-                        if is_interactive:
+                        if use_rich:
                             progress.update(
                                 task_id, completed=timeout, description="[red]Failed"
                             )
@@ -837,19 +2518,104 @@ def run_command(
                 final_exit_code = 1
             break  # Exit retry loop on exception
         finally:
+            if control:
+                control.attempt = None
+            # Make sure the render thread never outlives its attempt
+            if scheduler:
+                scheduler.stop()
+            if renderer:
+                renderer.clear()
+
             # Clear global subprocess reference
             current_subprocess = None
 
+            for fd in (deadline_reader, deadline_writer):
+                if fd is not None:
+                    os.close(fd)
+            if progress_sink:
+                progress_sink.command_exited()
+
             # Close file handles if they were opened
             if stdout_handle and hasattr(stdout_handle, "close"):
                 stdout_handle.close()
             if stderr_handle and hasattr(stderr_handle, "close"):
                 stderr_handle.close()
 
+    if result_cache and final_exit_code == EXIT_SUCCESS and attempts_made:
+        try:
+            result_cache.store(
+                cache_key,
+                final_exit_code,
+                captured_bytes(captured_output["stdout"], stdout_file),
+                captured_bytes(captured_output["stderr"], stderr_file),
+            )
+        except OSError:
+            pass  # A result that cannot be stored is simply not cached
+
+    if semaphore:
+        semaphore.release()
+
+    if breaker and final_exit_code != EXIT_INTERRUPTED:
+        breaker.record(final_exit_code == EXIT_SUCCESS, probe)
+
+    if flight:
+        # Followers get redirected output in one piece, once it is complete
+        for stream_name, file_path in (
+            ("stdout", stdout_file),
+            ("stderr", stderr_file),
+        ):
+            if file_path and attempts_made:
+                try:
+                    flight.publish(stream_name, captured_bytes([], file_path))
+                except OSError:
+                    pass
+        flight.finish(final_exit_code)
+
+    if progress_sink and attempts_made:
+        progress_sink.finish(nesting_level)
+
+    if summary is not None and attempts_made:
+        summary.update(
+            started_at=first_started_at,
+            duration=last_duration,
+            timed_out=last_timed_out,
+            attempts=attempts_made,
+            exit_code=final_exit_code,
+            peak_rss=peak_rss,
+        )
+
     # print(f"DEBUG: Final final_exit_code before return from run_command: {final_exit_code}", file=sys.stderr) # DEBUG
     return final_exit_code
 
 
+def replay_output(data, stream, file_path=None):
+    """Write cached output to file_path if given, else to stream."""
+    if file_path:
+        with open(file_path, "wb") as f:
+            f.write(data)
+        return
+    write_raw(data, stream)
+
+
+def write_raw(data, stream):
+    """Write bytes to a text stream, through its binary buffer when it has one."""
+    stream.flush()
+    buffer = getattr(stream, "buffer", None)
+    if buffer is None:
+        stream.write(data.decode("utf-8", "replace"))
+    else:
+        buffer.write(data)
+        buffer.flush()
+
+
+def captured_bytes(chunks, file_path=None):
+    """A stream's output for the result cache: what was read, or the redirect file."""
+    if file_path:
+        with open(file_path, "rb") as f:
+            return f.read()
+    return b"".join(chunks)
+
+
 def validate_retries(retries):
     """
     Validate the retries argument type and range.
@@ -965,6 +2731,88 @@ def validate_command_separators(argv, is_piped_input=False):
         )
 
 
+def parse_signal(signal_str):
+    """Converts a signal name or number (e.g., 'TERM', 'SIGINT', '9') to its number."""
+    import signal
+
+    name = signal_str.strip().upper()
+    if name.isdigit():
+        if int(name) in signal.valid_signals():
+            return int(name)
+    else:
+        number = getattr(signal, name if name.startswith("SIG") else "SIG" + name, None)
+        if isinstance(number, signal.Signals):
+            return int(number)
+    raise ValueError(
+        f"Invalid signal: '{signal_str}'. Use a signal name or number. Example: ptimeout -s TERM 30s -- echo hello"
+    )
+
+
+def parse_auto_timeout(timeout_str):
+    """
+    Parses an automatic timeout: 'auto', 'auto:p95', 'auto:p95*2' or 'auto:*2'.
+
+    Returns:
+        tuple: (percentile, factor) of recorded run times to use as the deadline
+    """
+    error = ValueError(
+        f"Invalid automatic timeout: '{timeout_str}'. Use auto, auto:pNN or auto:pNN*FACTOR. Example: ptimeout auto:p95*2 -- make test"
+    )
+    timeout_str = timeout_str.strip()
+    if timeout_str == "auto":
+        return DEFAULT_AUTO_PERCENTILE, DEFAULT_AUTO_FACTOR
+    if not timeout_str.startswith("auto:"):
+        raise error
+    percentile_part, _, factor_part = timeout_str[len("auto:") :].partition("*")
+    if percentile_part and not percentile_part.startswith("p"):
+        raise error
+    try:
+        percentile = (
+            float(percentile_part[1:]) if percentile_part else DEFAULT_AUTO_PERCENTILE
+        )
+        factor = float(factor_part) if factor_part else DEFAULT_AUTO_FACTOR
+    except ValueError:
+        raise error
+    if not 0 < percentile <= 100 or factor <= 0:
+        raise error
+    return percentile, factor
+
+
+def parse_size(size_str):
+    """Converts a size string (e.g., '512K', '256M', '1G') to bytes."""
+    size_str = size_str.strip()
+    unit = size_str[-1:].upper()
+    multiplier = SIZE_UNITS.get(unit)
+    number = size_str[:-1] if multiplier else size_str
+    if not number.isdigit():
+        raise ValueError(
+            f"Invalid size: '{size_str}'. Use a whole number of bytes, optionally followed by K, M or G. Example: 256M"
+        )
+    return int(number) * (multiplier or 1)
+
+
+def parse_rate(rate_str):
+    """
+    Converts a rate limit such as 'api:5/s' or 'api:30/m:10' (with a burst of
+    10) to (bucket name, launches per second, burst).
+    """
+    from ptimeout_sync import validate_name
+
+    name, _, spec = rate_str.strip().partition(":")
+    count, _, per = spec.partition("/")
+    unit, _, burst = per.partition(":")
+    try:
+        rate = float(count) / RATE_UNITS[unit.lower()]
+        burst = int(burst) if burst else 1
+    except (KeyError, ValueError):
+        rate = burst = 0
+    if not (rate > 0 and burst >= 1):
+        raise ValueError(
+            f"Invalid rate: '{rate_str}'. Use NAME:N/s, NAME:N/m or NAME:N/h, optionally followed by :BURST. Example: ptimeout --rate api:5/s 10s -- curl localhost:8080"
+        )
+    return validate_name(name), rate, burst
+
+
 def parse_timeout(timeout_str):
     """Converts a timeout string (e.g., '10s', '5m', '1h') to seconds."""
     if not timeout_str or not timeout_str.strip():
@@ -1044,6 +2892,8 @@ def generate_systemd_unit(
     working_dir=None,
     restart_policy=None,
     output_file=None,
+    notify=False,
+    watchdog_sec=None,
 ):
     """
     Generate a systemd user service unit file for ptimeout commands.
@@ -1057,6 +2907,8 @@ def generate_systemd_unit(
         working_dir: Working directory (optional)
         restart_policy: Restart policy (optional, defaults to "no")
         output_file: Output file path (optional, defaults to stdout)
+        notify: Run ptimeout with --sd-notify as a Type=notify service (optional)
+        watchdog_sec: WatchdogSec of the service, e.g. "30s" (optional, implies notify)
 
     Returns:
         str: The generated systemd unit file content
@@ -1086,14 +2938,19 @@ def generate_systemd_unit(
     # Build the systemd unit file
     # Use a more realistic path for ptimeout installation
     ptimeout_path = "/usr/local/bin/ptimeout"  # Default installation location
+    notify = notify or bool(watchdog_sec)
     unit_content = f"""[Unit]
 Description={description}
 After=network.target
 
 [Service]
-Type=simple
+Type={"notify" if notify else "simple"}
 User={user}
-ExecStart={ptimeout_path} {timeout} -- {" ".join(command)}"""
+ExecStart={ptimeout_path} {"--sd-notify " if notify else ""}{timeout} -- {" ".join(command)}"""
+
+    # ptimeout pings the watchdog while the command runs
+    if watchdog_sec:
+        unit_content += f"\nWatchdogSec={watchdog_sec}"
 
     # Add working directory if specified
     if working_dir:
@@ -1124,6 +2981,8 @@ WantedBy=default.target
 
 def handle_systemd_generate():
     """Handle the 'ptimeout systemd generate' command."""
+    import argparse
+
     parser = argparse.ArgumentParser(
         description="Generate systemd user service unit files for ptimeout commands",
         formatter_class=argparse.RawTextHelpFormatter,
@@ -1173,6 +3032,18 @@ def handle_systemd_generate():
         help="Output file path (optional, defaults to stdout)",
     )
 
+    parser.add_argument(
+        "--notify",
+        action="store_true",
+        help="Type=notify service: ptimeout reports readiness and status (--sd-notify)",
+    )
+
+    parser.add_argument(
+        "--watchdog-sec",
+        type=str,
+        help="WatchdogSec for the service, e.g. '30s' (optional, implies --notify)",
+    )
+
     args = parser.parse_args(sys.argv[3:])  # Skip 'ptimeout systemd generate'
 
     try:
@@ -1185,6 +3056,8 @@ def handle_systemd_generate():
             working_dir=args.working_dir,
             restart_policy=args.restart,
             output_file=args.output_file,
+            notify=args.notify,
+            watchdog_sec=args.watchdog_sec,
         )
 
         if args.output_file:
@@ -1200,13 +3073,151 @@ def handle_systemd_generate():
         sys.exit(1)
 
 
-def get_progress_columns(style, count_direction):
+def format_stats_duration(seconds):
+    """Format a duration for the stats table, e.g. 850ms, 12.4s, 3m05s, 1h02m."""
+    if seconds < 1:
+        return f"{seconds * 1000:.0f}ms"
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, secs = divmod(int(round(seconds)), 60)
+    if minutes < 60:
+        return f"{minutes}m{secs:02d}s"
+    return f"{minutes // 60}h{minutes % 60:02d}m"
+
+
+def format_stats_table(rows, width=48):
+    """Render `ptimeout stats` rows as a plain aligned table."""
+    header = [
+        "COMMAND",
+        "RUNS",
+        "OK",
+        "TIMEOUT",
+        "NEAR",
+        "RETRY",
+        "P50",
+        "P90",
+        "P99",
+        "PEAK RSS",
+    ]
+    lines = [header]
+    for row in rows:
+        command = row["command"]
+        if len(command) > width:
+            command = command[: width - 3] + "..."
+        lines.append(
+            [
+                command,
+                str(row["runs"]),
+                f"{row['success_rate']:.0%}",
+                f"{row['timeout_rate']:.0%}",
+                f"{row['near_timeout_rate']:.0%}",
+                f"{row['retry_rate']:.0%}",
+                format_stats_duration(row["p50"]),
+                format_stats_duration(row["p90"]),
+                format_stats_duration(row["p99"]),
+                format_bytes(row["peak_rss"]) if row["peak_rss"] else "-",
+            ]
+        )
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(
+            cell.ljust(widths[i]) if i == 0 else cell.rjust(widths[i])
+            for i, cell in enumerate(line)
+        ).rstrip()
+        for line in lines
+    )
+
+
+def handle_stats(argv):
+    """Handle the 'ptimeout stats' command."""
+    import argparse
+    import json
+
+    from ptimeout_history import STATS_ORDER, HistoryStore, history_path, parse_window
+
+    parser = argparse.ArgumentParser(
+        description="Show per-command statistics from the run history",
+        epilog="Every completed run is recorded; set history = off in the config\n"
+        "file to stop recording (runs with an auto timeout are still recorded).",
+        formatter_class=argparse.RawTextHelpFormatter,
+        usage="%(prog)s stats [OPTIONS]",
+    )
+
+    parser.add_argument(
+        "--since",
+        type=str,
+        help="Only runs started since then: an age (e.g., '24h', '7d') or a date",
+    )
+
+    parser.add_argument(
+        "--until",
+        type=str,
+        help="Only runs started before then: an age (e.g., '1h') or a date",
+    )
+
+    parser.add_argument(
+        "--command",
+        type=str,
+        help="Only commands matching this glob (e.g., 'rsync *')",
+    )
+
+    parser.add_argument(
+        "--sort",
+        type=str,
+        choices=list(STATS_ORDER),
+        default="runs",
+        help="Sort order (default: runs). 'near-timeout' lists the commands\n"
+        "that most often used 80%% or more of their timeout first",
+    )
+
+    parser.add_argument(
+        "--limit", type=int, default=50, help="Show at most N commands (default: 50)"
+    )
+
+    parser.add_argument("--json", action="store_true", help="Print JSON")
+
+    args = parser.parse_args(argv)
+
+    try:
+        since = parse_window(args.since) if args.since else None
+        until = parse_window(args.until) if args.until else None
+        if not os.path.exists(history_path()):
+            rows = []
+        else:
+            with HistoryStore() as store:
+                rows = store.command_stats(
+                    since=since,
+                    until=until,
+                    command=args.command,
+                    sort=args.sort,
+                    limit=args.limit,
+                )
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"Unexpected error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps({"since": since, "until": until, "commands": rows}, indent=2))
+    elif rows:
+        print(format_stats_table(rows))
+    else:
+        print(
+            "No runs recorded. Runs are recorded unless the config file sets history = off.",
+            file=sys.stderr,
+        )
+
+
+def get_progress_columns(style, count_direction, show_gauges=False):
     """
     Generate progress columns based on the selected style.
 
     Args:
         style: Progress bar style ('unicode', 'ascii', 'minimal', 'fancy')
         count_direction: 'up' or 'down' for elapsed/remaining time
+        show_gauges: Add a column for the task's 'gauges' field (throughput, CPU, RSS)
 
     Returns:
         list: Rich progress column configuration
@@ -1244,6 +3255,9 @@ def get_progress_columns(style, count_direction):
     else:
         progress_columns.append(TimeElapsedColumn())
 
+    if show_gauges:
+        progress_columns.append(TextColumn("[dim]{task.fields[gauges]}"))
+
     return progress_columns
 
 
@@ -1254,108 +3268,63 @@ def get_version():
             os.path.join(os.path.dirname(__file__), "..", "version.txt"), "r"
         ) as f:
             return f.read().strip()
-    except FileNotFoundError:
+    except OSError:  # Also NotADirectoryError when running from a zipapp
         return "0.0.0"
 
 
-@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
-@click.option(
-    "--version",
-    is_flag=True,
-    callback=lambda ctx, param, value: (click.echo(get_version()) or sys.exit(0))
-    if value
-    else None,
-    expose_value=False,
-    is_eager=True,
-    help="Show version and exit.",
-)
-@click.option("--config", type=str, help="Path to configuration file.")
-@click.option("-v", "--verbose", is_flag=True, help="Enable verbose output.")
-@click.option(
-    "-r",
-    "--retries",
-    type=int,
-    default=0,
-    help="Max number of times to retry the command upon failure. Defaults to 0.",
-)
-@click.option(
-    "-d",
-    "--count-direction",
-    type=click.Choice(["up", "down"]),
-    default="up",
-    help="Specify count direction: 'up' to count elapsed time (default), 'down' to count remaining time.",
-)
-@click.option(
-    "--progress-style",
-    type=click.Choice(["unicode", "ascii", "minimal", "fancy"]),
-    default="unicode",
-    help="Progress bar style: 'unicode' (default), 'ascii', 'minimal', 'fancy'.",
-)
-@click.option(
-    "--dry-run",
-    is_flag=True,
-    help="Print the command that would be executed without actually running it.",
-)
-@click.option(
-    "-b",
-    "--background",
-    is_flag=True,
-    help="Run the command in the background and print the process ID.",
-)
-@click.option(
-    "--stdout",
-    type=str,
-    help="Redirect stdout to the specified file (useful with --background).",
-)
-@click.option(
-    "--stderr",
-    type=str,
-    help="Redirect stderr to the specified file (useful with --background).",
-)
-@click.argument("timeout_arg", type=str)
-@click.argument("command", nargs=-1, required=False)
-def main(
+def run_cli(
     config,
     verbose,
     retries,
     count_direction,
     progress_style,
+    max_fps,
+    timeout_option,
+    backoff,
+    backoff_factor,
+    kill_signal,
+    kill_after,
     dry_run,
     background,
     stdout,
     stderr,
+    cache,
+    cache_env,
+    singleflight,
+    lock,
+    max_concurrent,
+    count_wait,
+    rate,
+    circuit_breaker,
+    breaker_window,
+    breaker_cooldown,
+    deadline_fd,
+    events_fd,
+    events_file,
+    progress_fd,
+    progress_interval,
+    control_socket,
+    adjust_step,
+    heartbeat,
+    heartbeat_pattern,
+    sd_notify,
+    ready_pattern,
     timeout_arg,
     command,
+    argv_checked=False,
+    given=(),
 ):
-    """Run a command with a time-based progress bar, or process piped input with a timeout.
-
-    TIMEOUT: The maximum execution time. Use optional suffixes: s (seconds), m (minutes), h (hours). E.g., '10s', '5m', '1h'. Can be set in config file.
-
-    COMMAND: The command and its arguments to run. Precede with "--" to separate from ptimeout options.
     """
+    Validate the parsed CLI arguments, apply config defaults and run the command.
 
-    # Check if this is a systemd generate command
-    if len(sys.argv) >= 2 and sys.argv[1] == "systemd":
-        if len(sys.argv) >= 3 and sys.argv[2] == "generate":
-            handle_systemd_generate()
-            return
+    argv_checked is set by main()'s fast path, which has already established that
+    sys.argv is exactly `TIMEOUT -- COMMAND...`, so the separator checks are skipped.
+    given names the options set on the command line; the config only fills in the rest.
+    """
 
     # Register signal handlers for graceful termination
     register_signal_handlers()
 
-    # Load configuration from file (using CLI config if provided)
-    loaded_config = load_config(config)
-
-    # Apply config defaults if not specified via CLI
-    if not verbose and loaded_config.get("verbose"):
-        verbose = loaded_config["verbose"]
-    if retries == 0 and loaded_config.get("retries"):
-        retries = loaded_config["retries"]
-    if count_direction == "up" and loaded_config.get("countdown_direction"):
-        count_direction = loaded_config["countdown_direction"]
-    if progress_style == "unicode" and loaded_config.get("progress_style"):
-        progress_style = loaded_config["progress_style"]
-
     # Check if stdin is being piped (has actual data)
     is_piped_input = not sys.stdin.isatty()
     piped_stdin_data = None
@@ -1370,22 +3339,89 @@ def main(
     # Determine command_args from click's command tuple
     command_args = list(command) if command else []
 
-    # Check for nested ptimeout - need to handle multiple '--' separators
-    # For nested commands, we need to look at the original sys.argv since click consumes separators
-    separator_indices = [i for i, arg in enumerate(sys.argv) if arg == "--"]
-    if len(separator_indices) == 2:
-        # This is a nested ptimeout command - extract outer command correctly
-        first_separator = separator_indices[0]
-        second_separator = separator_indices[1]
-
-        # The command for outer ptimeout is everything between first and second '--' INCLUDING the second '--' and what follows
-        # This should be: ['python', 'ptimeout.py', '5s', '--', 'echo', 'nested test']
-        outer_command = sys.argv[first_separator + 1 :]
-        command_args = outer_command
+    if argv_checked:
+        separator_indices = None
     else:
-        # Handle the case where command starts with "--" (single separator case)
-        if command_args and command_args[0] == "--":
-            command_args = command_args[1:]
+        # Check for nested ptimeout - need to handle multiple '--' separators
+        # For nested commands, we need to look at the original sys.argv since click consumes separators
+        separator_indices = [i for i, arg in enumerate(sys.argv) if arg == "--"]
+        if len(separator_indices) == 2:
+            # This is a nested ptimeout command - extract outer command correctly
+            first_separator = separator_indices[0]
+            second_separator = separator_indices[1]
+
+            # The command for outer ptimeout is everything between first and second '--' INCLUDING the second '--' and what follows
+            # This should be: ['python', 'ptimeout.py', '5s', '--', 'echo', 'nested test']
+            outer_command = sys.argv[first_separator + 1 :]
+            command_args = outer_command
+        else:
+            # Handle the case where command starts with "--" (single separator case)
+            if command_args and command_args[0] == "--":
+                command_args = command_args[1:]
+
+            # `ptimeout [OPTIONS] -- COMMAND` leaves the timeout to the config;
+            # click then takes the program name for TIMEOUT
+            if separator_indices and timeout_arg is not None:
+                first_separator = separator_indices[0]
+                if (
+                    sys.argv[first_separator + 1 :][:1] == [timeout_arg]
+                    and timeout_arg not in sys.argv[1:first_separator]
+                ):
+                    command_args = [timeout_arg] + command_args
+                    timeout_arg = None
+
+    # Load configuration from file (using CLI config if provided), then fill in
+    # every option not given on the command line from [defaults] and the
+    # [profile:NAME] section matching the command, if any
+    settings, profile_name = resolve_settings(load_config(config), command_args)
+    options = {
+        "verbose": verbose,
+        "retries": retries,
+        "count_direction": count_direction,
+        "progress_style": progress_style,
+        "max_fps": max_fps,
+        "backoff": backoff,
+        "backoff_factor": backoff_factor,
+        "kill_signal": kill_signal,
+        "kill_after": kill_after,
+        "dry_run": dry_run,
+        "background": background,
+        "stdout": stdout,
+        "stderr": stderr,
+        "cache": cache,
+        "cache_env": cache_env,
+        "singleflight": singleflight,
+        "lock": lock,
+        "max_concurrent": max_concurrent,
+        "count_wait": count_wait,
+        "rate": rate,
+        "circuit_breaker": circuit_breaker,
+        "breaker_window": breaker_window,
+        "breaker_cooldown": breaker_cooldown,
+        "deadline_fd": deadline_fd,
+        "events_fd": events_fd,
+        "events_file": events_file,
+        "progress_fd": progress_fd,
+        "progress_interval": progress_interval,
+        "control_socket": control_socket,
+        "adjust_step": adjust_step,
+        "heartbeat": heartbeat,
+        "heartbeat_pattern": heartbeat_pattern,
+        "sd_notify": sd_notify,
+        "ready_pattern": ready_pattern,
+    }
+    for key, value in settings.items():
+        if key not in given:
+            options[key] = value
+    verbose = options["verbose"]
+    retries = options["retries"]
+    count_direction = options["count_direction"]
+    progress_style = options["progress_style"]
+    max_fps = options["max_fps"]
+    dry_run = options["dry_run"]
+    background = options["background"]
+    stdout = options["stdout"]
+    stderr = options["stderr"]
 
     # Handle dry-run mode (before validation to avoid issues with nested commands)
     if dry_run:
@@ -1433,57 +3469,547 @@ def main(
     try:
         validate_retries(retries)
     except ValueError as e:
-        click.echo(f"Error: {e}", err=True)
+        print(f"Error: {e}", file=sys.stderr)
         sys.exit(EXIT_PTIMEOUT_ERROR)
 
     # Validate command separators
     try:
         # For nested commands (2 separators), skip full validation since each command will be validated separately
-        if len(separator_indices) != 2:
+        # --timeout or a timeout from the config may stand in for the TIMEOUT argument
+        if (
+            separator_indices is not None
+            and len(separator_indices) != 2
+            and (
+                timeout_arg is not None
+                or (timeout_option is None and "timeout" not in settings)
+            )
+        ):
             validate_command_separators(sys.argv, is_piped_input)
     except ValueError as e:
-        click.echo(f"Error: {e}", err=True)
+        print(f"Error: {e}", file=sys.stderr)
         sys.exit(EXIT_PTIMEOUT_ERROR)
 
     if not command_args:
-        click.echo(
-            "Error: The 'COMMAND' argument is required, preceded by '--'.", err=True
+        print(
+            "Error: The 'COMMAND' argument is required, preceded by '--'.",
+            file=sys.stderr,
         )
         sys.exit(EXIT_PTIMEOUT_ERROR)
 
     # Validate timeout_arg
-    # If timeout_arg is None, try to get from config
+    # If timeout_arg is None, try --timeout and then the config
+    if timeout_arg is not None and timeout_option is not None:
+        print(
+            "Error: Give the timeout either as TIMEOUT or with --timeout, not both.",
+            file=sys.stderr,
+        )
+        sys.exit(EXIT_PTIMEOUT_ERROR)
+    if timeout_arg is None:
+        timeout_arg = timeout_option
     if timeout_arg is None:
-        timeout_arg = loaded_config.get("timeout")
+        timeout_arg = settings.get("timeout")
 
     if timeout_arg is None:
-        click.echo(
+        print(
             "Error: The 'TIMEOUT' argument is required (either on command line or in config file).",
-            err=True,
+            file=sys.stderr,
         )
         sys.exit(EXIT_PTIMEOUT_ERROR)
 
     try:
-        timeout_seconds = parse_timeout(timeout_arg)
+        if timeout_arg.strip().startswith("auto"):
+            # Derived from this command's recorded run times
+            percentile, factor = parse_auto_timeout(timeout_arg)
+            from ptimeout_history import DEFAULT_AUTO_FALLBACK, auto_timeout
+
+            timeout_seconds, samples = auto_timeout(
+                command_args,
+                percentile,
+                factor,
+                fallback=settings.get("auto_fallback", DEFAULT_AUTO_FALLBACK),
+            )
+            if verbose:
+                basis = (
+                    f"p{percentile:g} of {samples} runs x {factor:g}"
+                    if samples
+                    else "not enough history, using the fallback"
+                )
+                print(
+                    f"Automatic timeout: {timeout_seconds}s ({basis})", file=sys.stderr
+                )
+        else:
+            timeout_seconds = parse_timeout(timeout_arg)
+        # Durations from the command line are strings; config values are parsed
+        (
+            backoff,
+            kill_after,
+            cache_ttl,
+            breaker_window,
+            breaker_cooldown,
+            progress_interval,
+            adjust_step,
+            heartbeat_interval,
+        ) = (
+            parse_timeout(value) if isinstance(value, str) else value
+            for value in (
+                options["backoff"],
+                options["kill_after"],
+                options["cache"],
+                options["breaker_window"],
+                options["breaker_cooldown"],
+                options["progress_interval"],
+                options["adjust_step"],
+                options["heartbeat"],
+            )
+        )
+        if progress_interval == 0:
+            raise ValueError("--progress-interval must be at least 1s.")
+        if heartbeat_interval == 0:
+            raise ValueError("--heartbeat must be at least 1s.")
+        heartbeat_pattern = None
+        if options["heartbeat_pattern"]:
+            if not heartbeat_interval:
+                raise ValueError("--heartbeat-pattern needs --heartbeat DURATION.")
+            heartbeat_pattern = compile_output_pattern(
+                options["heartbeat_pattern"], "--heartbeat-pattern"
+            )
+        ready_pattern = None
+        if options["ready_pattern"]:
+            if not options["sd_notify"]:
+                raise ValueError("--ready-pattern needs --sd-notify.")
+            ready_pattern = compile_output_pattern(
+                options["ready_pattern"], "--ready-pattern"
+            )
+        kill_signal = options["kill_signal"] or DEFAULT_KILL_SIGNAL
+        if kill_signal != DEFAULT_KILL_SIGNAL:
+            parse_signal(kill_signal)
+        if options["lock"]:
+            from ptimeout_sync import validate_name
+
+            validate_name(options["lock"])
+        elif max_concurrent is not None:
+            raise ValueError("--max-concurrent needs a lock name: --lock NAME.")
+        rate_limit = parse_rate(options["rate"]) if options["rate"] else None
+        if options["events_fd"] is not None and options["events_file"]:
+            raise ValueError("Give either --events-fd or --events-file, not both.")
     except ValueError as e:
-        click.echo(f"Error: {e}", err=True)
+        print(f"Error: {e}", file=sys.stderr)
         sys.exit(EXIT_PTIMEOUT_ERROR)
 
-    exit_code = run_command(
-        command_args,
-        timeout_seconds,
-        retries,
-        count_direction,
-        piped_stdin_data,
-        verbose,
-        background=background,
-        stdout_file=stdout,
-        stderr_file=stderr,
-        progress_style=progress_style,
+    events = None
+    if options["events_fd"] is not None or options["events_file"]:
+        from ptimeout_events import EventStream
+
+        try:
+            events = EventStream.open(options["events_fd"], options["events_file"])
+        except OSError as e:
+            print(f"Error: Cannot write events: {e}", file=sys.stderr)
+            sys.exit(EXIT_PTIMEOUT_ERROR)
+
+    progress_stream = None
+    if options["progress_fd"] is not None:
+        from ptimeout_events import EventStream
+
+        try:
+            progress_stream = EventStream.open(options["progress_fd"])
+        except OSError as e:
+            print(f"Error: Cannot write progress: {e}", file=sys.stderr)
+            sys.exit(EXIT_PTIMEOUT_ERROR)
+
+    # SIGUSR1/SIGUSR2 and the control socket move the deadline while we run
+    from ptimeout_control import DeadlineControl
+
+    control = DeadlineControl(
+        DEFAULT_ADJUST_STEP if adjust_step is None else adjust_step,
+        parse_timeout,
+        options["control_socket"],
+    )
+    heartbeat = None
+    if heartbeat_interval:
+        from ptimeout_heartbeat import Heartbeat
+
+        heartbeat = Heartbeat(heartbeat_interval, heartbeat_pattern)
+    notifier = None
+    if options["sd_notify"]:
+        from ptimeout_notify import Notifier
+
+        notifier = Notifier.from_environment(ready_pattern)
+        if notifier is None and verbose:
+            print(
+                "--sd-notify: NOTIFY_SOCKET is not set; not notifying", file=sys.stderr
+            )
+
+    if verbose and profile_name:
+        print(f"Using config profile: {profile_name}", file=sys.stderr)
+
+    # Run inside another ptimeout's command: its deadline bounds ours
+    deadline = inherited_deadline()
+    if verbose and deadline is not None:
+        remaining = deadline - time.time()
+        if remaining < timeout_seconds:
+            print(
+                f"Timeout clamped to the enclosing ptimeout's deadline: {max(remaining, 0):.1f}s left",
+                file=sys.stderr,
+            )
+
+    # Keep a record of the run for `ptimeout stats` and automatic timeouts,
+    # unless the config turns it off; runs with an auto timeout always count
+    record_history = settings.get("history", True) or timeout_arg.strip().startswith(
+        "auto"
     )
+    summary = {} if record_history else None
+    try:
+        exit_code = run_command(
+            command_args,
+            timeout_seconds,
+            retries,
+            count_direction,
+            piped_stdin_data,
+            verbose,
+            background=background,
+            stdout_file=stdout,
+            stderr_file=stderr,
+            progress_style=progress_style,
+            max_fps=max_fps,
+            backoff=DEFAULT_BACKOFF if backoff is None else backoff,
+            backoff_factor=options["backoff_factor"] or DEFAULT_BACKOFF_FACTOR,
+            kill_signal=kill_signal,
+            kill_after=DEFAULT_KILL_AFTER if kill_after is None else kill_after,
+            summary=summary,
+            cache_ttl=cache_ttl,
+            cache_env=options["cache_env"],
+            cache_max_size=settings.get("cache_max_size"),
+            singleflight=options["singleflight"],
+            lock_name=options["lock"],
+            max_concurrent=options["max_concurrent"] or 1,
+            count_wait=options["count_wait"],
+            rate_limit=rate_limit,
+            circuit_breaker=(
+                (
+                    options["circuit_breaker"],
+                    (
+                        DEFAULT_BREAKER_WINDOW
+                        if breaker_window is None
+                        else breaker_window
+                    ),
+                    (
+                        DEFAULT_BREAKER_COOLDOWN
+                        if breaker_cooldown is None
+                        else breaker_cooldown
+                    ),
+                )
+                if options["circuit_breaker"]
+                else None
+            ),
+            deadline=deadline,
+            deadline_fd=options["deadline_fd"],
+            events=events,
+            progress_stream=progress_stream,
+            progress_interval=(
+                DEFAULT_PROGRESS_INTERVAL
+                if progress_interval is None
+                else progress_interval
+            ),
+            control=control,
+            heartbeat=heartbeat,
+            notifier=notifier,
+        )
+    finally:
+        control.close()
+        if heartbeat:
+            heartbeat.close()
+    if notifier:
+        notifier.stopping(f"Command exited with code {exit_code}")
+        notifier.close()
+
+    if summary:
+        from ptimeout_history import record_run
+
+        record_run(command_args, summary, timeout_seconds)
     sys.exit(exit_code)
 
 
+def parse_common_argv(argv):
+    """
+    Recognize the common `TIMEOUT -- COMMAND [ARGS...]` invocation without click.
+
+    Args:
+        argv: Command line arguments without the program name
+
+    Returns:
+        tuple: (timeout_arg, command) for exactly that shape, or None if argv uses
+               options, nested separators or anything else the full parser handles
+    """
+    if len(argv) < 3 or argv[1] != "--" or argv[0].startswith("-"):
+        return None
+    command = argv[2:]
+    if "--" in command:
+        return None  # Possibly a nested ptimeout; leave it to the full parser
+    return argv[0], command
+
+
+def build_cli():
+    """
+    Build the click command for the full CLI.
+
+    click is comparatively expensive to import, so it is only loaded here, after
+    main() has handled the cases that do not need it.
+    """
+    import click
+
+    @click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+    @click.option(
+        "--version",
+        is_flag=True,
+        callback=lambda ctx, param, value: (click.echo(get_version()) or sys.exit(0))
+        if value
+        else None,
+        expose_value=False,
+        is_eager=True,
+        help="Show version and exit.",
+    )
+    @click.option("--config", type=str, help="Path to configuration file.")
+    @click.option("-v", "--verbose", is_flag=True, help="Enable verbose output.")
+    @click.option(
+        "-r",
+        "--retries",
+        type=int,
+        default=CLI_DEFAULTS["retries"],
+        help="Max number of times to retry the command upon failure. Defaults to 0.",
+    )
+    @click.option(
+        "-d",
+        "--count-direction",
+        type=click.Choice(["up", "down"]),
+        default=CLI_DEFAULTS["count_direction"],
+        help="Specify count direction: 'up' to count elapsed time (default), 'down' to count remaining time.",
+    )
+    @click.option(
+        "--progress-style",
+        type=click.Choice(PROGRESS_STYLES),
+        default=CLI_DEFAULTS["progress_style"],
+        help="Progress bar style: 'unicode' (default), 'ascii', 'minimal', 'fancy'.",
+    )
+    @click.option(
+        "--max-fps",
+        type=click.IntRange(MIN_FPS, 120),
+        default=CLI_DEFAULTS["max_fps"],
+        show_default=True,
+        help="Maximum UI refresh rate in interactive mode. Rendering slows down automatically under heavy output.",
+    )
+    @click.option(
+        "-t",
+        "--timeout",
+        "timeout_option",
+        type=str,
+        help="Timeout, instead of the TIMEOUT argument. 'auto[:pNN][*FACTOR]' derives it from this command's past run times (default auto:p99*1.5).",
+    )
+    @click.option(
+        "--backoff",
+        type=str,
+        help="Delay before the first retry, e.g. '5s'. Defaults to 1s.",
+    )
+    @click.option(
+        "--backoff-factor",
+        type=click.FloatRange(min=1),
+        help="Multiply the retry delay by this much after each retry. Defaults to 1.",
+    )
+    @click.option(
+        "-s",
+        "--signal",
+        "kill_signal",
+        type=str,
+        help="Signal to send when the timeout is reached, e.g. TERM. Defaults to KILL.",
+    )
+    @click.option(
+        "-k",
+        "--kill-after",
+        type=str,
+        help="With --signal, also send KILL if the command is still running this long after the timeout. Defaults to 5s.",
+    )
+    @click.option(
+        "--dry-run",
+        is_flag=True,
+        help="Print the command that would be executed without actually running it.",
+    )
+    @click.option(
+        "-b",
+        "--background",
+        is_flag=True,
+        help="Run the command in the background and print the process ID.",
+    )
+    @click.option(
+        "--stdout",
+        type=str,
+        help="Redirect stdout to the specified file (useful with --background).",
+    )
+    @click.option(
+        "--stderr",
+        type=str,
+        help="Redirect stderr to the specified file (useful with --background).",
+    )
+    @click.option(
+        "--cache",
+        type=str,
+        help="Replay the output and exit code of an identical successful run from within this long ago (e.g. '10m') instead of running again.",
+    )
+    @click.option(
+        "--cache-env",
+        type=str,
+        multiple=True,
+        help="With --cache, also tell runs apart by this environment variable. Repeatable.",
+    )
+    @click.option(
+        "--singleflight",
+        is_flag=True,
+        help="If an identical command (as for --cache) is already running under ptimeout, wait for it and share its output and exit code instead of running it again.",
+    )
+    @click.option(
+        "--lock",
+        type=str,
+        help="Share a concurrency limit with every ptimeout using the same lock NAME on this host; wait in line for a free slot before running.",
+    )
+    @click.option(
+        "--max-concurrent",
+        type=click.IntRange(min=1),
+        help="With --lock, how many may run at once. Defaults to 1.",
+    )
+    @click.option(
+        "--rate",
+        type=str,
+        help="Pace launches host-wide through the token bucket NAME, e.g. 'api:5/s' (or N/m, N/h, with an optional :BURST, default 1).",
+    )
+    @click.option(
+        "--circuit-breaker",
+        type=click.IntRange(min=1),
+        help="After this many failures or timeouts in a row of this command (by any ptimeout on this host), stop running it and exit with code 75 until a probe run succeeds.",
+    )
+    @click.option(
+        "--breaker-window",
+        type=str,
+        help="With --circuit-breaker, only failures within this long of the first count as in a row. Defaults to 10m.",
+    )
+    @click.option(
+        "--breaker-cooldown",
+        type=str,
+        help="With --circuit-breaker, how long an open circuit waits before letting one probe run through. Defaults to 30s.",
+    )
+    @click.option(
+        "--deadline-fd",
+        is_flag=True,
+        help="Give the command a pipe, numbered in $PTIMEOUT_DEADLINE_FD, that reaches EOF when its deadline passes. $PTIMEOUT_DEADLINE always holds the deadline.",
+    )
+    @click.option(
+        "--events-fd",
+        type=click.IntRange(min=0),
+        help="Write what happens during the run (spawned, first_output, timed_out, exited, ...) to this open file descriptor as JSON lines.",
+    )
+    @click.option(
+        "--events-file",
+        type=str,
+        help="Like --events-fd, but append the events to this file.",
+    )
+    @click.option(
+        "--progress-fd",
+        type=click.IntRange(min=0),
+        help="Write a progress record (elapsed, remaining, attempt, output bytes) to this open file descriptor every --progress-interval, as JSON lines.",
+    )
+    @click.option(
+        "--progress-interval",
+        type=str,
+        help="How often --progress-fd gets a record (e.g., 5s). Default: 1s.",
+    )
+    @click.option(
+        "--control-socket",
+        type=str,
+        help="Accept 'extend DURATION', 'shorten DURATION', 'kill-now' and 'status' on a Unix socket at this path while the command runs.",
+    )
+    @click.option(
+        "--adjust-step",
+        type=str,
+        help="How much SIGUSR1 adds to and SIGUSR2 takes from the running attempt's timeout (e.g., 10m). Default: 5m.",
+    )
+    @click.option(
+        "--heartbeat",
+        type=str,
+        help="Stop the command once it has not checked in for this long (e.g., 30s), through PTIMEOUT_HEARTBEAT_FD, a WATCHDOG=1 datagram to NOTIFY_SOCKET or --heartbeat-pattern. TIMEOUT stays the hard maximum.",
+    )
+    @click.option(
+        "--heartbeat-pattern",
+        type=str,
+        help="With --heartbeat, an output line matching this regular expression also counts as a heartbeat.",
+    )
+    @click.option(
+        "--sd-notify",
+        is_flag=True,
+        help="Report readiness (READY=1), liveness (WATCHDOG=1) and the time left (STATUS=) to systemd through $NOTIFY_SOCKET, for Type=notify services.",
+    )
+    @click.option(
+        "--ready-pattern",
+        type=str,
+        help="With --sd-notify, send READY=1 once an output line matches this regular expression instead of as soon as the command starts.",
+    )
+    @click.option(
+        "--count-wait",
+        is_flag=True,
+        help="Count time spent waiting for --lock or --rate against the timeout.",
+    )
+    @click.argument("timeout_arg", type=str)
+    @click.argument("command", nargs=-1, required=False)
+    def cli(**params):
+        """Run a command with a time-based progress bar, or process piped input with a timeout.
+
+        TIMEOUT: The maximum execution time. Use optional suffixes: s (seconds), m (minutes), h (hours). E.g., '10s', '5m', '1h', or 'auto' to derive it from past runs, which are recorded unless the config file sets history = off. Can be set in config file, in which case it may be left out: ptimeout -- COMMAND.
+
+        COMMAND: The command and its arguments to run. Precede with "--" to separate from ptimeout options.
+        """
+        run_cli(**params, given=given_options(click.get_current_context()))
+
+    return cli
+
+
+def given_options(ctx):
+    """Names of the parameters of click context ctx set on the command line."""
+    from click.core import ParameterSource
+
+    return {
+        name
+        for name in ctx.params
+        if ctx.get_parameter_source(name) is not ParameterSource.DEFAULT
+    }
+
+
+def main():
+    """Entry point. Cheap special cases are dispatched before click is loaded."""
+    argv = sys.argv[1:]
+
+    # Check if this is a systemd generate command
+    if argv[:2] == ["systemd", "generate"]:
+        handle_systemd_generate()
+        return
+
+    if argv[:1] == ["stats"]:
+        handle_stats(argv[1:])
+        return
+
+    # --version among ptimeout's own options (before any '--') needs no parsing
+    options = argv[: argv.index("--")] if "--" in argv else argv
+    if "--version" in options:
+        print(get_version())
+        sys.exit(0)
+
+    # The common `ptimeout TIMEOUT -- COMMAND...` form needs no option parsing
+    common_form = parse_common_argv(argv)
+    if common_form:
+        timeout_arg, command = common_form
+        run_cli(
+            timeout_arg=timeout_arg, command=command, argv_checked=True, **CLI_DEFAULTS
+        )
+        return
+
+    build_cli()()
+
+
 if __name__ == "__main__":
     main()
 # Test change Sat 24 Jan 2026 12:47:43 AM EST
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+ptimeout result cache - Replay the output of a recent identical run instead of running again.
+
+ptimeout.py imports this module only when --cache is given. Output is stored
+content-addressed under objects/, so identical outputs of different commands
+share one file; entries/ maps a run's key to its exit code and output digests.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+# Results live next to the config cache, following the XDG Base Directory Specification
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "ptimeout"
+)
+RESULTS_DIR = "results"
+
+# Total size of stored output before the least recently used is evicted (bytes)
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# Bumped whenever the key or entry format changes, so old entries never match
+CACHE_VERSION = 1
+
+
+def results_path():
+    cache_dir = os.environ.get("PTIMEOUT_CACHE_DIR", DEFAULT_CACHE_DIR)
+    return os.path.join(cache_dir, RESULTS_DIR)
+
+
+def digest(data):
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def run_key(command_args, stdin_data=None, env_names=(), cwd=None):
+    """
+    Identify a run by its arguments, working directory, the named
+    environment variables and the bytes fed to its stdin.
+
+    Shared with singleflight, which uses it to recognize identical runs.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"ptimeout-cache-{CACHE_VERSION}\0".encode())
+    for arg in command_args:
+        h.update(arg.encode("utf-8", "surrogateescape") + b"\0")
+    h.update(b"\1" + (cwd or os.getcwd()).encode("utf-8", "surrogateescape"))
+    for name in sorted(env_names):
+        value = os.environ.get(name)
+        # Unset and empty are different environments
+        marker = (
+            b"\1" if value is None else b"=" + value.encode("utf-8", "surrogateescape")
+        )
+        h.update(b"\1" + name.encode("utf-8", "surrogateescape") + marker)
+    h.update(b"\2" + (stdin_data or b""))
+    return h.hexdigest()
+
+
+def write_atomically(path, data):
+    """Write data to path via a temporary file, so readers never see half of it."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ResultCache:
+    """Stored exit codes and output of successful runs, bounded by max_size."""
+
+    def __init__(self, path=None, max_size=None):
+        self.path = path or results_path()
+        self.max_size = DEFAULT_MAX_SIZE if max_size is None else max_size
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, "entries", key[:2], key)
+
+    def _object_path(self, object_digest):
+        return os.path.join(self.path, "objects", object_digest[:2], object_digest)
+
+    def lookup(self, key, ttl, now=None):
+        """
+        The stored result for key if it is younger than ttl seconds.
+
+        Returns:
+            dict: exit_code, stdout and stderr (bytes) and created (Unix time),
+                  or None on a miss
+        """
+        now = time.time() if now is None else now
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "rb") as f:
+                entry = json.loads(f.read())
+            if entry["created"] + ttl <= now:
+                return None
+            result = {"exit_code": entry["exit_code"], "created": entry["created"]}
+            for stream in ("stdout", "stderr"):
+                object_path = self._object_path(entry[stream])
+                with open(object_path, "rb") as f:
+                    result[stream] = f.read()
+                os.utime(object_path)  # Recently used, evicted last
+        except FileNotFoundError:
+            if os.path.exists(entry_path):
+                # Its output was evicted; the entry is useless now
+                self._remove(entry_path)
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return result
+
+    def store(self, key, exit_code, stdout, stderr, now=None):
+        """Store a result, then evict the least recently used output if over max_size."""
+        entry = {
+            "created": time.time() if now is None else now,
+            "exit_code": exit_code,
+        }
+        for stream, data in (("stdout", stdout), ("stderr", stderr)):
+            object_digest = digest(data)
+            object_path = self._object_path(object_digest)
+            if os.path.exists(object_path):
+                os.utime(object_path)
+            else:
+                write_atomically(object_path, data)
+            entry[stream] = object_digest
+        write_atomically(self._entry_path(key), json.dumps(entry).encode())
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used objects until they fit in max_size."""
+        objects = []
+        for path in self._files("objects"):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            objects.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in objects)
+        if total <= self.max_size:
+            return
+
+        evicted = set()
+        for _, size, path in sorted(objects):
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            evicted.add(os.path.basename(path))
+            total -= size
+
+        # Entries pointing at evicted output can never hit again
+        for path in self._files("entries"):
+            try:
+                with open(path, "rb") as f:
+                    entry = json.loads(f.read())
+                stale = entry["stdout"] in evicted or entry["stderr"] in evicted
+            except (OSError, ValueError, KeyError, TypeError):
+                stale = True
+            if stale:
+                self._remove(path)
+
+    def _files(self, kind):
+        root = os.path.join(self.path, kind)
+        try:
+            shards = list(os.scandir(root))
+        except OSError:
+            return
+        for shard in shards:
+            try:
+                for item in os.scandir(shard.path):
+                    if not item.name.endswith(".tmp"):
+                        yield item.path
+            except OSError:
+                continue
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
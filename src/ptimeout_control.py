@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+ptimeout control - Moving the deadline of a running ptimeout.
+
+SIGUSR1 adds the adjustment step to the running attempt's timeout and
+SIGUSR2 takes it away. With a control socket, a Unix stream socket also
+accepts one command per connection and answers with one JSON line:
+
+    extend DURATION     Add DURATION to the running attempt's timeout
+    shorten DURATION    Take DURATION away from it
+    kill-now            Stop the command now, as if its time was up; no retries
+    status              The attempt, its timeout, elapsed and remaining time
+
+The supervision loop owns the deadline: it waits on wakeup_fds() along with
+the child and applies the change collected by poll() to its own timeout, so
+moving the deadline costs nothing until something actually arrives.
+"""
+
+import os
+import signal
+import time
+
+# Longest command line accepted on the control socket
+MAX_COMMAND_SIZE = 256
+# How long a client gets to send its whole command (seconds)
+CLIENT_TIMEOUT = 1.0
+
+
+class DeadlineControl:
+    """Deadline changes requested from outside, for the supervision loop to apply."""
+
+    def __init__(self, step, parse_duration, path=None):
+        self.step = step
+        self.parse_duration = parse_duration
+        self.path = path
+        # Seconds added so far, and how much of that the loop has applied.
+        # Signal handlers only ever add to adjusted, so none is lost.
+        self.adjusted = 0.0
+        self.applied = 0.0
+        self.kill_now = False
+        self.attempt = None  # What `status` reports; kept up to date by run_command
+        self.server = None
+        self.clients = {}  # Connected client socket -> [bytes so far, when to give up]
+        self.wakeup_reader = self.wakeup_writer = None
+
+    def start(self):
+        """
+        Take SIGUSR1/SIGUSR2 and open the control socket, if there is one.
+
+        Raises:
+            OSError: If the socket cannot be created, or another ptimeout is
+                     listening on it
+        """
+        self.wakeup_reader, self.wakeup_writer = os.pipe()
+        os.set_blocking(self.wakeup_reader, False)
+        os.set_blocking(self.wakeup_writer, False)
+        signal.signal(signal.SIGUSR1, self._signal)
+        signal.signal(signal.SIGUSR2, self._signal)
+        if self.path:
+            self.server = self._listen(self.path)
+
+    @staticmethod
+    def _listen(path):
+        import socket
+
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                os.unlink(path)  # Left behind by a ptimeout that is gone
+            else:
+                raise OSError(f"{path} is in use by another ptimeout")
+            finally:
+                probe.close()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(path)
+            server.listen(4)
+        except OSError:
+            server.close()
+            raise
+        server.setblocking(False)
+        return server
+
+    def _signal(self, signum, frame):
+        self.adjust(self.step if signum == signal.SIGUSR1 else -self.step)
+
+    def adjust(self, seconds):
+        self.adjusted += seconds
+        if self.wakeup_writer is None:
+            return  # Closed; the run is over
+        try:
+            os.write(self.wakeup_writer, b"\0")
+        except OSError:
+            pass  # Already awake
+
+    def wakeup_fds(self):
+        """File descriptors that become readable when there is something to poll()."""
+        fds = [self.wakeup_reader]
+        if self.server:
+            fds.append(self.server.fileno())
+        fds.extend(client.fileno() for client in self.clients)
+        return fds
+
+    def poll(self):
+        """
+        Take in what control socket clients have sent so far, and answer
+        those whose command is complete. Never waits for a client: a slow
+        one is picked up again on the next poll(), and dropped once it has
+        had CLIENT_TIMEOUT. Returns True if the deadline moved or a kill was
+        requested since the last take().
+        """
+        try:
+            while os.read(self.wakeup_reader, 64):
+                pass
+        except BlockingIOError:
+            pass
+        while self.server:
+            try:
+                client, _ = self.server.accept()
+            except BlockingIOError:
+                break
+            client.setblocking(False)
+            self.clients[client] = [b"", time.time() + CLIENT_TIMEOUT]
+        for client in list(self.clients):
+            self._serve(client)
+        return self.adjusted != self.applied or self.kill_now
+
+    def take(self):
+        """The change in seconds to apply to the running attempt's timeout."""
+        adjusted = self.adjusted
+        delta, self.applied = adjusted - self.applied, adjusted
+        return delta
+
+    def _serve(self, client):
+        """Read what client has sent; answer and hang up once its command is in."""
+        request, expires_at = self.clients[client]
+        try:
+            data = client.recv(MAX_COMMAND_SIZE)
+        except BlockingIOError:
+            data = None
+        except OSError:
+            data = b""  # The client hung up
+        if data:
+            request = self.clients[client][0] = request + data
+        complete = data == b"" or b"\n" in request or len(request) >= MAX_COMMAND_SIZE
+        if not complete and time.time() < expires_at:
+            return  # More to come
+        del self.clients[client]
+        with client:
+            if not complete or not request.strip():
+                return  # Out of time, or never said anything
+            import json  # Only once someone uses the socket; every run has a control
+
+            reply = self.handle(request.decode("utf-8", "replace").strip())
+            try:
+                client.send(json.dumps(reply).encode() + b"\n")
+            except OSError:
+                pass  # The client has gone, or is not reading
+
+    def handle(self, request):
+        """Carry out one control command and return the reply."""
+        command, _, argument = request.partition(" ")
+        argument = argument.strip()
+        try:
+            if command in ("extend", "shorten"):
+                seconds = self.parse_duration(argument)
+                self.adjust(seconds if command == "extend" else -seconds)
+            elif command == "kill-now":
+                self.kill_now = True
+                self.adjust(0)
+            elif command != "status":
+                raise ValueError(
+                    f"Unknown command: '{command}'. Use extend, shorten, kill-now or status."
+                )
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, **self.status()}
+
+    def status(self):
+        if self.attempt is None:
+            return {"running": False}
+        status = dict(self.attempt, running=True)
+        status["timeout"] += self.adjusted - self.applied
+        status["elapsed"] = round(time.time() - status.pop("started"), 3)
+        remaining = 0 if self.kill_now else status["timeout"] - status["elapsed"]
+        status["remaining"] = round(max(remaining, 0), 3)
+        return status
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+        self.clients = {}
+        if self.server:
+            self.server.close()
+            self.server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        for fd in (self.wakeup_reader, self.wakeup_writer):
+            if fd is not None:
+                os.close(fd)
+        self.wakeup_reader = self.wakeup_writer = None
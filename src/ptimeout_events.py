@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+ptimeout events - A newline-delimited JSON record of what happens during a run.
+
+ptimeout.py imports this module only with --events-fd or --events-file.
+Without them the supervision loop only ever checks that there is no stream,
+so no event is built, formatted or written.
+
+Every event is one JSON object on its own line with at least "event" and
+"time" (Unix time). Events, in the order they can occur per attempt:
+attempt_start, spawned, first_output, deadline_warning, signal_sent,
+timed_out, exited, attempt_end and, before the next attempt, retry_scheduled.
+deadline_changed is sent whenever the deadline is moved at runtime.
+
+--progress-fd uses the same format for its periodic progress records.
+
+Writing never blocks the supervision loop: the fd is made non-blocking, and a
+record that does not fit into a full pipe is dropped. The next record written
+carries "dropped", the number of records lost so far.
+"""
+
+import json
+import os
+import resource
+import stat
+import time
+
+
+class EventStream:
+    """Writes events to a file descriptor, one line per event."""
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.dropped = 0  # Records lost to a reader that fell behind
+        self.pending = b""  # The rest of a record only partly written
+
+    @classmethod
+    def open(cls, fd=None, path=None):
+        """
+        Write to the already open fd, or append to the file at path.
+
+        Raises:
+            OSError: If fd is not open or path cannot be opened
+        """
+        if path is not None:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            os.set_blocking(fd, False)  # Our own; a FIFO at path could fill up
+            return cls(fd)
+        return cls(cls._nonblocking(fd))
+
+    @staticmethod
+    def _nonblocking(fd):
+        """
+        A non-blocking fd writing where fd does. fd's own flags are shared
+        with whoever handed it over, so a pipe is reopened rather than
+        changed; a terminal or a file is used as it is.
+
+        Raises:
+            OSError: If fd is not open
+        """
+        mode = os.fstat(fd).st_mode
+        if stat.S_ISFIFO(mode):
+            try:
+                return os.open(f"/proc/self/fd/{fd}", os.O_WRONLY | os.O_NONBLOCK)
+            except OSError:
+                pass  # No /proc, or no reader left
+        if stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode):
+            os.set_blocking(fd, False)
+        return fd
+
+    def emit(self, event, **fields):
+        if self.pending:
+            self.pending = self._write(self.pending)
+        if self.fd is None or self.pending:
+            self.dropped += self.fd is not None
+            return
+        record = {"event": event, "time": round(time.time(), 6), **fields}
+        if self.dropped:
+            record["dropped"] = self.dropped
+        data = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        rest = self._write(data)
+        if rest == data:
+            self.dropped += 1  # The pipe is full; the reader has fallen behind
+        else:
+            self.pending = rest  # Finished before the next record, to keep lines whole
+
+    def _write(self, data):
+        """Write as much of data as fits without blocking; return the rest."""
+        try:
+            while data:
+                data = data[os.write(self.fd, data) :]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.fd = None  # Whoever was reading has gone; stop writing
+            return b""
+        return data
+
+    @staticmethod
+    def usage():
+        """Resources used so far by our waited-for children, for exited()."""
+        return resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    def exited(self, returncode, usage_before, **fields):
+        """
+        Send exited for a child just waited for, with its resource usage:
+        what our children used since usage_before, which covers just that
+        child and the descendants it waited for itself.
+        """
+        usage = self.usage()
+        if returncode < 0:
+            fields.update(code=None, signal=-returncode)
+        else:
+            fields.update(code=returncode, signal=None)
+        self.emit(
+            "exited",
+            **fields,
+            rusage={
+                "utime": round(usage.ru_utime - usage_before.ru_utime, 6),
+                "stime": round(usage.ru_stime - usage_before.ru_stime, 6),
+                "maxrss_kb": usage.ru_maxrss,
+            },
+        )
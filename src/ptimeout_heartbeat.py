@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+ptimeout heartbeat - A rolling watchdog the command keeps resetting.
+
+With --heartbeat, the command is stopped when it has not checked in for the
+heartbeat interval, however much of its timeout is left; the timeout stays
+in place as the hard maximum. The command checks in by any of:
+
+- writing anything to the fd numbered in PTIMEOUT_HEARTBEAT_FD
+- sending a WATCHDOG=1 datagram to NOTIFY_SOCKET, as sd_notify(3) does
+- printing a line that matches --heartbeat-pattern; a carriage return ends
+  a line too, as progress bars redraw with one
+
+ptimeout.py imports this module only with --heartbeat.
+"""
+
+import os
+import re
+import socket
+import time
+
+# Largest datagram read from the notify socket
+MAX_DATAGRAM_SIZE = 4096
+# Longest output line matched against a pattern; the rest of a longer one is ignored
+MAX_LINE_LENGTH = 64 * 1024
+
+# Progress bars redraw with a bare carriage return, so that ends a line too
+LINE_BREAK = re.compile(r"\r\n?|\n")
+
+
+class LineMatcher:
+    """Finds output lines matching a pattern, per stream, as the output arrives."""
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.partial = {}  # Stream name -> pieces of its unfinished last line
+
+    def feed(self, stream_name, data):
+        """Take in a chunk of a stream; True if it completed a matching line."""
+        lines = LINE_BREAK.split(data)
+        pieces = self.partial.setdefault(stream_name, [])
+        if len(lines) == 1:
+            if sum(map(len, pieces)) < MAX_LINE_LENGTH:
+                pieces.append(data)
+            return False
+        lines[0] = "".join(pieces) + lines[0]
+        self.partial[stream_name] = [lines.pop()]
+        return any(self.pattern.search(line[:MAX_LINE_LENGTH]) for line in lines)
+
+    def reset(self):
+        self.partial = {}
+
+
+class Heartbeat:
+    """The heartbeat channels handed to the command, and when it last checked in."""
+
+    def __init__(self, interval, pattern=None):
+        self.interval = interval
+        self.pattern = pattern  # Compiled regular expression, or None
+        self.lines = LineMatcher(pattern) if pattern else None
+        self.last = time.time()
+        self.reader = self.writer = None
+        self.socket = None
+        self.socket_path = None
+
+    def open(self, directory):
+        """
+        Create the heartbeat pipe, and the notify socket in directory.
+
+        Raises:
+            OSError: If the socket cannot be created
+        """
+        self.reader, self.writer = os.pipe()
+        os.set_blocking(self.reader, False)
+        path = os.path.join(directory, f"heartbeat-{os.getpid()}.sock")
+        if os.path.exists(path):
+            os.unlink(path)  # Left behind by an earlier process with our pid
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(path)
+        self.socket.setblocking(False)
+        self.socket_path = path
+
+    def wakeup_fds(self):
+        """File descriptors that become readable when a heartbeat comes in."""
+        return [self.reader, self.socket.fileno()]
+
+    def reset(self):
+        """A new attempt starts: forget heartbeats sent during the last one."""
+        self.poll()
+        if self.lines:
+            self.lines.reset()
+        self.last = time.time()
+
+    def beat(self):
+        self.last = time.time()
+
+    def expires_at(self):
+        """Unix time at which the command is stopped unless it checks in first."""
+        return self.last + self.interval
+
+    def poll(self):
+        """Take in heartbeats from the pipe and the notify socket."""
+        try:
+            while os.read(self.reader, 4096):
+                self.beat()
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                message = self.socket.recv(MAX_DATAGRAM_SIZE)
+            except BlockingIOError:
+                break
+            if b"WATCHDOG=1" in message.split(b"\n"):
+                self.beat()
+
+    def feed(self, stream_name, data):
+        """Check the command's output for lines matching the pattern."""
+        if self.lines.feed(stream_name, data):
+            self.beat()
+
+    def close(self):
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+        for fd in (self.reader, self.writer):
+            if fd is not None:
+                os.close(fd)
+        self.reader = self.writer = None
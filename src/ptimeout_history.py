@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+ptimeout run history - Record completed runs in SQLite and derive timeouts from them.
+
+ptimeout.py imports this module only after the command has finished (or when
+an automatic timeout has to be worked out), so sqlite3 stays off the startup path.
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import time
+
+# Where the history database lives, following the XDG Base Directory Specification
+DEFAULT_STATE_DIR = os.path.join(
+    os.environ.get("XDG_STATE_HOME", os.path.expanduser("~/.local/state")), "ptimeout"
+)
+HISTORY_FILE = "history.sqlite3"
+
+# Deadline used while a command has too little history (seconds)
+DEFAULT_AUTO_FALLBACK = 600
+# Fewer successful runs than this is not enough to go by
+AUTO_MIN_SAMPLES = 5
+# Only the most recent successful runs count, so the deadline follows drift
+AUTO_SAMPLE_LIMIT = 200
+# Never derive a deadline below this (seconds)
+AUTO_MIN_TIMEOUT = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    command TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    exit_code INTEGER NOT NULL,
+    timed_out INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    timeout REAL,
+    peak_rss INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_by_fingerprint ON runs (fingerprint, started_at);
+CREATE INDEX IF NOT EXISTS runs_by_duration ON runs (fingerprint, duration, started_at);
+CREATE INDEX IF NOT EXISTS runs_by_peak_rss ON runs (fingerprint, peak_rss, started_at);
+CREATE INDEX IF NOT EXISTS runs_by_time ON runs (started_at);
+"""
+
+# A run that took at least this share of its timeout was a close call
+NEAR_TIMEOUT_RATIO = 0.8
+
+STATS_PERCENTILES = (50, 90, 99)
+
+# How `ptimeout stats --sort` orders commands
+STATS_ORDER = {
+    "runs": "runs DESC",
+    "timeouts": "CAST(timeouts AS REAL) / runs DESC, runs DESC",
+    "near-timeout": "CAST(near_timeouts AS REAL) / runs DESC, runs DESC",
+    "recent": "last_run DESC",
+}
+
+# Units accepted by time windows such as `--since 7d`
+WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def history_path():
+    state_dir = os.environ.get("PTIMEOUT_STATE_DIR", DEFAULT_STATE_DIR)
+    return os.path.join(state_dir, HISTORY_FILE)
+
+
+def fingerprint(command_args):
+    """Stable identifier for a command line: a hash of its arguments."""
+    data = "\0".join(command_args).encode("utf-8", "surrogateescape")
+    return hashlib.blake2b(data, digest_size=12).hexdigest()
+
+
+def format_command(command_args):
+    return " ".join(command_args)
+
+
+class HistoryStore:
+    """The run history database, created on first use."""
+
+    def __init__(self, path=None):
+        self.path = path or history_path()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=2.0)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def record(
+        self,
+        command_args,
+        started_at,
+        duration,
+        exit_code,
+        timed_out,
+        attempts=1,
+        timeout=None,
+        peak_rss=None,
+    ):
+        """Add one completed run."""
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO runs (fingerprint, command, started_at, duration,"
+                " exit_code, timed_out, attempts, timeout, peak_rss)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    fingerprint(command_args),
+                    format_command(command_args),
+                    started_at,
+                    duration,
+                    exit_code,
+                    int(timed_out),
+                    attempts,
+                    timeout,
+                    peak_rss,
+                ),
+            )
+
+    def successful_durations(self, command_args, limit=AUTO_SAMPLE_LIMIT):
+        """Durations of the most recent runs of a command that exited 0 in time."""
+        rows = self.connection.execute(
+            "SELECT duration FROM runs"
+            " WHERE fingerprint = ? AND exit_code = 0 AND timed_out = 0"
+            " ORDER BY started_at DESC LIMIT ?",
+            (fingerprint(command_args), limit),
+        )
+        return [duration for (duration,) in rows]
+
+    def command_stats(
+        self, since=None, until=None, command=None, sort="runs", limit=None
+    ):
+        """
+        Per-command statistics over runs started in [since, until).
+
+        Counts come from one GROUP BY over the window. Each percentile is
+        then a single lookup in a (fingerprint, value, started_at) index that
+        skips k entries, so no durations are sorted or loaded into Python.
+
+        Args:
+            since, until: Unix time bounds of the window, None for open ends
+            command: Only commands matching this glob
+            sort: Key of STATS_ORDER
+            limit: Maximum number of commands
+
+        Returns:
+            list: One dict per command
+        """
+        window, window_params = [], []
+        if since is not None:
+            window.append("started_at >= ?")
+            window_params.append(since)
+        if until is not None:
+            window.append("started_at < ?")
+            window_params.append(until)
+        where = list(window)
+        params = list(window_params)
+        if command:
+            where.append("command GLOB ?")
+            params.append(command)
+        # Without a start bound most rows qualify, and reading the table in
+        # order beats looking every row up through an index.
+        source = "runs" if since is not None else "runs NOT INDEXED"
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+        query = (
+            "SELECT fingerprint, MAX(command), COUNT(*) AS runs,"
+            " SUM(exit_code = 0 AND timed_out = 0), SUM(timed_out) AS timeouts,"
+            " SUM(attempts > 1),"
+            " SUM(timed_out = 0 AND IFNULL(duration >= ? * timeout, 0))"
+            " AS near_timeouts,"
+            " COUNT(peak_rss), MAX(started_at) AS last_run"
+            f" FROM {source}{where_sql}"
+            f" GROUP BY fingerprint ORDER BY {STATS_ORDER[sort]}"
+        )
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        groups = self.connection.execute(query, [NEAR_TIMEOUT_RATIO] + params)
+
+        results = []
+        for (
+            fp,
+            command_text,
+            runs,
+            successes,
+            timeouts,
+            retried,
+            near_timeouts,
+            rss_samples,
+            last_run,
+        ) in groups.fetchall():
+            row = {
+                "command": command_text,
+                "fingerprint": fp,
+                "runs": runs,
+                "success_rate": successes / runs,
+                "timeout_rate": timeouts / runs,
+                "retry_rate": retried / runs,
+                "near_timeout_rate": near_timeouts / runs,
+                "last_run": last_run,
+            }
+            for pct in STATS_PERCENTILES:
+                row[f"p{pct}"] = self._nth(
+                    "duration", fp, window, window_params, runs, pct
+                )
+            # The median peak, so one outlier does not stand for the command
+            row["peak_rss"] = (
+                self._nth("peak_rss", fp, window, window_params, rss_samples, 50)
+                if rss_samples
+                else None
+            )
+            results.append(row)
+        return results
+
+    def _nth(self, column, fp, window, window_params, count, percentile):
+        """Nearest-rank percentile of column among count runs of fp in the window."""
+        offset = max(1, math.ceil(percentile / 100 * count)) - 1
+        conditions = ["fingerprint = ?", f"{column} IS NOT NULL"] + window
+        return self.connection.execute(
+            f"SELECT {column} FROM runs INDEXED BY runs_by_{column}"
+            f" WHERE {' AND '.join(conditions)}"
+            f" ORDER BY {column} LIMIT 1 OFFSET ?",
+            [fp] + window_params + [offset],
+        ).fetchone()[0]
+
+
+def parse_window(value, now=None):
+    """
+    Parse a time window bound: an age like '24h' or '7d', or an ISO date/time.
+
+    Returns:
+        float: The bound as Unix time
+
+    Raises:
+        ValueError: If value is in neither form
+    """
+    value = value.strip()
+    now = time.time() if now is None else now
+    unit = value[-1:].lower()
+    if unit in WINDOW_UNITS and value[:-1].isdigit():
+        return now - int(value[:-1]) * WINDOW_UNITS[unit]
+    from datetime import datetime
+
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(
+            f"Invalid time: '{value}'. Use an age such as 30m, 24h, 7d or 2w, or a date such as 2026-01-31."
+        )
+
+
+def percentile_of(samples, percentile):
+    """Nearest-rank percentile of samples."""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(percentile / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def auto_timeout(
+    command_args, percentile, factor, fallback=DEFAULT_AUTO_FALLBACK, store=None
+):
+    """
+    Derive a deadline for a command from its recorded run times.
+
+    Args:
+        command_args: The command to be run
+        percentile: Which percentile of recent successful durations to use
+        factor: Multiplier applied to that percentile
+        fallback: Deadline in seconds while there are fewer than
+                  AUTO_MIN_SAMPLES successful runs on record
+        store: HistoryStore to read from; the default store if None
+
+    Returns:
+        tuple: (timeout in whole seconds, number of runs it is based on,
+                0 when the fallback was used)
+    """
+    try:
+        if store is None:
+            with HistoryStore() as store:
+                durations = store.successful_durations(command_args)
+        else:
+            durations = store.successful_durations(command_args)
+    except (sqlite3.Error, OSError):
+        durations = []
+    if len(durations) < AUTO_MIN_SAMPLES:
+        return fallback, 0
+    timeout = math.ceil(percentile_of(durations, percentile) * factor)
+    return max(timeout, AUTO_MIN_TIMEOUT), len(durations)
+
+
+def record_run(command_args, summary, timeout=None):
+    """
+    Store a finished run; failures are ignored so history can never break a run.
+
+    summary is the dict filled in by run_command.
+    """
+    import resource
+
+    # Sampled from /proc while the command ran, which misses short runs and
+    # short spikes. The kernel's largest resident set of any child we waited
+    # for (KB on Linux) catches those, but it also counts what a child had
+    # between fork and exec, ptimeout's own size: it is used only when larger.
+    peak_rss = summary.get("peak_rss") or 0
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if children > resource.getrusage(resource.RUSAGE_SELF).ru_maxrss:
+        peak_rss = max(peak_rss, children * 1024)
+    try:
+        with HistoryStore() as store:
+            store.record(
+                command_args,
+                started_at=summary.get("started_at", time.time()),
+                duration=summary["duration"],
+                exit_code=summary["exit_code"],
+                timed_out=summary["timed_out"],
+                attempts=summary["attempts"],
+                timeout=timeout,
+                peak_rss=peak_rss or None,
+            )
+    except (sqlite3.Error, OSError):
+        pass
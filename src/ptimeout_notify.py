@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+ptimeout sd_notify - Readiness, liveness and status for systemd.
+
+With --sd-notify, ptimeout speaks the sd_notify(3) protocol to the socket in
+its own NOTIFY_SOCKET, so that it can run as a Type=notify service:
+
+- READY=1 once the command has been started, or once it prints a line
+  matching --ready-pattern
+- WATCHDOG=1 every half WATCHDOG_USEC while the command runs, and while
+  ptimeout waits for a lock, a token, an identical run or the next retry;
+  with --heartbeat, only while the command keeps checking in
+- STATUS= with the attempt and the time it has left, every STATUS_INTERVAL
+- STOPPING=1 and a final STATUS= once the run is over
+
+ptimeout.py imports this module only with --sd-notify.
+"""
+
+import os
+import socket
+import time
+
+from ptimeout_heartbeat import LineMatcher
+
+NOTIFY_SOCKET_ENV = "NOTIFY_SOCKET"
+
+# How often STATUS= is updated while the command runs (seconds)
+STATUS_INTERVAL = 5
+
+
+class Notifier:
+    """Sends notifications to the service manager's socket; never fails the run."""
+
+    def __init__(self, address, watchdog_interval=None, ready_pattern=None):
+        self.address = address
+        self.watchdog_interval = watchdog_interval  # Seconds between WATCHDOG=1
+        self.ready_pattern = ready_pattern  # Compiled regular expression, or None
+        self.is_ready = False
+        self.last_watchdog = 0.0
+        self.next_status = 0.0
+        self.lines = LineMatcher(ready_pattern) if ready_pattern else None
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)  # A manager not reading must not stall us
+
+    @classmethod
+    def from_environment(cls, ready_pattern=None, environ=None):
+        """
+        The notifier for the service manager that started us, or None when
+        NOTIFY_SOCKET is not set. The watchdog is on when WATCHDOG_USEC is
+        set and WATCHDOG_PID, if given, is our pid.
+
+        The variables are taken out of environ, as sd_notify(3) does with
+        unset_environment: the command must not talk to the manager as us.
+        """
+        environ = os.environ if environ is None else environ
+        address = environ.pop(NOTIFY_SOCKET_ENV, None)
+        watchdog_usec = environ.pop("WATCHDOG_USEC", "0")
+        watchdog_pid = environ.pop("WATCHDOG_PID", None)
+        if not address:
+            return None
+        if address.startswith("@"):
+            address = "\0" + address[1:]  # Abstract namespace
+        watchdog_interval = None
+        try:
+            watchdog_usec = int(watchdog_usec)
+            watchdog_pid = int(watchdog_pid) if watchdog_pid else os.getpid()
+        except ValueError:
+            watchdog_usec = 0
+        if watchdog_usec > 0 and watchdog_pid == os.getpid():
+            watchdog_interval = watchdog_usec / 2e6  # Ping twice per period
+        return cls(address, watchdog_interval, ready_pattern)
+
+    def send(self, *assignments):
+        try:
+            self.socket.sendto("\n".join(assignments).encode(), self.address)
+        except OSError:
+            pass  # Nobody listening, or not keeping up; the run goes on regardless
+
+    def ready(self):
+        """Report readiness, once per run."""
+        if not self.is_ready:
+            self.is_ready = True
+            self.send("READY=1")
+
+    def feed(self, stream_name, data):
+        """Check the command's output for a line matching the ready pattern."""
+        if self.lines.feed(stream_name, data):
+            self.lines.reset()
+            self.ready()
+
+    def next_due(self):
+        """Unix time at which tick() next has something to send."""
+        due = self.next_status
+        if self.watchdog_interval is not None:
+            watchdog_at = self.last_watchdog + self.watchdog_interval
+            if watchdog_at > time.time():  # Else it waits for the command to progress
+                due = min(due, watchdog_at)
+        return due
+
+    def tick(self, status, progressing=True):
+        """Send whatever is due: WATCHDOG=1 if progressing, and STATUS=status."""
+        now = time.time()
+        assignments = []
+        if (
+            self.watchdog_interval is not None
+            and progressing
+            and now >= self.last_watchdog + self.watchdog_interval
+        ):
+            assignments.append("WATCHDOG=1")
+            self.last_watchdog = now
+        if now >= self.next_status:
+            assignments.append(f"STATUS={status}")
+            self.next_status = now + STATUS_INTERVAL
+        if assignments:
+            self.send(*assignments)
+
+    def sleep(self, seconds, status):
+        """time.sleep(seconds), sending what falls due meanwhile with STATUS=status."""
+        end = time.time() + seconds
+        self.next_status = 0  # A new phase: report it at once, and whatever follows
+        while True:
+            self.tick(status)
+            now = time.time()
+            if now >= end:
+                self.next_status = 0
+                return
+            time.sleep(max(min(end, self.next_due()) - now, 0))
+
+    def stopping(self, status):
+        self.send("STOPPING=1", f"STATUS={status}")
+
+    def close(self):
+        self.socket.close()
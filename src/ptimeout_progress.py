@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+ptimeout progress channel - One tree of timers for nested ptimeout instances.
+
+A ptimeout drawing the full UI gives its command the write end of a pipe.
+A ptimeout started inside the command finds it (ptimeout.py passes the fd
+and the id of the level that spawned the command in the environment),
+draws nothing itself and reports its timers up the pipe instead, passing
+the same fd on to its own command. The outermost ptimeout collects the
+reports in a NestedTimers tree and shows them under its own timer.
+
+ptimeout.py imports this module only when there is a UI to feed or a
+channel in the environment.
+"""
+
+import json
+import os
+import select
+import time
+
+# Records are sent with one write() each, which the kernel keeps in one piece
+# up to PIPE_BUF bytes: concurrent reporters never interleave
+MAX_RECORD_SIZE = getattr(select, "PIPE_BUF", 512)
+MAX_LABEL_LENGTH = 60
+
+# Timer states: running an attempt, or done (the timer goes away)
+RUNNING, FINISHED = "running", "finished"
+
+
+def timer_id(level):
+    """Id of the timer of nesting level `level` in this process."""
+    return f"{os.getpid()}.{level}"
+
+
+def timer_record(level, parent, label, timeout, attempt, retries, state):
+    """
+    Describe one timer. parent is the id of the enclosing level's timer, if
+    any; started is on the CLOCK_MONOTONIC clock, which all processes share.
+    """
+    return {
+        "id": timer_id(level),
+        "parent": timer_id(level - 1) if level > 0 else parent,
+        "label": label[:MAX_LABEL_LENGTH],
+        "timeout": timeout,
+        "started": time.monotonic(),
+        "attempt": attempt,
+        "retries": retries,
+        "state": state,
+    }
+
+
+class TimerSink:
+    """Where a ptimeout's levels report their timers."""
+
+    parent = None  # Timer id of the level that spawned us, in another process
+
+    def start(self, level, label, timeout, attempt, retries):
+        """Level `level` starts an attempt."""
+        self.add(
+            timer_record(level, self.parent, label, timeout, attempt, retries, RUNNING)
+        )
+
+    def finish(self, level):
+        """Level `level` is done; its timer goes away."""
+        self.add({"id": timer_id(level), "state": FINISHED})
+
+
+class ProgressReporter(TimerSink):
+    """Sends our timers up the channel of the ptimeout our command runs under."""
+
+    local = False  # Nothing is drawn in this process
+
+    def __init__(self, fd, parent=None):
+        self.fd = fd
+        self.parent = parent
+
+    def add(self, record):
+        data = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        if len(data) > MAX_RECORD_SIZE:
+            return
+        try:
+            os.write(self.fd, data)
+        except OSError:
+            pass  # The outer ptimeout is gone; nobody is watching
+
+    def child_channel(self, level):
+        """The channel fd to hand on to our command, and the id of its parent timer."""
+        return self.fd, timer_id(level)
+
+    def spawned(self):
+        pass
+
+    def poll(self):
+        return False
+
+    def command_exited(self):
+        pass
+
+
+class NestedTimers(TimerSink):
+    """
+    The timers shown by the ptimeout that draws the UI: its own levels,
+    reported directly, and those of every ptimeout running under its command,
+    read from the channel.
+    """
+
+    local = True
+
+    def __init__(self):
+        self.timers = {}  # id -> record, in the order first reported
+        self.reader = None
+        self.writer = None
+        self.pending = b""
+        self.changed = False
+
+    def add(self, record):
+        if record["state"] == FINISHED:
+            self.timers.pop(record["id"], None)
+        else:
+            self.timers[record["id"]] = record
+        self.changed = True
+
+    def child_channel(self, level):
+        """Open a channel for the command about to be spawned by level `level`."""
+        self.command_exited()
+        self.reader, self.writer = os.pipe()
+        os.set_blocking(self.reader, False)
+        return self.writer, timer_id(level)
+
+    def spawned(self):
+        """The command holds its end of the channel now; drop our copy."""
+        if self.writer is not None:
+            os.close(self.writer)
+            self.writer = None
+
+    def poll(self):
+        """Take in what has been reported so far. Returns True if anything changed."""
+        while self.reader is not None:
+            try:
+                data = os.read(self.reader, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            self.pending += data
+        *lines, self.pending = self.pending.split(b"\n")
+        for line in lines:
+            try:
+                record = json.loads(line)
+                if record["state"] == FINISHED or isinstance(record["started"], float):
+                    self.add(record)
+            except (ValueError, KeyError, TypeError):
+                pass  # Not from a ptimeout; ignore it
+        changed, self.changed = self.changed, False
+        return changed
+
+    def command_exited(self):
+        """Close the channel; timers of other processes went with the command."""
+        self.spawned()
+        if self.reader is not None:
+            os.close(self.reader)
+            self.reader = None
+        self.pending = b""
+        own = f"{os.getpid()}."
+        for key in [key for key in self.timers if not key.startswith(own)]:
+            del self.timers[key]
+        self.changed = True
+
+    def tree(self):
+        """All timers, parents before their children, as (depth, record) pairs."""
+        children = {}
+        for record in self.timers.values():
+            parent = record["parent"] if record["parent"] in self.timers else None
+            children.setdefault(parent, []).append(record)
+        ordered = []
+        stack = [(0, record) for record in reversed(children.get(None, []))]
+        while stack:
+            depth, record = stack.pop()
+            ordered.append((depth, record))
+            stack.extend(
+                (depth + 1, child) for child in reversed(children.get(record["id"], []))
+            )
+        return ordered
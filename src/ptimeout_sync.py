@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+ptimeout coordination - Cooperation between ptimeout processes running on the same host.
+
+ptimeout.py imports this module only when one of the options that need it is
+given. State lives in small files under runtime_dir(), guarded by flock(2), so
+a crashed process never leaves anything locked behind.
+"""
+
+import fcntl
+import os
+import struct
+import tempfile
+import time
+
+# How often a waiting process checks for news (seconds): soon at first, then
+# backing off, so that long queues of waiters stay cheap
+POLL_INTERVAL = 0.01
+MAX_POLL_INTERVAL = 0.5
+
+# Output records a singleflight leader appends for its followers: a one byte
+# tag, then a length or exit code
+RECORD_HEADER = struct.Struct("!ci")
+STREAM_TAGS = {"stdout": b"O", "stderr": b"E"}
+EXIT_TAG = b"X"
+
+
+def runtime_dir():
+    """Per-user directory for coordination files, created on first use."""
+    path = os.environ.get("PTIMEOUT_RUNTIME_DIR")
+    if not path:
+        if os.environ.get("XDG_RUNTIME_DIR"):
+            path = os.path.join(os.environ["XDG_RUNTIME_DIR"], "ptimeout")
+        else:
+            path = os.path.join(tempfile.gettempdir(), f"ptimeout-{os.getuid()}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+
+def poll_intervals(deadline=None):
+    """
+    Pauses between looks: POLL_INTERVAL, doubling up to MAX_POLL_INTERVAL,
+    and never past deadline (Unix time).
+    """
+    interval = POLL_INTERVAL
+    while True:
+        if deadline is None:
+            yield interval
+        else:
+            yield max(min(interval, deadline - time.time()), 0)
+        interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+
+class Flight:
+    """
+    One run of a command shared by every identical invocation made while it runs.
+
+    The first process to lock <key>.lock becomes the leader: it runs the
+    command, appends its output to a file named in the lock file and finally
+    appends the exit code. Everyone else follows that file. If the leader dies
+    without finishing, the lock is released and a follower takes over.
+    """
+
+    def __init__(self, key, directory=None):
+        directory = directory or os.path.join(runtime_dir(), "flights")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.lock_fd = os.open(
+            os.path.join(directory, f"{key}.lock"), os.O_RDWR | os.O_CREAT, 0o600
+        )
+        self.key = key
+        self.output = None
+        self.leader_pid = None
+
+    def _try_lock(self):
+        try:
+            fcntl.flock(self.lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _read_lock(self):
+        """(leader pid, output file name) as published by the leader, or None."""
+        content = os.pread(self.lock_fd, 256, 0).decode(errors="replace").split()
+        if len(content) != 2 or not content[0].isdigit():
+            return None
+        return int(content[0]), content[1]
+
+    def join(self, deadline, write, sleep=time.sleep):
+        """
+        Wait for the identical run in progress, passing its output to write.
+
+        Args:
+            deadline: Unix time at which to stop waiting
+            write: Called with (stream name, bytes) as output arrives
+            sleep: Called to pause between looks
+
+        Returns:
+            int: The leader's exit code, or None when no run is in progress and
+                 the caller is now the leader and has to run the command itself
+
+        Raises:
+            TimeoutError: If the deadline passed first
+        """
+        pauses = poll_intervals(deadline)
+        while True:
+            if self._try_lock():
+                self._lead()
+                return None
+            published = self._read_lock()
+            if published:
+                self.leader_pid, name = published
+                try:
+                    output = open(os.path.join(self.directory, name), "rb")
+                except FileNotFoundError:
+                    output = None  # Finished just now; look again
+                if output:
+                    with output:
+                        exit_code = self._follow(
+                            output, published, deadline, write, sleep
+                        )
+                    if exit_code is not None:
+                        return exit_code
+                    continue
+            if time.time() >= deadline:
+                raise TimeoutError
+            sleep(next(pauses))
+
+    def _follow(self, output, published, deadline, write, sleep):
+        """Copy records until the exit code; None if the flight ended without one."""
+        pending = b""
+        pauses = poll_intervals(deadline)
+        while True:
+            chunk = output.read()
+            if not chunk and self._read_lock() != published:
+                # The leader has moved on. Whatever it wrote last is in by now.
+                chunk = output.read()
+                if not chunk:
+                    return None
+            if chunk:
+                pauses = poll_intervals(deadline)  # Output flowing: look again soon
+                pending += chunk
+                while len(pending) >= RECORD_HEADER.size:
+                    tag, value = RECORD_HEADER.unpack_from(pending)
+                    if tag == EXIT_TAG:
+                        return value
+                    end = RECORD_HEADER.size + value
+                    if len(pending) < end:
+                        break
+                    stream = "stdout" if tag == STREAM_TAGS["stdout"] else "stderr"
+                    write(stream, pending[RECORD_HEADER.size : end])
+                    pending = pending[end:]
+                continue
+            if time.time() >= deadline:
+                raise TimeoutError
+            if self._try_lock():
+                # The leader is gone without an exit code. Let the caller's
+                # loop take over (and run the command again).
+                fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+                return None
+            sleep(next(pauses))
+
+    def _lead(self):
+        """Start a new output file and tell followers where it is."""
+        stale = self._read_lock()
+        if stale:
+            # Left behind by a leader that died
+            try:
+                os.unlink(os.path.join(self.directory, stale[1]))
+            except OSError:
+                pass
+        name = f"{self.key}.{os.getpid()}.out"
+        self.output = open(os.path.join(self.directory, name), "wb", buffering=0)
+        os.ftruncate(self.lock_fd, 0)
+        os.pwrite(self.lock_fd, f"{os.getpid()} {name}".encode(), 0)
+
+    def publish(self, stream, data):
+        """Pass output of the leader's run on to the followers."""
+        if data:
+            self.output.write(RECORD_HEADER.pack(STREAM_TAGS[stream], len(data)) + data)
+
+    def finish(self, exit_code):
+        """Hand the exit code to the followers and end the flight."""
+        self.output.write(RECORD_HEADER.pack(EXIT_TAG, exit_code))
+        self.output.close()
+        os.unlink(self.output.name)
+        os.ftruncate(self.lock_fd, 0)
+        self.close()
+
+    def abandon(self):
+        """End the flight without running the command; a follower takes over."""
+        self.output.close()
+        os.unlink(self.output.name)
+        os.ftruncate(self.lock_fd, 0)
+        self.close()
+
+    def close(self):
+        os.close(self.lock_fd)  # Releases the lock
+
+
+def validate_name(name):
+    """Lock and bucket names become file names, so keep them to a safe set."""
+    if not name or not all(c.isalnum() or c in "._-" for c in name) or name[0] == ".":
+        raise ValueError(
+            f"Invalid name: '{name}'. Use letters, digits, '.', '_' and '-'. Example: ptimeout --lock db-dumps 1h -- pg_dump mydb"
+        )
+    return name
+
+
+class Semaphore:
+    """
+    At most `slots` holders of a name across the host, served in arrival order.
+
+    Each slot is a file that a holder keeps flock'd. Waiters queue up as
+    flock'd ticket files named by arrival time; only the oldest live ticket
+    may take a free slot, so a newcomer never overtakes a waiter. Slots and
+    tickets of processes that died are released by the kernel.
+    """
+
+    def __init__(self, name, slots=1, directory=None):
+        directory = directory or os.path.join(
+            runtime_dir(), "locks", validate_name(name)
+        )
+        self.queue_dir = os.path.join(directory, "queue")
+        os.makedirs(self.queue_dir, exist_ok=True)
+        self.directory = directory
+        self.slots = slots
+        self.slot = None
+        self.slot_fd = None
+
+    def acquire(self, deadline=None, sleep=time.sleep):
+        """
+        Wait for a slot.
+
+        Args:
+            deadline: Unix time at which to give up, or None to wait forever
+            sleep: Called to pause between looks
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            TimeoutError: If the deadline passed first
+        """
+        start = time.monotonic()
+        ticket = f"{time.time_ns():020d}.{os.getpid()}"
+        ticket_path = os.path.join(self.queue_dir, ticket)
+        # Locked before it appears under its real name, so nobody takes it for stale
+        pending_path = os.path.join(self.directory, f"{ticket}.tmp")
+        ticket_fd = os.open(pending_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(ticket_fd, fcntl.LOCK_EX)
+            os.rename(pending_path, ticket_path)
+            pauses = poll_intervals(deadline)
+            while True:
+                if self._first_in_line(ticket) and self._take_slot():
+                    return time.monotonic() - start
+                if deadline is not None and time.time() >= deadline:
+                    raise TimeoutError
+                sleep(next(pauses))
+        finally:
+            for path in (ticket_path, pending_path):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            os.close(ticket_fd)
+
+    def _first_in_line(self, ticket):
+        """True if no live ticket is older than ours; stale ones are removed."""
+        for other in sorted(os.listdir(self.queue_dir)):
+            if other >= ticket:
+                return True
+            path = os.path.join(self.queue_dir, other)
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue  # Just left the queue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False  # Waiting ahead of us
+            finally:
+                os.close(fd)
+            try:
+                os.unlink(path)  # Its owner died while waiting
+            except OSError:
+                pass
+        return True
+
+    def _take_slot(self):
+        for slot in range(self.slots):
+            fd = os.open(
+                os.path.join(self.directory, f"slot.{slot}"),
+                os.O_RDWR | os.O_CREAT,
+                0o600,
+            )
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            self.slot, self.slot_fd = slot, fd
+            return True
+        return False
+
+    def release(self):
+        if self.slot_fd is not None:
+            os.close(self.slot_fd)
+            self.slot, self.slot_fd = None, None
+
+
+class RateLimiter:
+    """
+    A token bucket shared by every ptimeout using the same bucket name.
+
+    The bucket is two doubles in a memory-mapped file: the token count and
+    when it was last refilled (CLOCK_MONOTONIC, which all processes share).
+    Each caller updates it under a brief flock. Rather than polling for a
+    token, a caller takes one on credit, letting the count go negative, and
+    sleeps for exactly as long as the refill needs; callers therefore start
+    in the order they arrived, rate seconds apart.
+    """
+
+    STATE = struct.Struct("dd")
+
+    def __init__(self, name, rate, burst=1, directory=None):
+        directory = directory or os.path.join(runtime_dir(), "rates")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, validate_name(name))
+        self.rate = rate
+        self.burst = burst
+
+    def reserve(self, max_wait=None, now=None):
+        """
+        Take a token.
+
+        Args:
+            max_wait: Take nothing and raise TimeoutError if the token would
+                      only be ready after this many seconds
+            now: time.monotonic() value to use
+
+        Returns:
+            float: Seconds to wait before the token may be used
+        """
+        import mmap
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_size < self.STATE.size:
+                os.ftruncate(fd, self.STATE.size)
+            with mmap.mmap(fd, self.STATE.size) as state:
+                tokens, refilled_at = self.STATE.unpack_from(state)
+                now = time.monotonic() if now is None else now
+                if refilled_at <= 0 or refilled_at > now:
+                    # New bucket, or one from before a reboot
+                    tokens, refilled_at = self.burst, now
+                tokens = min(self.burst, tokens + (now - refilled_at) * self.rate)
+                tokens -= 1
+                wait = -tokens / self.rate if tokens < 0 else 0.0
+                if max_wait is not None and wait > max_wait:
+                    raise TimeoutError(wait)
+                self.STATE.pack_into(state, 0, tokens, now)
+        finally:
+            os.close(fd)  # Also releases the lock
+        return wait
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure counter for one command, shared by every ptimeout on the host.
+
+    Closed: runs go ahead. After `threshold` failures in a row, the first
+    of them no more than `window` seconds ago, the circuit opens and runs
+    are refused. Once `cooldown` seconds have passed, one run is let
+    through as a probe (half-open): its success closes the circuit, its
+    failure opens it for another cooldown. Runs admitted before the circuit
+    opened may finish later: they cannot decide for the probe, and their
+    failures do not push the next probe back.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    # state, failures, probe pid, first failure, opened at (Unix time)
+    STATE = struct.Struct("iiidd")
+
+    def __init__(self, key, threshold, window, cooldown, directory=None):
+        directory = directory or os.path.join(runtime_dir(), "breakers")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, key)
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.failures = 0
+
+    def _update(self, change):
+        """Apply change(state tuple) -> state tuple under the file's lock."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            data = os.pread(fd, self.STATE.size, 0)
+            if len(data) == self.STATE.size:
+                state = self.STATE.unpack(data)
+            else:
+                state = (self.CLOSED, 0, 0, 0.0, 0.0)
+            new_state = change(state)
+            if new_state != state:
+                os.pwrite(fd, self.STATE.pack(*new_state), 0)
+        finally:
+            os.close(fd)
+        self.failures = new_state[1]
+        return new_state
+
+    def admit(self, now=None):
+        """
+        Decide whether a run may go ahead.
+
+        Returns:
+            tuple: (allowed, probe, seconds until the next probe may run).
+                   probe is True for the one run let through half-open.
+        """
+        now = time.time() if now is None else now
+        pid = os.getpid()
+        verdict = {}
+
+        def change(state):
+            status, failures, probe_pid, first_failure, opened_at = state
+            if status == self.CLOSED:
+                verdict.update(allowed=True, probe=False, retry_in=0.0)
+                return state
+            retry_in = max(0.0, opened_at + self.cooldown - now)
+            probe_running = status == self.HALF_OPEN and process_alive(probe_pid)
+            if retry_in > 0 or probe_running:
+                verdict.update(allowed=False, probe=False, retry_in=retry_in)
+                return state
+            verdict.update(allowed=True, probe=True, retry_in=0.0)
+            return (self.HALF_OPEN, failures, pid, first_failure, opened_at)
+
+        self._update(change)
+        return verdict["allowed"], verdict["probe"], verdict["retry_in"]
+
+    def record(self, success, probe=False, now=None):
+        """
+        Count the outcome of a run; probe is what admit() said about it.
+        Returns the new state.
+        """
+        now = time.time() if now is None else now
+
+        def change(state):
+            status, failures, probe_pid, first_failure, opened_at = state
+            if status == self.HALF_OPEN:
+                if not probe:
+                    return state  # Only the probe's verdict counts
+                if success:
+                    return (self.CLOSED, 0, 0, 0.0, 0.0)
+                return (self.OPEN, failures + 1, 0, first_failure, now)
+            if success:
+                return (self.CLOSED, 0, 0, 0.0, 0.0)
+            if status == self.OPEN:
+                # Keep the cooldown where it started
+                return (self.OPEN, failures + 1, 0, first_failure, opened_at)
+            if failures == 0 or now - first_failure > self.window:
+                failures, first_failure = 0, now
+            failures += 1
+            if failures >= self.threshold:
+                return (self.OPEN, failures, 0, first_failure, now)
+            return (self.CLOSED, failures, 0, first_failure, 0.0)
+
+        return self._update(change)[0]
+
+
+def process_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, owned by someone else
+    return True
@@ -14,6 +14,10 @@ def generate_systemd_service(args):
 
     # Build the ptimeout command
     ptimeout_cmd = ["/usr/local/bin/ptimeout"]
+    notify = args.notify or bool(args.watchdog_sec)
+
+    if notify:
+        ptimeout_cmd.append("--sd-notify")
 
     if args.retries:
         ptimeout_cmd.extend(["-r", str(args.retries)])
@@ -39,9 +43,9 @@ Documentation=man:ptimeout(1)
     if args.after:
         service_content += f"After={args.after}\n"
 
-    service_content += """
+    service_content += f"""
 [Service]
-Type=simple
+Type={"notify" if notify else "simple"}
 ExecStart=
 """
 
@@ -52,6 +56,9 @@ ExecStart=
 
     service_content += f"ExecStart={' '.join(ptimeout_cmd)}\n"
 
+    if args.watchdog_sec:
+        service_content += f"WatchdogSec={args.watchdog_sec}\n"
+
     if args.working_directory:
         service_content += f"WorkingDirectory={args.working_directory}\n"
 
@@ -151,6 +158,17 @@ def main():
 
     parser.add_argument("--config", help="Path to ptimeout configuration file")
 
+    parser.add_argument(
+        "--notify",
+        action="store_true",
+        help="Type=notify service: ptimeout reports readiness and status (--sd-notify)",
+    )
+
+    parser.add_argument(
+        "--watchdog-sec",
+        help="WatchdogSec for the service, e.g. '30s' (implies --notify)",
+    )
+
     # Service execution options
     parser.add_argument("--working-directory", help="Working directory for the service")
 
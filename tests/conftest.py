@@ -0,0 +1,20 @@
+"""
+Shared pytest setup: every test, and every ptimeout it starts, keeps its run
+history and caches in a temporary directory instead of the real home.
+"""
+
+import os
+import shutil
+import tempfile
+
+ISOLATED_DIRS = ("PTIMEOUT_STATE_DIR", "PTIMEOUT_CACHE_DIR")
+
+
+def pytest_configure(config):
+    config._ptimeout_home = tempfile.mkdtemp(prefix="ptimeout-tests-")
+    for name in ISOLATED_DIRS:
+        os.environ[name] = os.path.join(config._ptimeout_home, name.lower())
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(config._ptimeout_home, ignore_errors=True)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for the statistics and baseline comparison in benchmarks/bench.py.
+"""
+
+import os
+import sys
+import unittest
+
+# Add benchmarks to path so we can import bench
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks")
+)
+
+from bench import compare, percentile, summarize
+
+
+class TestBenchmarkStatistics(unittest.TestCase):
+    def test_nearest_rank_percentiles(self):
+        samples = list(range(1, 101))
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 95), 95)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile([3.0], 99), 3.0)
+
+    def test_summary_fields(self):
+        summary = summarize([0.3, 0.1, 0.2])
+        self.assertEqual(summary["p50"], 0.2)
+        self.assertEqual(summary["p99"], 0.3)
+        self.assertEqual(summary["runs"], 3)
+
+
+class TestBaselineComparison(unittest.TestCase):
+    def baseline(self, **p50s):
+        return {"results": {"startup": {t: {"p50": v} for t, v in p50s.items()}}}
+
+    def test_slower_ptimeout_is_a_regression(self):
+        results = {"startup": {"ptimeout": {"p50": 0.2}}}
+        _, regressions = compare(results, self.baseline(ptimeout=0.1), 0.25)
+        self.assertEqual(regressions, ["startup/ptimeout"])
+
+    def test_reference_targets_never_regress(self):
+        results = {"startup": {"gnu_timeout": {"p50": 0.2}}}
+        lines, regressions = compare(results, self.baseline(gnu_timeout=0.1), 0.25)
+        self.assertEqual(regressions, [])
+        self.assertEqual(len(lines), 1)
+
+    def test_within_threshold_and_new_targets_pass(self):
+        results = {"startup": {"ptimeout": {"p50": 0.11}, "new": {"p50": 1.0}}}
+        lines, regressions = compare(results, self.baseline(ptimeout=0.1), 0.25)
+        self.assertEqual(regressions, [])
+        self.assertEqual(len(lines), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
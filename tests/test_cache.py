@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Tests for the --cache result cache: keys, expiry, LRU eviction and replay.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import parse_config_value, parse_size
+from ptimeout_cache import ResultCache, digest, run_key
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.cache = ResultCache(os.path.join(self.tmpdir.name, "results"))
+
+
+class TestKeys(unittest.TestCase):
+    def test_every_input_changes_the_key(self):
+        key = run_key(["ls", "-l"], b"in", cwd="/tmp")
+        self.assertEqual(key, run_key(["ls", "-l"], b"in", cwd="/tmp"))
+        self.assertNotEqual(key, run_key(["ls -l"], b"in", cwd="/tmp"))
+        self.assertNotEqual(key, run_key(["ls", "-l"], b"other", cwd="/tmp"))
+        self.assertNotEqual(key, run_key(["ls", "-l"], b"in", cwd="/"))
+
+    def test_only_selected_environment_counts(self):
+        with mock.patch.dict(os.environ, {"REGION": "eu"}):
+            eu = run_key(["lookup"], env_names=["REGION"], cwd="/")
+            ignored = run_key(["lookup"], cwd="/")
+        with mock.patch.dict(os.environ, {"REGION": "us"}):
+            self.assertNotEqual(eu, run_key(["lookup"], env_names=["REGION"], cwd="/"))
+            self.assertEqual(ignored, run_key(["lookup"], cwd="/"))
+        with mock.patch.dict(os.environ, {"REGION": ""}):
+            empty = run_key(["lookup"], env_names=["REGION"], cwd="/")
+        os.environ.pop("REGION", None)
+        self.assertNotEqual(empty, run_key(["lookup"], env_names=["REGION"], cwd="/"))
+
+
+class TestStore(CacheTestCase):
+    def test_hit_until_ttl_expires(self):
+        self.cache.store("k" * 40, 0, b"out", b"err", now=1000.0)
+        result = self.cache.lookup("k" * 40, ttl=60, now=1059.0)
+        self.assertEqual((result["stdout"], result["stderr"]), (b"out", b"err"))
+        self.assertEqual(result["exit_code"], 0)
+        self.assertIsNone(self.cache.lookup("k" * 40, ttl=60, now=1060.0))
+        self.assertIsNone(self.cache.lookup("m" * 40, ttl=60, now=1000.0))
+
+    def test_identical_output_is_stored_once(self):
+        self.cache.store("a" * 40, 0, b"same", b"", now=1000.0)
+        self.cache.store("b" * 40, 0, b"same", b"", now=1000.0)
+        self.assertEqual(len(list(self.cache._files("objects"))), 2)  # "same" and ""
+        self.assertEqual(len(list(self.cache._files("entries"))), 2)
+
+    def test_least_recently_used_output_is_evicted(self):
+        for key in ["a", "b", "c"]:
+            self.cache.store(key * 40, 0, key.encode() * 100, b"", now=1000.0)
+        # Last used a, then c, then b (set explicitly; timestamps may be coarse)
+        for key, used in [("a", 1), ("c", 2), ("b", 3)]:
+            path = self.cache._object_path(digest(key.encode() * 100))
+            os.utime(path, (used, used))
+        self.cache.max_size = 250
+        self.cache.evict()
+        self.assertIsNone(self.cache.lookup("a" * 40, ttl=60, now=1001.0))
+        self.assertFalse(os.path.exists(self.cache._entry_path("a" * 40)))
+        for key in ["b", "c"]:
+            result = self.cache.lookup(key * 40, ttl=60, now=1001.0)
+            self.assertEqual(result["stdout"], key.encode() * 100)
+
+
+class TestCacheSettings(unittest.TestCase):
+    def test_parse_size(self):
+        self.assertEqual(parse_size("512"), 512)
+        self.assertEqual(parse_size("4K"), 4096)
+        self.assertEqual(parse_size("256m"), 256 * 1024 * 1024)
+        for invalid in ["", "M", "1.5G", "-1K", "12T"]:
+            with self.assertRaises(ValueError):
+                parse_size(invalid)
+
+    def test_config_values(self):
+        self.assertEqual(parse_config_value("cache", "10m"), 600)
+        self.assertEqual(
+            parse_config_value("cache_env", "AWS_PROFILE, HOME"),
+            ("AWS_PROFILE", "HOME"),
+        )
+        self.assertEqual(parse_config_value("cache_max_size", "1G"), 1024**3)
+
+
+class TestCacheOnCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.counter = os.path.join(self.tmpdir.name, "runs")
+        self.env = dict(
+            os.environ,
+            PTIMEOUT_STATE_DIR=self.tmpdir.name,
+            PTIMEOUT_CACHE_DIR=self.tmpdir.name,
+            PTIMEOUT_CONFIG=os.path.join(self.tmpdir.name, "none.ini"),
+        )
+
+    def run_ptimeout(self, *args, stdin=None):
+        return subprocess.run(
+            [sys.executable, PTIMEOUT] + list(args),
+            input=stdin,
+            stdin=subprocess.DEVNULL if stdin is None else None,
+            capture_output=True,
+            env=self.env,
+            timeout=30,
+        )
+
+    def runs(self):
+        with open(self.counter) as f:
+            return len(f.read())
+
+    def test_successful_output_is_replayed_without_running(self):
+        script = f"echo -n x >> {self.counter}; echo out; echo err >&2; exit 0"
+        first = self.run_ptimeout("--cache", "1m", "5s", "--", "sh", "-c", script)
+        second = self.run_ptimeout("--cache", "1m", "5s", "--", "sh", "-c", script)
+        self.assertEqual(self.runs(), 1)
+        self.assertEqual(second.returncode, 0)
+        self.assertEqual(second.stdout, b"out\n")
+        self.assertEqual(first.stdout, second.stdout)
+        self.assertTrue(second.stderr.startswith(b"err\n"))
+
+    def test_binary_output_is_kept_byte_for_byte(self):
+        script = f"echo -n x >> {self.counter}; printf '\\377\\376\\000A'"
+        for _ in range(2):
+            result = self.run_ptimeout("--cache", "1m", "5s", "--", "sh", "-c", script)
+            self.assertEqual(result.stdout, b"\xff\xfe\x00A")
+        self.assertEqual(self.runs(), 1)
+
+    def test_stdin_is_part_of_the_key(self):
+        script = f"echo -n x >> {self.counter}; cat"
+        for data in [b"one\n", b"two\n", b"one\n"]:
+            result = self.run_ptimeout(
+                "--cache", "1m", "5s", "--", "sh", "-c", script, stdin=data
+            )
+            self.assertEqual(result.stdout, data)
+        self.assertEqual(self.runs(), 2)
+
+    def test_failures_are_not_cached(self):
+        script = f"echo -n x >> {self.counter}; exit 3"
+        for _ in range(2):
+            result = self.run_ptimeout("--cache", "1m", "5s", "--", "sh", "-c", script)
+            self.assertEqual(result.returncode, 3)
+        self.assertEqual(self.runs(), 2)
+
+    def test_redirected_output_is_replayed_to_the_file(self):
+        out = os.path.join(self.tmpdir.name, "out.txt")
+        script = f"echo -n x >> {self.counter}; echo hello"
+        for _ in range(2):
+            if os.path.exists(out):
+                os.unlink(out)
+            self.run_ptimeout(
+                "--cache", "1m", "--stdout", out, "5s", "--", "sh", "-c", script
+            )
+            with open(out) as f:
+                self.assertEqual(f.read(), "hello\n")
+        self.assertEqual(self.runs(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for captured output handling: carriage returns, lazy ANSI parsing, read_stream.
+"""
+
+import io
+import os
+import queue
+import sys
+import unittest
+from unittest import mock
+
+# Add src to path so we can import ptimeout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+import ptimeout
+from ptimeout import CaptureBuffer, read_stream
+from rich.text import Text as RichText
+
+
+def texts(buffer):
+    return [entry[0] for entry in buffer.lines]
+
+
+class TestCaptureBuffer(unittest.TestCase):
+    def test_plain_lines(self):
+        buffer = CaptureBuffer()
+        self.assertEqual(buffer.feed("one\ntwo\n"), 2)
+        self.assertEqual(texts(buffer), ["one", "two"])
+
+    def test_carriage_return_keeps_final_state(self):
+        buffer = CaptureBuffer()
+        for percent in range(0, 101, 10):
+            buffer.feed(f"\rDownloading {percent:3d}%")
+        buffer.feed("\n")
+        self.assertEqual(texts(buffer), ["Downloading 100%"])
+
+    def test_shorter_rewrite_overwrites_prefix_only(self):
+        buffer = CaptureBuffer()
+        buffer.feed("abcdef\rXY")
+        buffer.feed("Z\n")
+        self.assertEqual(texts(buffer), ["XYZdef"])
+
+    def test_crlf_line_endings(self):
+        buffer = CaptureBuffer()
+        buffer.feed("first\r\nsecond\r\n")
+        self.assertEqual(texts(buffer), ["first", "second"])
+
+    def test_line_split_across_chunks(self):
+        buffer = CaptureBuffer()
+        buffer.feed("hel")
+        buffer.feed("lo\nwor")
+        self.assertEqual(texts(buffer), ["hello", "wor"])
+        buffer.feed("ld\n")
+        self.assertEqual(texts(buffer), ["hello", "world"])
+
+    def test_streams_keep_separate_open_lines(self):
+        buffer = CaptureBuffer()
+        buffer.feed("\r 10%", "stdout")
+        buffer.feed("warning\n", "stderr")
+        buffer.feed("\r 99%\n", "stdout")
+        self.assertEqual(
+            [entry[:2] for entry in buffer.lines],
+            [[" 99%", "stdout"], ["warning", "stderr"]],
+        )
+
+
+class TestLazyAnsiParsing(unittest.TestCase):
+    def setUp(self):
+        # ptimeout only imports rich when stdout is a TTY
+        patcher = mock.patch.object(ptimeout, "Text", RichText)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_escape_codes_become_styles(self):
+        buffer = CaptureBuffer()
+        buffer.feed("\x1b[32mok\x1b[0m done\n")
+        entry = buffer.lines[0]
+        self.assertIsNone(entry[2])  # Nothing parsed until the line is drawn
+
+        styled = CaptureBuffer.styled(entry, entry[0])
+        self.assertEqual(styled.plain, "ok done")
+        self.assertEqual(len(styled.spans), 1)
+        self.assertEqual(styled.spans[0].style.color.number, 2)  # ANSI green
+
+    def test_parse_is_cached_until_line_changes(self):
+        buffer = CaptureBuffer()
+        buffer.feed("\r 10%")
+        entry = buffer.lines[0]
+        first = CaptureBuffer.styled(entry, entry[0])
+        self.assertIs(CaptureBuffer.styled(entry, entry[0]), first)
+
+        buffer.feed("\r 20%")
+        second = CaptureBuffer.styled(entry, entry[0])
+        self.assertIsNot(second, first)
+        self.assertEqual(second.plain, " 20%")
+
+    def test_stderr_lines_keep_their_base_style(self):
+        buffer = CaptureBuffer()
+        buffer.feed("oops\n", "stderr")
+        entry = buffer.lines[0]
+        self.assertEqual(str(CaptureBuffer.styled(entry, entry[0]).style), "red")
+
+
+class TestReadStream(unittest.TestCase):
+    def test_decodes_multibyte_split_across_chunks(self):
+        data = "héllo ✓\n".encode("utf-8")
+        stream = io.BufferedReader(io.BytesIO(data), buffer_size=1)
+        q = queue.Queue()
+        read_stream(stream, q)
+        chunks = []
+        while not q.empty():
+            chunks.append(q.get())
+        self.assertEqual("".join(chunks), "héllo ✓\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
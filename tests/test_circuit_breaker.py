@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Tests for --circuit-breaker: failing fast on a command that keeps failing.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import EXIT_CIRCUIT_OPEN
+from ptimeout_sync import CircuitBreaker
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def breaker(self):
+        return CircuitBreaker(
+            "cmd", 3, window=60, cooldown=10, directory=self.tmpdir.name
+        )
+
+    def fail(self, times, at):
+        for _ in range(times):
+            state = self.breaker().record(False, now=at)
+        return state
+
+    def test_opens_after_consecutive_failures(self):
+        self.assertEqual(self.fail(2, at=100.0), CircuitBreaker.CLOSED)
+        self.assertEqual(self.fail(1, at=101.0), CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker().admit(now=105.0), (False, False, 6.0))
+
+    def test_success_resets_the_count(self):
+        self.fail(2, at=100.0)
+        self.breaker().record(True, now=100.0)
+        self.assertEqual(self.fail(2, at=101.0), CircuitBreaker.CLOSED)
+
+    def test_failures_outside_the_window_do_not_add_up(self):
+        self.fail(2, at=100.0)
+        breaker = self.breaker()
+        self.assertEqual(breaker.record(False, now=161.0), CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.failures, 1)
+
+    def test_half_open_lets_one_probe_through(self):
+        self.fail(3, at=100.0)
+        self.assertEqual(self.breaker().admit(now=110.0), (True, True, 0.0))
+        # The probe (this process) is still running
+        self.assertEqual(self.breaker().admit(now=111.0), (False, False, 0.0))
+
+    def test_probe_outcome(self):
+        self.fail(3, at=100.0)
+        self.breaker().admit(now=110.0)
+        state = self.breaker().record(False, probe=True, now=112.0)
+        self.assertEqual(state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker().admit(now=115.0), (False, False, 7.0))
+        self.breaker().admit(now=122.0)
+        state = self.breaker().record(True, probe=True, now=123.0)
+        self.assertEqual(state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker().admit(now=123.0), (True, False, 0.0))
+
+    def test_only_the_probe_decides_half_open(self):
+        self.fail(3, at=100.0)
+        self.breaker().admit(now=110.0)
+        # A run admitted while closed fails during the probe
+        state = self.breaker().record(False, now=111.0)
+        self.assertEqual(state, CircuitBreaker.HALF_OPEN)
+        state = self.breaker().record(True, probe=True, now=112.0)
+        self.assertEqual(state, CircuitBreaker.CLOSED)
+
+        self.fail(3, at=200.0)
+        self.breaker().admit(now=210.0)
+        state = self.breaker().record(True, now=211.0)  # Not the probe either
+        self.assertEqual(state, CircuitBreaker.HALF_OPEN)
+        state = self.breaker().record(False, probe=True, now=212.0)
+        self.assertEqual(state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker().admit(now=215.0), (False, False, 7.0))
+
+    def test_late_failures_do_not_extend_the_cooldown(self):
+        self.fail(3, at=100.0)
+        self.fail(5, at=108.0)  # Runs admitted before it opened
+        self.assertEqual(self.breaker().admit(now=105.0), (False, False, 5.0))
+        self.assertEqual(self.breaker().admit(now=110.0), (True, True, 0.0))
+
+    def test_probe_of_a_dead_process_is_replaced(self):
+        self.fail(3, at=100.0)
+        probe = subprocess.Popen([sys.executable, "-c", "import sys; sys.exit(0)"])
+        probe.wait()
+        breaker = self.breaker()
+        state = (CircuitBreaker.HALF_OPEN, 3, probe.pid, 100.0, 100.0)
+        with open(breaker.path, "wb") as f:
+            f.write(CircuitBreaker.STATE.pack(*state))
+        self.assertEqual(breaker.admit(now=200.0), (True, True, 0.0))
+
+
+class TestCircuitBreakerOnCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.env = dict(
+            os.environ,
+            PTIMEOUT_STATE_DIR=self.tmpdir.name,
+            PTIMEOUT_CACHE_DIR=self.tmpdir.name,
+            PTIMEOUT_RUNTIME_DIR=self.tmpdir.name,
+            PTIMEOUT_CONFIG=os.path.join(self.tmpdir.name, "none.ini"),
+        )
+        self.counter = os.path.join(self.tmpdir.name, "runs")
+
+    def run_ptimeout(self):
+        flag = os.path.join(self.tmpdir.name, "up")
+        return subprocess.run(
+            [sys.executable, PTIMEOUT, "--circuit-breaker", "2"]
+            + ["--breaker-cooldown", "1s", "-r", "1", "--backoff", "0", "5s"]
+            + ["--", "sh", "-c", f"echo -n x >> {self.counter}; test -e {flag}"],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            env=self.env,
+            timeout=30,
+        )
+
+    def runs(self):
+        with open(self.counter) as f:
+            return len(f.read())
+
+    def test_fails_fast_then_recovers(self):
+        for _ in range(2):
+            self.assertEqual(self.run_ptimeout().returncode, 1)
+        self.assertEqual(self.runs(), 4)  # Each with one retry
+
+        result = self.run_ptimeout()
+        self.assertEqual(result.returncode, EXIT_CIRCUIT_OPEN)
+        self.assertIn(
+            "Circuit open: the command failed 2 times in a row", result.stderr
+        )
+        self.assertEqual(self.runs(), 4)
+
+        time.sleep(1)
+        self.assertEqual(self.run_ptimeout().returncode, 1)  # Failed probe
+        self.assertEqual(self.runs(), 5)  # Probes are not retried
+        self.assertEqual(self.run_ptimeout().returncode, EXIT_CIRCUIT_OPEN)
+
+        time.sleep(1)
+        open(os.path.join(self.tmpdir.name, "up"), "w").close()
+        self.assertEqual(self.run_ptimeout().returncode, 0)  # Successful probe
+        self.assertEqual(self.run_ptimeout().returncode, 0)
+        self.assertEqual(self.runs(), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
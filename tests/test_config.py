@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Tests for config loading: the parse cache, all CLI options and [profile:NAME] sections.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+import ptimeout
+from ptimeout import load_config, resolve_settings, terminate_process_group
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+CONFIG = """
+[defaults]
+timeout = 30s
+retries = 2
+countdown_direction = down
+progress_style = ascii
+max_fps = 10
+backoff = 3s
+backoff_factor = 2
+kill-after = 1m
+bogus = 1
+verbose = maybe
+
+[profile:rsync]
+match = rsync *
+timeout = 30m
+signal = TERM
+
+[profile:any-sleep]
+match = */sleep *
+timeout = 5s
+
+[profile:dumps]
+regex = \\b(pg_dump|mysqldump)\\b
+retries = 0
+
+[profile:late-rsync]
+match = rsync -a *
+timeout = 1s
+"""
+
+
+class ConfigTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.config_path = os.path.join(self.tmpdir.name, "config.ini")
+        self.cache_dir = os.path.join(self.tmpdir.name, "cache")
+        patcher = mock.patch.dict(os.environ, {"PTIMEOUT_CACHE_DIR": self.cache_dir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ptimeout._config_cache.clear()
+        self.addCleanup(ptimeout._config_cache.clear)
+        self.write_config(CONFIG)
+
+    def write_config(self, text, mtime=None):
+        with open(self.config_path, "w") as f:
+            f.write(text)
+        if mtime is not None:
+            os.utime(self.config_path, (mtime, mtime))
+
+
+class TestConfigValues(ConfigTestCase):
+    def test_all_options_are_typed(self):
+        config = load_config(self.config_path)
+        self.assertEqual(config["timeout"], "30s")
+        self.assertEqual(config["retries"], 2)
+        self.assertEqual(config["count_direction"], "down")
+        self.assertEqual(config["progress_style"], "ascii")
+        self.assertEqual(config["max_fps"], 10)
+        self.assertEqual(config["backoff"], 3)
+        self.assertEqual(config["backoff_factor"], 2.0)
+        self.assertEqual(config["kill_after"], 60)
+        self.assertFalse(config["verbose"])
+        self.assertNotIn("bogus", config)
+
+    def test_invalid_values_are_skipped(self):
+        self.write_config(
+            "[defaults]\nretries = -1\nmax_fps = 1000\nsignal = NOPE\ntimeout = 1x\n"
+        )
+        self.assertEqual(load_config(self.config_path), {})
+
+    def test_missing_file(self):
+        self.assertEqual(load_config(os.path.join(self.tmpdir.name, "none.ini")), {})
+
+
+class TestConfigCache(ConfigTestCase):
+    def test_unchanged_file_is_not_parsed_again(self):
+        load_config(self.config_path)
+        ptimeout._config_cache.clear()  # As if in a new process
+        with mock.patch.object(ptimeout, "parse_config_file") as parse:
+            config = load_config(self.config_path)
+        parse.assert_not_called()
+        self.assertEqual(config["retries"], 2)
+        self.assertEqual(resolve_settings(config, ["rsync", "-r", "x"])[1], "rsync")
+
+    def test_modified_file_is_parsed_again(self):
+        self.write_config("[defaults]\nretries = 1\n", mtime=1_000_000)
+        self.assertEqual(load_config(self.config_path)["retries"], 1)
+        self.write_config("[defaults]\nretries = 4\n", mtime=2_000_000)
+        ptimeout._config_cache.clear()
+        self.assertEqual(load_config(self.config_path)["retries"], 4)
+
+    def test_corrupt_cache_is_ignored(self):
+        os.makedirs(self.cache_dir)
+        with open(os.path.join(self.cache_dir, ptimeout.CONFIG_CACHE_FILE), "wb") as f:
+            f.write(b"not marshal data")
+        self.assertEqual(load_config(self.config_path)["retries"], 2)
+
+
+class TestProfiles(ConfigTestCase):
+    def resolve(self, *command):
+        return resolve_settings(load_config(self.config_path), list(command))
+
+    def test_glob_profile_overrides_defaults(self):
+        settings, name = self.resolve("rsync", "-r", "src", "dst")
+        self.assertEqual(name, "rsync")
+        self.assertEqual(settings["timeout"], "30m")
+        self.assertEqual(settings["kill_signal"], "TERM")
+        self.assertEqual(settings["retries"], 2)  # From [defaults]
+
+    def test_program_path_matches_by_base_name(self):
+        self.assertEqual(self.resolve("/usr/bin/rsync", "-r", "a", "b")[1], "rsync")
+        self.assertEqual(self.resolve("/bin/sleep", "10")[1], "any-sleep")
+
+    def test_first_matching_profile_wins(self):
+        self.assertEqual(self.resolve("rsync", "-a", "src", "dst")[1], "rsync")
+
+    def test_regex_profile(self):
+        settings, name = self.resolve("sudo", "-u", "postgres", "pg_dump", "db")
+        self.assertEqual(name, "dumps")
+        self.assertEqual(settings["retries"], 0)
+
+    def test_no_match_uses_defaults(self):
+        settings, name = self.resolve("ls", "-la")
+        self.assertIsNone(name)
+        self.assertEqual(settings["timeout"], "30s")
+
+
+class TestConfigOnCommandLine(ConfigTestCase):
+    def run_ptimeout(self, *args):
+        env = dict(
+            os.environ,
+            PTIMEOUT_CONFIG=self.config_path,
+            PTIMEOUT_CACHE_DIR=self.cache_dir,
+        )
+        interpreter_options = []
+        if args[:1] == ("-X",):
+            interpreter_options, args = list(args[:2]), args[2:]
+        return subprocess.run(
+            [sys.executable] + interpreter_options + [PTIMEOUT] + list(args),
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            env=env,
+            timeout=30,
+        )
+
+    def test_profile_timeout_replaces_timeout_argument(self):
+        self.write_config("[profile:sleep]\nmatch = sleep *\ntimeout = 1s\n")
+        start = time.monotonic()
+        result = self.run_ptimeout("--", "sleep", "10")
+        self.assertEqual(result.returncode, ptimeout.EXIT_TIMEOUT)
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_missing_timeout_without_config_is_still_an_error(self):
+        self.write_config("[profile:sleep]\nmatch = sleep *\ntimeout = 1s\n")
+        result = self.run_ptimeout("--", "true")
+        self.assertEqual(result.returncode, ptimeout.EXIT_PTIMEOUT_ERROR)
+        self.assertIn("Error: The 'TIMEOUT' argument is required.", result.stderr)
+
+    def test_command_line_wins_over_profile(self):
+        self.write_config(
+            "[profile:sleep]\nmatch = sleep *\ntimeout = 1s\nverbose = on\n"
+        )
+        result = self.run_ptimeout("5s", "--", "sleep", "2")
+        self.assertEqual(result.returncode, 0)
+        self.assertIn("Using config profile: sleep", result.stderr)
+
+    def test_default_value_on_command_line_wins(self):
+        counter = os.path.join(self.tmpdir.name, "runs")
+        command = ["sh", "-c", f"echo -n x >> {counter}; exit 1"]
+        for config in (
+            "[defaults]\nretries = 2\nbackoff = 0\n",
+            "[defaults]\nbackoff = 0\n[profile:sh]\nmatch = sh *\nretries = 2\n",
+        ):
+            self.write_config(config)
+            with open(counter, "w"):
+                pass
+            result = self.run_ptimeout("-r", "0", "5s", "--", *command)
+            self.assertEqual(result.returncode, 1)
+            self.assertNotIn("Retrying", result.stderr)
+            with open(counter) as f:
+                self.assertEqual(f.read(), "x")
+
+    def test_cached_config_is_not_parsed_on_later_runs(self):
+        self.run_ptimeout("5s", "--", "true")
+        result = self.run_ptimeout("-X", "importtime", "5s", "--", "true")
+        self.assertNotIn("configparser", result.stderr)
+
+    def test_invalid_signal_option(self):
+        result = self.run_ptimeout("-s", "NOPE", "5s", "--", "true")
+        self.assertEqual(result.returncode, ptimeout.EXIT_PTIMEOUT_ERROR)
+        self.assertIn("Invalid signal: 'NOPE'", result.stderr)
+
+
+class TestKillPolicy(unittest.TestCase):
+    def spawn(self, script):
+        proc = subprocess.Popen(
+            ["sh", "-c", script],
+            stdout=subprocess.PIPE,
+            preexec_fn=os.setsid,
+        )
+        self.addCleanup(proc.stdout.close)
+        proc.stdout.readline()  # Wait until the trap is installed
+        return proc
+
+    def test_signal_then_kill_after_grace(self):
+        proc = self.spawn("trap '' TERM; echo ready; sleep 30")
+        start = time.monotonic()
+        terminate_process_group(proc, "TERM", kill_after=0.5)
+        self.assertEqual(proc.wait(timeout=5), -9)
+        self.assertGreaterEqual(time.monotonic() - start, 0.5)
+
+    def test_cooperative_child_exits_on_first_signal(self):
+        proc = self.spawn("trap 'exit 3' TERM; echo ready; while :; do sleep 0.1; done")
+        start = time.monotonic()
+        terminate_process_group(proc, "SIGTERM", kill_after=10)
+        self.assertEqual(proc.wait(timeout=5), 3)
+        self.assertLess(time.monotonic() - start, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
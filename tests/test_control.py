@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Tests for moving a running ptimeout's deadline with SIGUSR1/SIGUSR2 and the control socket.
+"""
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import EXIT_PTIMEOUT_ERROR, EXIT_TIMEOUT, parse_timeout
+from ptimeout_control import DeadlineControl
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+
+class TestDeadlineControl(unittest.TestCase):
+    def setUp(self):
+        self.control = DeadlineControl(60, parse_timeout)
+
+    def test_commands(self):
+        self.control.attempt = dict(
+            level=0, attempt=1, retries=0, pid=1, timeout=30, started=time.time()
+        )
+        reply = self.control.handle("extend 10m")
+        self.assertEqual((reply["ok"], reply["timeout"]), (True, 630))
+        self.control.handle("shorten 30s")
+        self.assertEqual(self.control.take(), 570)
+        self.assertEqual(self.control.take(), 0)
+        self.assertFalse(self.control.handle("extend soon")["ok"])
+        self.assertFalse(self.control.handle("pause")["ok"])
+        reply = self.control.handle("kill-now")
+        self.assertTrue(self.control.kill_now)
+        self.assertEqual(reply["remaining"], 0)
+
+    def test_command_sent_in_pieces(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            control = DeadlineControl(60, parse_timeout, os.path.join(tmpdir, "s"))
+            control.start()
+            self.addCleanup(control.close)
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(control.path)
+                client.sendall(b"exte")
+                self.assertFalse(control.poll())  # Not waited for
+                client.sendall(b"nd 1m\n")
+                self.assertTrue(control.poll())
+                self.assertTrue(json.loads(client.recv(4096))["ok"])
+            self.assertEqual(control.take(), 60)
+
+    def test_status_between_attempts(self):
+        self.assertEqual(self.control.handle("status"), {"ok": True, "running": False})
+
+
+class TestControlOnCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.socket_path = os.path.join(self.tmpdir.name, "control.sock")
+        self.env = dict(
+            os.environ,
+            PTIMEOUT_STATE_DIR=self.tmpdir.name,
+            PTIMEOUT_CONFIG=os.path.join(self.tmpdir.name, "none.ini"),
+        )
+
+    def start_ptimeout(self, *args):
+        return subprocess.Popen(
+            [sys.executable, PTIMEOUT] + list(args),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            env=self.env,
+        )
+
+    def wait_for(self, path):
+        deadline = time.monotonic() + 10
+        while not os.path.exists(path) and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    def started(self, seconds):
+        """A command that marks when it starts, then sleeps."""
+        marker = os.path.join(self.tmpdir.name, "started")
+        return ["sh", "-c", f"touch {marker}; sleep {seconds}"], marker
+
+    def send(self, command):
+        self.wait_for(self.socket_path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(self.socket_path)
+            client.sendall(command.encode() + b"\n")
+            return json.loads(client.makefile().readline())
+
+    def test_sigusr1_extends_the_deadline(self):
+        command, marker = self.started(2)
+        proc = self.start_ptimeout("--adjust-step", "3s", "1s", "--", *command)
+        self.wait_for(marker)
+        proc.send_signal(signal.SIGUSR1)
+        proc.communicate(timeout=30)
+        self.assertEqual(proc.returncode, 0)
+
+    def test_sigusr2_shortens_the_deadline(self):
+        start = time.monotonic()
+        command, marker = self.started(5)
+        proc = self.start_ptimeout("--adjust-step", "8s", "10s", "--", *command)
+        self.wait_for(marker)
+        proc.send_signal(signal.SIGUSR2)
+        proc.communicate(timeout=30)
+        self.assertEqual(proc.returncode, EXIT_TIMEOUT)
+        self.assertLess(time.monotonic() - start, 4)
+
+    def test_extend_and_status(self):
+        command, marker = self.started(2)
+        proc = self.start_ptimeout(
+            "--control-socket", self.socket_path, "1s", "--", *command
+        )
+        self.wait_for(marker)
+        reply = self.send("extend 1m")
+        self.assertEqual((reply["ok"], reply["timeout"]), (True, 61))
+        status = self.send("status")
+        self.assertEqual((status["attempt"], status["timeout"]), (1, 61))
+        proc.communicate(timeout=30)
+        self.assertEqual(proc.returncode, 0)
+        self.assertFalse(os.path.exists(self.socket_path))  # Removed at the end
+
+    def test_kill_now_skips_retries(self):
+        start = time.monotonic()
+        command, marker = self.started(10)
+        proc = self.start_ptimeout(
+            "--control-socket", self.socket_path, "-r", "3", "30s", "--", *command
+        )
+        self.wait_for(marker)
+        self.assertTrue(self.send("kill-now")["ok"])
+        proc.communicate(timeout=30)
+        self.assertEqual(proc.returncode, EXIT_TIMEOUT)
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_slow_client_does_not_hold_up_the_deadline(self):
+        start = time.monotonic()
+        command, marker = self.started(30)
+        proc = self.start_ptimeout(
+            "--control-socket", self.socket_path, "2s", "--", *command
+        )
+        self.wait_for(marker)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(self.socket_path)
+            try:
+                for _ in range(8):  # One byte at a time, never a whole command
+                    client.send(b"s")
+                    time.sleep(0.6)
+            except OSError:
+                pass  # Hung up on after CLIENT_TIMEOUT
+        proc.communicate(timeout=30)
+        self.assertEqual(proc.returncode, EXIT_TIMEOUT)
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_socket_in_use(self):
+        proc = self.start_ptimeout(
+            "--control-socket", self.socket_path, "5s", "--", "sleep", "2"
+        )
+        self.send("status")
+        other = self.start_ptimeout(
+            "--control-socket", self.socket_path, "5s", "--", "true"
+        )
+        _, stderr = other.communicate(timeout=30)
+        self.assertEqual(other.returncode, EXIT_PTIMEOUT_ERROR)
+        self.assertIn("in use by another ptimeout", stderr)
+        proc.communicate(timeout=30)
+
+
+if __name__ == "__main__":
+    unittest.main()
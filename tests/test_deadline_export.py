@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for exporting the deadline to the command, and for inner ptimeout runs honouring it.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import (
+    DEADLINE_ENV,
+    DEADLINE_FD_ENV,
+    EXIT_TIMEOUT,
+    command_environment,
+    inherited_deadline,
+)
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+WAIT_FOR_DEADLINE = """
+import os, select, signal, time
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+fd = int(os.environ["PTIMEOUT_DEADLINE_FD"])
+start = time.monotonic()
+select.select([fd], [], [])
+print(round(time.monotonic() - start, 1), os.read(fd, 1), flush=True)
+"""
+
+
+class TestDeadlineEnvironment(unittest.TestCase):
+    def test_deadline_variables(self):
+        with mock.patch.dict(os.environ, {DEADLINE_FD_ENV: "9"}):
+            env = command_environment(30)
+        self.assertAlmostEqual(float(env[DEADLINE_ENV]), time.time() + 30, delta=1)
+        self.assertEqual(env["PTIMEOUT_REMAINING"], "30.000")
+        self.assertNotIn(DEADLINE_FD_ENV, env)  # Not ours to pass on
+        self.assertEqual(command_environment(30, 5)[DEADLINE_FD_ENV], "5")
+
+    def test_inherited_deadline(self):
+        with mock.patch.dict(os.environ, {DEADLINE_ENV: "1234.5"}):
+            self.assertEqual(inherited_deadline(), 1234.25)
+        with mock.patch.dict(os.environ, {DEADLINE_ENV: "soon"}):
+            self.assertIsNone(inherited_deadline())
+        with mock.patch.dict(os.environ):
+            os.environ.pop(DEADLINE_ENV, None)
+            self.assertIsNone(inherited_deadline())
+
+
+class TestDeadlineOnCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.env = dict(
+            os.environ,
+            PTIMEOUT_STATE_DIR=self.tmpdir.name,
+            PTIMEOUT_CONFIG=os.path.join(self.tmpdir.name, "none.ini"),
+        )
+        self.env.pop(DEADLINE_ENV, None)
+
+    def run_ptimeout(self, *args):
+        return subprocess.run(
+            [sys.executable, PTIMEOUT] + list(args),
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            env=self.env,
+            timeout=30,
+        )
+
+    def test_command_sees_its_budget(self):
+        result = self.run_ptimeout("1m", "--", "sh", "-c", "echo $PTIMEOUT_REMAINING")
+        self.assertEqual(result.stdout, "60.000\n")
+
+    def test_inner_ptimeout_is_clamped(self):
+        inner = f"{sys.executable} {PTIMEOUT} -v 10s -- sleep 5"
+        start = time.monotonic()
+        result = self.run_ptimeout("2s", "--", "sh", "-c", inner)
+        self.assertLess(time.monotonic() - start, 3.5)
+        self.assertEqual(result.returncode, EXIT_TIMEOUT)
+        self.assertIn(
+            "Timeout clamped to the enclosing ptimeout's deadline", result.stderr
+        )
+
+    def test_deadline_fd_reaches_eof(self):
+        result = self.run_ptimeout(
+            "--deadline-fd",
+            "-s",
+            "TERM",
+            "-k",
+            "2s",
+            "1s",
+            "--",
+            sys.executable,
+            "-c",
+            WAIT_FOR_DEADLINE,
+        )
+        self.assertEqual(result.returncode, EXIT_TIMEOUT)
+        self.assertEqual(result.stdout, "1.0 b''\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Tests for the NDJSON event stream written with --events-fd and --events-file,
+and the progress records written with --progress-fd.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import EXIT_PTIMEOUT_ERROR, EXIT_TIMEOUT
+from ptimeout_events import EventStream
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+
+def fill(writer):
+    """Fill a pipe, as a reader that has stalled would leave it."""
+    os.set_blocking(writer, False)
+    try:
+        while True:
+            os.write(writer, b"x" * 4096)
+    except BlockingIOError:
+        os.set_blocking(writer, True)
+
+
+class TestEventStream(unittest.TestCase):
+    def test_one_line_per_event(self):
+        reader, writer = os.pipe()
+        self.addCleanup(os.close, reader)
+        events = EventStream.open(writer)
+        events.emit("spawned", pid=1)
+        events.exited(-9, EventStream.usage(), pid=1)
+        os.close(writer)
+        lines = os.read(reader, 65536).decode().splitlines()
+        spawned, exited = map(json.loads, lines)
+        self.assertEqual((spawned["event"], spawned["pid"]), ("spawned", 1))
+        self.assertEqual((exited["code"], exited["signal"]), (None, 9))
+        self.assertIn("maxrss_kb", exited["rusage"])
+
+    def test_reader_gone(self):
+        reader, writer = os.pipe()
+        self.addCleanup(os.close, writer)
+        os.close(reader)
+        events = EventStream.open(writer)
+        events.emit("spawned")  # EPIPE: no exception, nothing more is written
+        self.assertIsNone(events.fd)
+
+    def test_full_pipe_drops_records(self):
+        reader, writer = os.pipe()
+        self.addCleanup(os.close, reader)
+        self.addCleanup(os.close, writer)
+        events = EventStream.open(writer)
+        self.assertTrue(os.get_blocking(writer))  # The fd handed over is unchanged
+        while not events.dropped:
+            events.emit("progress", padding="x" * 1000)
+        os.read(reader, 1 << 20)
+        events.emit("exited")
+        last = os.read(reader, 65536).decode().splitlines()[-1]
+        self.assertEqual(json.loads(last)["dropped"], events.dropped)
+
+    def test_closed_fd(self):
+        reader, writer = os.pipe()
+        os.close(reader)
+        os.close(writer)
+        with self.assertRaises(OSError):
+            EventStream.open(writer)
+
+
+class TestEventsOnCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.events = os.path.join(self.tmpdir.name, "events.log")
+        self.env = dict(
+            os.environ,
+            PTIMEOUT_STATE_DIR=self.tmpdir.name,
+            PTIMEOUT_CONFIG=os.path.join(self.tmpdir.name, "none.ini"),
+        )
+
+    def run_ptimeout(self, *args, **kwargs):
+        return subprocess.run(
+            [sys.executable, PTIMEOUT] + list(args),
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            env=self.env,
+            timeout=30,
+            **kwargs,
+        )
+
+    def read_events(self):
+        with open(self.events) as f:
+            return [json.loads(line) for line in f]
+
+    def test_timed_out_attempts(self):
+        result = self.run_ptimeout(
+            "--events-file",
+            self.events,
+            "-r",
+            "1",
+            "--backoff",
+            "0",
+            "1s",
+            "--",
+            "sh",
+            "-c",
+            "echo hi; sleep 5",
+        )
+        self.assertEqual(result.returncode, EXIT_TIMEOUT)
+        self.assertEqual(result.stdout, "hi\nhi\n")  # Output still passes through
+        attempt = [
+            "attempt_start",
+            "spawned",
+            "first_output",
+            "deadline_warning",
+            "signal_sent",
+            "timed_out",
+            "exited",
+            "attempt_end",
+        ]
+        events = self.read_events()
+        self.assertEqual(
+            [event["event"] for event in events],
+            attempt + ["retry_scheduled"] + attempt,
+        )
+        spawned = events[1]
+        self.assertEqual(spawned["pgid"], spawned["pid"])
+        self.assertEqual(events[2]["stream"], "stdout")
+        self.assertEqual(events[4]["signal"], 9)
+        self.assertEqual(events[6]["signal"], 9)
+        self.assertEqual((events[7]["code"], events[7]["timed_out"]), (124, True))
+        self.assertEqual(events[8]["attempt"], 2)
+
+    def test_exit_code_on_events_fd(self):
+        reader, writer = os.pipe()
+        self.addCleanup(os.close, reader)
+        try:
+            result = self.run_ptimeout(
+                "--events-fd",
+                str(writer),
+                "5s",
+                "--",
+                "sh",
+                "-c",
+                "exit 3",
+                pass_fds=(writer,),
+            )
+        finally:
+            os.close(writer)
+        self.assertEqual(result.returncode, 3)
+        events = [json.loads(line) for line in os.read(reader, 65536).splitlines()]
+        exited = next(event for event in events if event["event"] == "exited")
+        self.assertEqual((exited["code"], exited["signal"]), (3, None))
+        self.assertNotIn("first_output", [event["event"] for event in events])
+
+    def test_progress_records(self):
+        reader, writer = os.pipe()
+        self.addCleanup(os.close, reader)
+        try:
+            result = self.run_ptimeout(
+                "--progress-fd",
+                str(writer),
+                "5s",
+                "--",
+                "sh",
+                "-c",
+                "echo hello; sleep 2.5",
+                pass_fds=(writer,),
+            )
+        finally:
+            os.close(writer)
+        self.assertEqual(result.returncode, 0)
+        records = [json.loads(line) for line in os.read(reader, 65536).splitlines()]
+        self.assertEqual(len(records), 3)  # At 0s, 1s and 2s
+        self.assertEqual({record["event"] for record in records}, {"progress"})
+        last = records[-1]
+        self.assertAlmostEqual(last["elapsed"], 2, delta=0.5)
+        self.assertAlmostEqual(last["elapsed"] + last["remaining"], 5, delta=0.01)
+        self.assertEqual((last["attempt"], last["stdout_bytes"]), (1, 6))
+
+    def test_unread_stream_does_not_hold_up_the_deadline(self):
+        reader, writer = os.pipe()
+        self.addCleanup(os.close, reader)
+        fill(writer)
+        try:
+            start = time.monotonic()
+            result = self.run_ptimeout(
+                "--events-fd",
+                str(writer),
+                "1s",
+                "--",
+                "sleep",
+                "10",
+                pass_fds=(writer,),
+            )
+        finally:
+            os.close(writer)
+        self.assertEqual(result.returncode, EXIT_TIMEOUT)
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_unread_progress_does_not_hold_up_the_deadline(self):
+        reader, writer = os.pipe()
+        self.addCleanup(os.close, reader)
+        fill(writer)
+        try:
+            start = time.monotonic()
+            result = self.run_ptimeout(
+                "--progress-fd",
+                str(writer),
+                "1s",
+                "--",
+                "sleep",
+                "10",
+                pass_fds=(writer,),
+            )
+        finally:
+            os.close(writer)
+        self.assertEqual(result.returncode, EXIT_TIMEOUT)
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_progress_interval_must_be_positive(self):
+        result = self.run_ptimeout(
+            "--progress-fd", "2", "--progress-interval", "0", "5s", "--", "true"
+        )
+        self.assertEqual(result.returncode, EXIT_PTIMEOUT_ERROR)
+        self.assertIn("--progress-interval", result.stderr)
+
+    def test_fd_and_file_together(self):
+        result = self.run_ptimeout(
+            "--events-fd", "2", "--events-file", self.events, "5s", "--", "true"
+        )
+        self.assertEqual(result.returncode, EXIT_PTIMEOUT_ERROR)
+        self.assertIn("not both", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for the click-free fast path for `ptimeout TIMEOUT -- COMMAND...`.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import parse_common_argv
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+
+class TestParseCommonArgv(unittest.TestCase):
+    def test_common_form(self):
+        self.assertEqual(
+            parse_common_argv(["10s", "--", "ls", "-la"]), ("10s", ["ls", "-la"])
+        )
+
+    def test_options_fall_back(self):
+        self.assertIsNone(parse_common_argv(["-v", "10s", "--", "ls"]))
+        self.assertIsNone(parse_common_argv(["--dry-run", "--", "ls"]))
+        self.assertIsNone(parse_common_argv(["10s", "-r", "2", "--", "ls"]))
+
+    def test_nested_separators_fall_back(self):
+        self.assertIsNone(
+            parse_common_argv(["10s", "--", "ptimeout", "5s", "--", "ls"])
+        )
+
+    def test_missing_parts_fall_back(self):
+        self.assertIsNone(parse_common_argv(["10s", "--"]))
+        self.assertIsNone(parse_common_argv(["10s", "ls"]))
+        self.assertIsNone(parse_common_argv([]))
+
+
+class TestFastPathBehaviour(unittest.TestCase):
+    def run_ptimeout(self, *args):
+        return subprocess.run(
+            [sys.executable, PTIMEOUT] + list(args),
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+
+    def test_exit_code_and_output_pass_through(self):
+        result = self.run_ptimeout("5s", "--", "sh", "-c", "echo hi; exit 3")
+        self.assertEqual(result.returncode, 3)
+        self.assertEqual(result.stdout, "hi\n")
+        self.assertIn("Command failed with exit code 3.", result.stderr)
+
+    def test_invalid_timeout_matches_full_parser(self):
+        fast = self.run_ptimeout("1x", "--", "true")
+        full = self.run_ptimeout("-r", "0", "1x", "--", "true")
+        self.assertEqual(fast.returncode, full.returncode)
+        self.assertEqual(fast.stderr, full.stderr)
+
+    def test_config_defaults_still_apply(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = os.path.join(tmpdir, "config.ini")
+            with open(config, "w") as f:
+                f.write("[defaults]\nverbose = true\n")
+            result = subprocess.run(
+                [sys.executable, PTIMEOUT, "5s", "--", "true"],
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                text=True,
+                timeout=10,
+                env=dict(os.environ, PTIMEOUT_CONFIG=config),
+            )
+        self.assertIn("=== ptimeout (level 0) ===", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
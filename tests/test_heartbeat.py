@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Tests for --heartbeat, the rolling watchdog the command keeps resetting.
+"""
+
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import EXIT_PTIMEOUT_ERROR, EXIT_TIMEOUT
+from ptimeout_heartbeat import MAX_LINE_LENGTH, Heartbeat, LineMatcher
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+NOTIFY_WATCHDOG = """
+import os, socket, time
+for _ in range(4):
+    socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM).sendto(
+        b"STATUS=working\\nWATCHDOG=1", os.environ["NOTIFY_SOCKET"]
+    )
+    time.sleep(0.5)
+"""
+
+
+class TestHeartbeat(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def open(self, pattern=None):
+        heartbeat = Heartbeat(10, pattern and re.compile(pattern))
+        heartbeat.open(self.tmpdir.name)
+        self.addCleanup(heartbeat.close)
+        heartbeat.last = 0
+        return heartbeat
+
+    def test_pipe(self):
+        heartbeat = self.open()
+        heartbeat.poll()
+        self.assertEqual(heartbeat.last, 0)
+        os.write(heartbeat.writer, b".")
+        heartbeat.poll()
+        self.assertGreater(heartbeat.expires_at(), time.time())
+
+    def test_notify_socket(self):
+        heartbeat = self.open()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as client:
+            client.sendto(b"STATUS=starting", heartbeat.socket_path)
+            heartbeat.poll()
+            self.assertEqual(heartbeat.last, 0)
+            client.sendto(b"WATCHDOG=1", heartbeat.socket_path)
+            heartbeat.poll()
+        self.assertGreater(heartbeat.last, 0)
+
+    def test_pattern_on_whole_lines(self):
+        heartbeat = self.open(r"^progress \d+%$")
+        heartbeat.feed("stdout", "progress 1")
+        self.assertEqual(heartbeat.last, 0)
+        heartbeat.feed("stderr", "0%\n")  # Another stream: not the same line
+        self.assertEqual(heartbeat.last, 0)
+        heartbeat.feed("stdout", "0%\nrest")
+        self.assertGreater(heartbeat.last, 0)
+
+    def test_carriage_returns_end_lines(self):
+        heartbeat = self.open(r"^\d+%$")
+        heartbeat.feed("stderr", "10%\r20")
+        self.assertGreater(heartbeat.last, 0)
+
+    def test_long_unfinished_line_is_capped(self):
+        matcher = LineMatcher(re.compile("x"))
+        for _ in range(100):
+            self.assertFalse(matcher.feed("stdout", "." * 4096))
+        self.assertLessEqual(
+            sum(map(len, matcher.partial["stdout"])), MAX_LINE_LENGTH + 4096
+        )
+
+    def test_socket_removed_on_close(self):
+        heartbeat = self.open()
+        heartbeat.close()
+        self.assertFalse(os.path.exists(heartbeat.socket_path))
+
+
+class TestHeartbeatOnCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.env = dict(
+            os.environ,
+            PTIMEOUT_STATE_DIR=self.tmpdir.name,
+            PTIMEOUT_RUNTIME_DIR=self.tmpdir.name,
+            PTIMEOUT_CONFIG=os.path.join(self.tmpdir.name, "none.ini"),
+        )
+
+    def run_ptimeout(self, *args):
+        start = time.monotonic()
+        result = subprocess.run(
+            [sys.executable, PTIMEOUT] + list(args),
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            env=self.env,
+            timeout=30,
+        )
+        return result, time.monotonic() - start
+
+    def test_silent_command_is_stopped(self):
+        result, duration = self.run_ptimeout(
+            "--heartbeat", "1s", "30s", "--", "sleep", "5"
+        )
+        self.assertEqual(result.returncode, EXIT_TIMEOUT)
+        self.assertLess(duration, 4)
+        self.assertIn("No heartbeat for 1s", result.stderr)
+
+    def test_heartbeat_fd(self):
+        script = "for i in 1 2 3 4; do echo >&$PTIMEOUT_HEARTBEAT_FD; sleep 0.5; done"
+        result, _ = self.run_ptimeout(
+            "--heartbeat", "1s", "30s", "--", "sh", "-c", script
+        )
+        self.assertEqual(result.returncode, 0)
+
+    def test_watchdog_datagram(self):
+        result, _ = self.run_ptimeout(
+            "--heartbeat", "1s", "30s", "--", sys.executable, "-c", NOTIFY_WATCHDOG
+        )
+        self.assertEqual(result.returncode, 0)
+
+    def test_output_pattern(self):
+        script = "for i in 1 2 3 4; do echo tick; echo noise; sleep 0.5; done"
+        result, _ = self.run_ptimeout(
+            "--heartbeat",
+            "1s",
+            "--heartbeat-pattern",
+            "^tick$",
+            "30s",
+            "--",
+            "sh",
+            "-c",
+            script,
+        )
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout.count("tick"), 4)
+
+    def test_timeout_stays_the_hard_maximum(self):
+        script = "while :; do echo >&$PTIMEOUT_HEARTBEAT_FD; sleep 0.2; done"
+        result, duration = self.run_ptimeout(
+            "--heartbeat", "1s", "2s", "--", "sh", "-c", script
+        )
+        self.assertEqual(result.returncode, EXIT_TIMEOUT)
+        self.assertLess(duration, 4)
+
+    def test_pattern_needs_heartbeat(self):
+        result, _ = self.run_ptimeout("--heartbeat-pattern", "x", "5s", "--", "true")
+        self.assertEqual(result.returncode, EXIT_PTIMEOUT_ERROR)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQLite run history and automatic timeouts derived from it.
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import EXIT_TIMEOUT, parse_auto_timeout
+from ptimeout_history import (
+    AUTO_MIN_SAMPLES,
+    HistoryStore,
+    auto_timeout,
+    fingerprint,
+)
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+
+class HistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.store = HistoryStore(os.path.join(self.tmpdir.name, "history.sqlite3"))
+        self.addCleanup(self.store.close)
+
+    def record(self, command, duration, exit_code=0, timed_out=False, at=None):
+        self.store.record(
+            command,
+            started_at=at if at is not None else 1000.0 + duration,
+            duration=duration,
+            exit_code=exit_code,
+            timed_out=timed_out,
+        )
+
+
+class TestHistoryStore(HistoryTestCase):
+    def test_only_successful_runs_of_the_same_command_count(self):
+        self.record(["make", "test"], 10.0)
+        self.record(["make", "test"], 99.0, exit_code=2)
+        self.record(["make", "test"], 60.0, exit_code=124, timed_out=True)
+        self.record(["make", "lint"], 1.0)
+        self.assertEqual(self.store.successful_durations(["make", "test"]), [10.0])
+
+    def test_most_recent_runs_first(self):
+        for i, duration in enumerate([5.0, 6.0, 7.0]):
+            self.record(["job"], duration, at=float(i))
+        self.assertEqual(self.store.successful_durations(["job"], limit=2), [7.0, 6.0])
+
+    def test_fingerprint_separates_arguments(self):
+        self.assertNotEqual(fingerprint(["a b"]), fingerprint(["a", "b"]))
+        self.assertEqual(fingerprint(["ls", "-l"]), fingerprint(["ls", "-l"]))
+
+
+class TestAutoTimeout(HistoryTestCase):
+    def test_fallback_without_enough_history(self):
+        for _ in range(AUTO_MIN_SAMPLES - 1):
+            self.record(["job"], 2.0)
+        self.assertEqual(auto_timeout(["job"], 99, 1.5, 600, self.store), (600, 0))
+
+    def test_percentile_times_factor(self):
+        for duration in [1.0, 2.0, 3.0, 4.0, 10.0]:
+            self.record(["job"], duration)
+        self.assertEqual(auto_timeout(["job"], 99, 1.5, 600, self.store), (15, 5))
+        self.assertEqual(auto_timeout(["job"], 50, 2, 600, self.store), (6, 5))
+
+    def test_never_below_one_second(self):
+        for _ in range(AUTO_MIN_SAMPLES):
+            self.record(["fast"], 0.01)
+        self.assertEqual(auto_timeout(["fast"], 99, 1.5, 600, self.store)[0], 1)
+
+    def test_parse_auto_timeout(self):
+        self.assertEqual(parse_auto_timeout("auto"), (99, 1.5))
+        self.assertEqual(parse_auto_timeout("auto:p95"), (95, 1.5))
+        self.assertEqual(parse_auto_timeout("auto:p90*3"), (90, 3))
+        self.assertEqual(parse_auto_timeout("auto:*2"), (99, 2))
+        for invalid in ["auto:95", "auto:p0", "auto:p101", "auto:p95*0", "autox"]:
+            with self.assertRaises(ValueError):
+                parse_auto_timeout(invalid)
+
+
+class TestHistoryOnCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.config_path = os.path.join(self.tmpdir.name, "config.ini")
+        self.env = dict(
+            os.environ,
+            PTIMEOUT_STATE_DIR=self.tmpdir.name,
+            PTIMEOUT_CACHE_DIR=self.tmpdir.name,
+            PTIMEOUT_CONFIG=self.config_path,
+        )
+
+    def run_ptimeout(self, *args):
+        return subprocess.run(
+            [sys.executable, PTIMEOUT] + list(args),
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            env=self.env,
+            timeout=30,
+        )
+
+    def rows(self):
+        path = os.path.join(self.tmpdir.name, "history.sqlite3")
+        if not os.path.exists(path):
+            return []
+        with sqlite3.connect(path) as connection:
+            return connection.execute(
+                "SELECT command, exit_code, timed_out, attempts, timeout FROM runs"
+            ).fetchall()
+
+    def test_runs_are_recorded(self):
+        self.run_ptimeout("5s", "--", "sh", "-c", "exit 3")
+        self.run_ptimeout("1s", "--", "sleep", "5")
+        self.assertEqual(
+            self.rows(),
+            [("sh -c exit 3", 3, 0, 1, 5.0), ("sleep 5", EXIT_TIMEOUT, 1, 1, 1.0)],
+        )
+
+    def test_peak_rss_is_the_commands_own(self):
+        self.run_ptimeout("5s", "--", "true")
+        self.run_ptimeout("5s", "--", "sleep", "1.5")
+        big = "data = b'x' * (200 << 20)"
+        self.run_ptimeout("5s", "--", sys.executable, "-c", big)
+        path = os.path.join(self.tmpdir.name, "history.sqlite3")
+        with sqlite3.connect(path) as connection:
+            short, small, large = [
+                rss
+                for (rss,) in connection.execute(
+                    "SELECT peak_rss FROM runs ORDER BY id"
+                )
+            ]
+        # Not ptimeout's own size passed off as the command's
+        self.assertLess(short or 0, 20 << 20)
+        self.assertGreater(small, 0)  # Sampled while it ran
+        self.assertLess(small, 20 << 20)
+        self.assertGreater(large, 200 << 20)
+
+    def test_history_can_be_turned_off(self):
+        with open(self.config_path, "w") as f:
+            f.write("[defaults]\nhistory = off\n")
+        self.run_ptimeout("5s", "--", "true")
+        self.assertEqual(self.rows(), [])
+        self.assertFalse(
+            os.path.exists(os.path.join(self.tmpdir.name, "history.sqlite3"))
+        )
+
+    def test_auto_timeout_uses_history(self):
+        with open(self.config_path, "w") as f:
+            f.write("[defaults]\nauto_fallback = 1s\n")
+        result = self.run_ptimeout("-v", "--timeout", "auto", "--", "sleep", "2")
+        self.assertEqual(result.returncode, EXIT_TIMEOUT)  # The 1s fallback
+        self.assertIn("Automatic timeout: 1s (not enough history", result.stderr)
+
+        with HistoryStore(os.path.join(self.tmpdir.name, "history.sqlite3")) as store:
+            for _ in range(AUTO_MIN_SAMPLES):
+                store.record(["sleep", "2"], 0.0, 2.0, 0, False)
+        result = self.run_ptimeout("-v", "auto:p50*2", "--", "sleep", "2")
+        self.assertEqual(result.returncode, 0)
+        self.assertIn("Automatic timeout: 4s (p50 of 5 runs x 2)", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
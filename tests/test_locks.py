@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Tests for --lock/--max-concurrent: host-wide concurrency limits with fair queueing.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import EXIT_PTIMEOUT_ERROR, EXIT_TIMEOUT
+from ptimeout_sync import MAX_POLL_INTERVAL, Semaphore, validate_name
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+
+class TestSemaphore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def semaphore(self, slots=1):
+        semaphore = Semaphore("job", slots, self.tmpdir.name)
+        self.addCleanup(semaphore.release)
+        return semaphore
+
+    def test_slots_are_limited(self):
+        first, second, third = self.semaphore(2), self.semaphore(2), self.semaphore(2)
+        first.acquire()
+        second.acquire()
+        self.assertEqual({first.slot, second.slot}, {0, 1})
+        with self.assertRaises(TimeoutError):
+            third.acquire(deadline=time.time() + 0.1)
+        first.release()
+        self.assertLess(third.acquire(deadline=time.time() + 1), 1)
+        self.assertEqual(third.slot, 0)
+
+    def test_waiters_are_served_in_arrival_order(self):
+        holder = self.semaphore()
+        holder.acquire()
+        order = []
+
+        def wait(name):
+            semaphore = self.semaphore()
+            semaphore.acquire(deadline=time.time() + 10)
+            order.append(name)
+            time.sleep(0.05)
+            semaphore.release()
+
+        threads = []
+        for name in ["a", "b", "c"]:
+            threads.append(threading.Thread(target=wait, args=(name,)))
+            threads[-1].start()
+            time.sleep(0.05)
+        holder.release()
+        for thread in threads:
+            thread.join(timeout=10)
+        self.assertEqual(order, ["a", "b", "c"])
+
+    def test_long_waits_back_off(self):
+        holder = self.semaphore()
+        holder.acquire()
+        pauses = []
+
+        def sleep(seconds):
+            pauses.append(seconds)
+            time.sleep(seconds)
+
+        with self.assertRaises(TimeoutError):
+            self.semaphore().acquire(deadline=time.time() + 2, sleep=sleep)
+        self.assertEqual(max(pauses), MAX_POLL_INTERVAL)
+        self.assertLess(len(pauses), 15)  # Not one look every POLL_INTERVAL
+
+    def test_tickets_of_dead_waiters_are_skipped(self):
+        queue_dir = os.path.join(self.tmpdir.name, "queue")
+        os.makedirs(queue_dir)
+        open(os.path.join(queue_dir, f"{1:020d}.1"), "w").close()  # Not locked
+        self.semaphore().acquire(deadline=time.time() + 1)
+        self.assertEqual(os.listdir(queue_dir), [])
+
+    def test_names(self):
+        self.assertEqual(validate_name("db-dumps.v2_x"), "db-dumps.v2_x")
+        for invalid in ["", "../x", "a/b", ".hidden", "a b"]:
+            with self.assertRaises(ValueError):
+                validate_name(invalid)
+
+
+class TestLockOnCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.env = dict(
+            os.environ,
+            PTIMEOUT_STATE_DIR=self.tmpdir.name,
+            PTIMEOUT_CACHE_DIR=self.tmpdir.name,
+            PTIMEOUT_RUNTIME_DIR=self.tmpdir.name,
+            PTIMEOUT_CONFIG=os.path.join(self.tmpdir.name, "none.ini"),
+        )
+
+    def spawn(self, *args):
+        return subprocess.Popen(
+            [sys.executable, PTIMEOUT] + list(args),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            env=self.env,
+        )
+
+    def hold_lock(self, seconds):
+        holder = self.spawn("--lock", "job", "10s", "--", "sleep", str(seconds))
+        self.addCleanup(holder.stderr.close)
+        time.sleep(0.5)
+        return holder
+
+    def test_wait_does_not_count_by_default(self):
+        holder = self.hold_lock(1.5)
+        start = time.monotonic()
+        waiter = self.spawn("-v", "--lock", "job", "1s", "--", "sleep", "0.1")
+        stderr = waiter.communicate(timeout=30)[1].decode()
+        self.assertEqual(waiter.returncode, 0)
+        self.assertGreater(time.monotonic() - start, 0.8)
+        self.assertIn("Lock 'job': got slot 1 of 1 after waiting", stderr)
+        holder.wait(timeout=30)
+
+    def test_counted_wait_times_out(self):
+        holder = self.hold_lock(3)
+        start = time.monotonic()
+        waiter = self.spawn("--lock", "job", "--count-wait", "1s", "--", "true")
+        stderr = waiter.communicate(timeout=30)[1].decode()
+        self.assertEqual(waiter.returncode, EXIT_TIMEOUT)
+        self.assertLess(time.monotonic() - start, 2.5)
+        self.assertIn("while waiting for lock 'job'", stderr)
+        holder.kill()
+        holder.wait()
+
+    def test_max_concurrent_needs_a_lock(self):
+        result = self.spawn("--max-concurrent", "2", "5s", "--", "true")
+        stderr = result.communicate(timeout=30)[1].decode()
+        self.assertEqual(result.returncode, EXIT_PTIMEOUT_ERROR)
+        self.assertIn("--max-concurrent needs a lock name", stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
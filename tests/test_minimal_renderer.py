@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for the rich-free --progress-style minimal renderer.
+"""
+
+import io
+import os
+import pty
+import subprocess
+import sys
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import MinimalRenderer
+
+
+class FakeTerminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+class TestMinimalRenderer(unittest.TestCase):
+    def test_redraws_only_when_percent_or_second_changes(self):
+        terminal = FakeTerminal()
+        renderer = MinimalRenderer("timeout (level 0)", 100, stream=terminal)
+        self.assertTrue(renderer.update(0.0))
+        self.assertFalse(renderer.update(0.5))  # still 0% and 0:00:00
+        self.assertTrue(renderer.update(1.0))
+        self.assertIn(" 1%", terminal.getvalue())
+        self.assertIn("0:00:01", terminal.getvalue())
+
+    def test_count_down_shows_remaining_time(self):
+        terminal = FakeTerminal()
+        renderer = MinimalRenderer("t", 90, count_direction="down", stream=terminal)
+        renderer.update(0.2)
+        self.assertIn("0:01:30", terminal.getvalue())
+
+    def test_output_clears_status_and_waits_for_line_start(self):
+        terminal = FakeTerminal()
+        renderer = MinimalRenderer("t", 10, stream=terminal)
+        renderer.update(1.0)
+        renderer.write_output("partial", terminal)
+        self.assertTrue(terminal.getvalue().endswith("\r\x1b[2Kpartial"))
+        self.assertFalse(renderer.update(2.0))  # would clobber the partial line
+
+        renderer.write_output(" line\n", terminal)
+        self.assertTrue(renderer.update(2.0))
+
+    def test_disabled_when_stream_is_not_a_terminal(self):
+        stream = io.StringIO()
+        renderer = MinimalRenderer("t", 10, stream=stream)
+        self.assertFalse(renderer.update(1.0))
+        self.assertEqual(stream.getvalue(), "")
+
+    def test_minimal_run_does_not_import_rich(self):
+        script = (
+            "import sys\n"
+            f"sys.path.insert(0, {SRC_DIR!r})\n"
+            "sys.argv = ['ptimeout', '--progress-style', 'minimal', '5s', '--', 'true']\n"
+            "import ptimeout\n"
+            "try:\n"
+            "    ptimeout.main()\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "sys.stderr.write('RICH=%s' % ('rich' in sys.modules))\n"
+        )
+        # Give the child a terminal on stdout so it takes the interactive path
+        master, slave = pty.openpty()
+        try:
+            result = subprocess.run(
+                [sys.executable, "-c", script],
+                stdout=slave,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=10,
+            )
+        finally:
+            os.close(slave)
+            os.close(master)
+        self.assertIn("RICH=False", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
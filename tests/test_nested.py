@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for nested ptimeout levels, run in-process as a stack of deadlines.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import EXIT_PTIMEOUT_ERROR, EXIT_TIMEOUT, parse_nested_level
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+
+class TestParseNestedLevel(unittest.TestCase):
+    def test_level_options(self):
+        level = parse_nested_level(["-r", "2", "--backoff", "0", "-s", "TERM", "5s"])
+        self.assertEqual(level["timeout"], 5)
+        self.assertEqual(level["retries"], 2)
+        self.assertEqual(level["backoff"], 0)
+        self.assertEqual(level["kill_signal"], "TERM")
+        self.assertIsNone(level["kill_after"])
+
+    def test_whole_run_options_are_refused(self):
+        for args in (
+            ["--lock", "x", "5s"],
+            ["--background", "5s"],
+            ["--config", "inner.ini", "5s"],
+            ["--progress-style", "ascii", "5s"],
+            ["--progress-style", "unicode", "5s"],  # The default, but given
+            ["--max-fps", "5", "5s"],
+        ):
+            with self.assertRaisesRegex(ValueError, "only be given to the outermost"):
+                parse_nested_level(args)
+
+    def test_timeout_is_required(self):
+        with self.assertRaisesRegex(ValueError, "needs its own TIMEOUT"):
+            parse_nested_level(["-r", "1"])
+
+    def test_invalid_levels(self):
+        for args in (["5x"], ["-r", "-1", "5s"], ["--no-such-option", "5s"]):
+            with self.assertRaises(ValueError):
+                parse_nested_level(args)
+
+
+class TestNestedOnCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.counter = os.path.join(self.tmpdir.name, "runs")
+        self.env = dict(
+            os.environ,
+            PTIMEOUT_STATE_DIR=self.tmpdir.name,
+            PTIMEOUT_CONFIG=os.path.join(self.tmpdir.name, "none.ini"),
+        )
+
+    def run_ptimeout(self, *args):
+        return subprocess.Popen(
+            [sys.executable, PTIMEOUT] + list(args),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            env=self.env,
+        )
+
+    def counted(self, script):
+        return ["sh", "-c", f"echo -n x >> {self.counter}; {script}"]
+
+    def runs(self):
+        with open(self.counter) as f:
+            return len(f.read())
+
+    def test_one_supervisor_runs_the_command(self):
+        proc = self.run_ptimeout(
+            "5s", "--", "ptimeout", "3s", "--", "sh", "-c", "echo $PPID"
+        )
+        stdout, _ = proc.communicate(timeout=30)
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual(stdout, f"{proc.pid}\n")
+
+    def test_outer_deadline_bounds_the_inner_level(self):
+        start = time.monotonic()
+        proc = self.run_ptimeout("1s", "--", "ptimeout", "10s", "--", "sleep", "5")
+        proc.communicate(timeout=30)
+        self.assertEqual(proc.returncode, EXIT_TIMEOUT)
+        self.assertLess(time.monotonic() - start, 2.5)
+
+    def test_inner_retries_stop_at_the_outer_deadline(self):
+        inner = ["ptimeout", "-r", "9", "--backoff", "0", "10s", "--"]
+        proc = self.run_ptimeout("1s", "--", *inner, *self.counted("sleep 0.4; exit 1"))
+        proc.communicate(timeout=30)
+        self.assertEqual(proc.returncode, EXIT_TIMEOUT)
+        self.assertEqual(self.runs(), 3)
+
+    def test_retries_of_each_level_multiply(self):
+        inner = ["ptimeout", "-r", "2", "--backoff", "0", "10s", "--"]
+        proc = self.run_ptimeout(
+            "-r", "1", "--backoff", "0", "10s", "--", *inner, *self.counted("exit 4")
+        )
+        proc.communicate(timeout=30)
+        self.assertEqual(proc.returncode, 4)
+        self.assertEqual(self.runs(), 6)
+
+    def test_whole_run_options_on_an_inner_level(self):
+        proc = self.run_ptimeout(
+            "5s", "--", "ptimeout", "--lock", "x", "3s", "--", "true"
+        )
+        _, stderr = proc.communicate(timeout=30)
+        self.assertEqual(proc.returncode, EXIT_PTIMEOUT_ERROR)
+        self.assertIn("--lock can only be given to the outermost ptimeout", stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Tests for the progress side channel from nested ptimeout instances to the outer UI.
+"""
+
+import os
+import pty
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import command_environment
+from ptimeout_progress import NestedTimers, timer_id
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+# rich switches to the alternate screen for the full UI
+ALTERNATE_SCREEN = b"\x1b[?1049h"
+
+
+class TestNestedTimers(unittest.TestCase):
+    def record(self, id, parent):
+        return dict(
+            id=id, parent=parent, label=id, timeout=5, started=1.0, state="running"
+        )
+
+    def test_tree_order_and_depth(self):
+        timers = NestedTimers()
+        for id, parent in [("a", None), ("b", "a"), ("c", "b"), ("d", "a")]:
+            timers.add(self.record(id, parent))
+        tree = [(depth, record["id"]) for depth, record in timers.tree()]
+        self.assertEqual(tree, [(0, "a"), (1, "b"), (2, "c"), (1, "d")])
+
+    def test_finished_timers_go_away(self):
+        timers = NestedTimers()
+        timers.start(0, "sleep 5", 5, 1, 0)
+        timers.start(1, "sleep 5", 3, 1, 0)
+        timers.finish(1)
+        self.assertEqual([record["id"] for _, record in timers.tree()], [timer_id(0)])
+        self.assertTrue(timers.poll())  # Changed
+        self.assertFalse(timers.poll())
+
+
+class TestChannel(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def spawn(self, channel, *args, **kwargs):
+        env = command_environment(30, progress_channel=channel)
+        env["PTIMEOUT_CONFIG"] = os.path.join(self.tmpdir.name, "none.ini")
+        env["PTIMEOUT_STATE_DIR"] = self.tmpdir.name
+        return subprocess.Popen(
+            [sys.executable, PTIMEOUT] + list(args),
+            stdin=subprocess.DEVNULL,
+            env=env,
+            pass_fds=(channel[0],) if channel else (),
+            **kwargs,
+        )
+
+    def test_inner_ptimeout_reports_its_timer(self):
+        timers = NestedTimers()
+        timers.start(0, "outer", 30, 1, 0)
+        proc = self.spawn(
+            timers.child_channel(0),
+            "-r",
+            "1",
+            "5s",
+            "--",
+            "sleep",
+            "1",
+            stdout=subprocess.DEVNULL,
+        )
+        timers.spawned()
+        deadline = time.monotonic() + 10
+        while len(timers.timers) < 2 and time.monotonic() < deadline:
+            timers.poll()
+            time.sleep(0.02)
+        (_, outer), (depth, inner) = timers.tree()
+        self.assertEqual(depth, 1)
+        self.assertEqual(inner["parent"], outer["id"])
+        self.assertEqual(inner["label"], "sleep 1")
+        self.assertEqual(
+            (inner["timeout"], inner["attempt"], inner["retries"]), (5, 1, 1)
+        )
+        self.assertLess(abs(time.monotonic() - inner["started"]), 5)
+
+        proc.wait(timeout=30)
+        timers.poll()
+        self.assertEqual(list(timers.timers), [outer["id"]])  # Reported finished
+        timers.command_exited()
+
+    def test_inner_ptimeout_draws_nothing(self):
+        reader, writer = os.pipe()
+        self.addCleanup(os.close, reader)
+        primary, terminal = pty.openpty()
+        self.addCleanup(os.close, primary)
+        proc = self.spawn(
+            (writer, "1.0"), "5s", "--", "echo", "hi", stdout=terminal, stderr=terminal
+        )
+        os.close(writer)
+        os.close(terminal)
+        proc.wait(timeout=30)
+        output = b""
+        try:
+            while chunk := os.read(primary, 65536):
+                output += chunk
+        except OSError:
+            pass  # EIO once the terminal is closed on the other side
+        self.assertIn(b"hi", output)
+        self.assertNotIn(ALTERNATE_SCREEN, output)
+        self.assertIn(b'"parent":"1.0"', os.read(reader, 65536))
+
+    def test_stale_channel_is_ignored(self):
+        with open(os.path.join(self.tmpdir.name, "file"), "w") as f:
+            proc = self.spawn(
+                (f.fileno(), "1.0"), "5s", "--", "true", stdout=subprocess.DEVNULL
+            )
+            self.assertEqual(proc.wait(timeout=30), 0)
+        with open(os.path.join(self.tmpdir.name, "file")) as f:
+            self.assertEqual(f.read(), "")  # Not a pipe: nothing was written to it
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for --rate: host-wide launch pacing through a shared token bucket.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import EXIT_TIMEOUT, parse_rate
+from ptimeout_sync import RateLimiter
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def bucket(self, rate, burst=1):
+        return RateLimiter("api", rate, burst, self.tmpdir.name)
+
+    def test_callers_are_spaced_by_the_rate(self):
+        bucket = self.bucket(4)
+        waits = [bucket.reserve(now=100.0) for _ in range(4)]
+        self.assertEqual(waits, [0, 0.25, 0.5, 0.75])
+        self.assertEqual(bucket.reserve(now=101.0), 0)  # Caught up again
+
+    def test_burst(self):
+        bucket = self.bucket(1, burst=3)
+        self.assertEqual([bucket.reserve(now=10.0) for _ in range(4)], [0, 0, 0, 1])
+
+    def test_bucket_is_shared_through_the_file(self):
+        self.bucket(2).reserve(now=50.0)
+        self.assertEqual(self.bucket(2).reserve(now=50.0), 0.5)
+
+    def test_max_wait_takes_nothing(self):
+        bucket = self.bucket(1)
+        bucket.reserve(now=10.0)
+        with self.assertRaises(TimeoutError):
+            bucket.reserve(max_wait=0.5, now=10.0)
+        self.assertEqual(bucket.reserve(now=10.0), 1)
+
+    def test_clock_from_before_a_reboot_resets_the_bucket(self):
+        bucket = self.bucket(1)
+        for _ in range(5):
+            bucket.reserve(now=1000.0)
+        self.assertEqual(bucket.reserve(now=3.0), 0)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("api:5/s"), ("api", 5, 1))
+        self.assertEqual(parse_rate("api:30/m:10"), ("api", 0.5, 10))
+        self.assertEqual(parse_rate("slow:0.5/h"), ("slow", 0.5 / 3600, 1))
+        for invalid in ["api", "api:5", "api:5/d", "api:0/s", "api:5/s:0", ":5/s"]:
+            with self.assertRaises(ValueError):
+                parse_rate(invalid)
+
+
+class TestRateOnCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.env = dict(
+            os.environ,
+            PTIMEOUT_STATE_DIR=self.tmpdir.name,
+            PTIMEOUT_CACHE_DIR=self.tmpdir.name,
+            PTIMEOUT_RUNTIME_DIR=self.tmpdir.name,
+            PTIMEOUT_CONFIG=os.path.join(self.tmpdir.name, "none.ini"),
+        )
+        self.log = os.path.join(self.tmpdir.name, "starts")
+
+    def spawn(self, *args):
+        return subprocess.Popen(
+            [sys.executable, PTIMEOUT] + list(args),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            env=self.env,
+        )
+
+    def test_launches_are_paced(self):
+        script = f"python3 -c 'import time; print(time.monotonic())' >> {self.log}"
+        procs = [
+            self.spawn("-v", "--rate", "svc:5/s", "10s", "--", "sh", "-c", script)
+            for _ in range(4)
+        ]
+        stderr = "".join(proc.communicate(timeout=30)[1].decode() for proc in procs)
+        self.assertEqual(stderr.count("Rate limit 'svc': waited"), 4)
+        with open(self.log) as f:
+            starts = sorted(float(line) for line in f)
+        self.assertGreaterEqual(starts[-1] - starts[0], 0.55)  # 3 gaps of 0.2s
+
+    def test_counted_wait_beyond_the_timeout(self):
+        first = self.spawn("--rate", "svc:1/m", "5s", "--", "true")
+        first.communicate(timeout=30)
+        second = self.spawn("--rate", "svc:1/m", "--count-wait", "5s", "--", "true")
+        stderr = second.communicate(timeout=30)[1].decode()
+        self.assertEqual(second.returncode, EXIT_TIMEOUT)
+        self.assertIn("for rate limit 'svc'. Command not executed.", stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
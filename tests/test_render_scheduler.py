@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for the decoupled interactive render thread (RenderScheduler).
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+# Add src to path so we can import ptimeout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+from ptimeout import MIN_FPS, HEAVY_OUTPUT_LINES_PER_FRAME, RenderScheduler
+
+
+class TestRenderScheduler(unittest.TestCase):
+    def test_frames_skipped_when_not_dirty(self):
+        frames = []
+        scheduler = RenderScheduler(lambda: frames.append(1), max_fps=50)
+        scheduler.start()
+        time.sleep(0.2)
+        scheduler.stop()
+        self.assertEqual(frames, [])
+        self.assertGreater(scheduler.frames_skipped, 0)
+
+    def test_dirty_marks_are_coalesced_into_one_frame(self):
+        frames = []
+        scheduler = RenderScheduler(lambda: frames.append(1), max_fps=5)
+        scheduler.start()
+        for _ in range(50):
+            scheduler.mark_dirty(1)
+        time.sleep(0.3)
+        scheduler.stop()
+        self.assertEqual(len(frames), 1)
+
+    def test_backs_off_under_heavy_output(self):
+        scheduler = RenderScheduler(lambda: None, max_fps=20)
+        scheduler._adapt(0.0, HEAVY_OUTPUT_LINES_PER_FRAME + 1)
+        self.assertAlmostEqual(scheduler.frame_interval, 0.1)
+        for _ in range(10):
+            scheduler._adapt(0.0, HEAVY_OUTPUT_LINES_PER_FRAME + 1)
+        self.assertAlmostEqual(scheduler.frame_interval, 1.0 / MIN_FPS)
+
+        # Recovers towards the configured maximum once output calms down
+        for _ in range(20):
+            scheduler._adapt(0.0, 0)
+        self.assertAlmostEqual(scheduler.frame_interval, 1.0 / 20)
+
+    def test_slow_render_does_not_block_supervisor(self):
+        release = threading.Event()
+        scheduler = RenderScheduler(lambda: release.wait(2), max_fps=50)
+        scheduler.start()
+        scheduler.mark_dirty()
+        time.sleep(0.1)  # Render thread is now stuck in a slow frame
+
+        start = time.monotonic()
+        for _ in range(100):
+            scheduler.mark_dirty(1)
+        self.assertLess(time.monotonic() - start, 0.1)
+
+        release.set()
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for the throughput and child resource gauges in the progress header.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+# Add src to path so we can import ptimeout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+from ptimeout import (
+    ResourceGauges,
+    StreamCounters,
+    format_bytes,
+    read_process_group_usage,
+)
+
+
+class TestResourceGauges(unittest.TestCase):
+    def test_rates_from_io_counters(self):
+        stdout = StreamCounters()
+        gauges = ResourceGauges({"stdout": stdout})
+        self.assertTrue(gauges.sample(now=10.0))
+
+        stdout.bytes += 4096
+        stdout.lines += 20
+        self.assertFalse(gauges.sample(now=10.5))  # Not due yet
+        self.assertTrue(gauges.sample(now=12.0))
+        self.assertEqual(gauges.rates["stdout"], (2048.0, 10.0))
+        self.assertIn("out 2.0 KB/s 10 l/s", gauges.describe())
+
+    def test_stuck_child_shows_zero_throughput(self):
+        gauges = ResourceGauges({"stdout": StreamCounters()})
+        gauges.sample(now=0.0)
+        gauges.sample(now=1.0)
+        self.assertIn("out 0 B/s 0 l/s", gauges.describe())
+
+    @unittest.skipUnless(os.path.isdir("/proc"), "requires /proc")
+    def test_child_group_cpu_and_rss(self):
+        child = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "import time; print('ready', flush=True); time.sleep(5)",
+            ],
+            stdout=subprocess.PIPE,
+            preexec_fn=os.setsid,
+        )
+        try:
+            child.stdout.readline()  # RSS reads as 0 until the interpreter is up
+            usage = read_process_group_usage(child.pid)
+            self.assertIsNotNone(usage)
+            self.assertGreater(usage[1], 0)  # The interpreter has some RSS
+
+            gauges = ResourceGauges({}, pgid=child.pid)
+            gauges.sample(now=0.0)
+            gauges.sample(now=1.0)
+            self.assertIsNotNone(gauges.cpu_percent)
+            self.assertIn("rss", gauges.describe())
+        finally:
+            child.kill()
+            child.wait()
+            child.stdout.close()
+
+    def test_unknown_group_has_no_usage(self):
+        # No process can be in a group with a PID this large
+        self.assertEqual(read_process_group_usage(2**31 - 1)[1], 0)
+
+    def test_format_bytes(self):
+        self.assertEqual(format_bytes(512), "512 B")
+        self.assertEqual(format_bytes(1536), "1.5 KB")
+        self.assertEqual(format_bytes(3 * 1024**3), "3.0 GB")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Tests for sd_notify support (--sd-notify) and Type=notify unit generation,
+against a local datagram socket standing in for systemd.
+"""
+
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import EXIT_PTIMEOUT_ERROR, generate_systemd_unit
+from ptimeout_notify import Notifier
+from ptimeout_systemd import generate_systemd_service
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+
+class FakeSystemd:
+    """A notify socket that collects everything sent to it, as it arrives."""
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, "notify.sock")
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(self.path)
+        self.received = []  # (arrival time, message)
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        while True:
+            try:
+                data = self.socket.recv(4096)
+            except OSError:
+                return  # Closed
+            self.received.append((time.monotonic(), data.decode()))
+
+    def messages(self):
+        time.sleep(0.05)  # Let the reader catch up
+        return [message for _, message in self.received]
+
+    def close(self):
+        self.socket.shutdown(socket.SHUT_RDWR)
+        self.socket.close()
+
+
+class TestNotifier(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.systemd = FakeSystemd(self.tmpdir.name)
+        self.addCleanup(self.systemd.close)
+
+    def test_environment(self):
+        environ = {
+            "NOTIFY_SOCKET": self.systemd.path,
+            "WATCHDOG_USEC": "4000000",
+            "WATCHDOG_PID": str(os.getpid()),
+        }
+        notifier = Notifier.from_environment(environ=environ)
+        self.addCleanup(notifier.close)
+        self.assertEqual(notifier.watchdog_interval, 2)
+        self.assertEqual(environ, {})  # Not passed on to the command
+        self.assertIsNone(Notifier.from_environment(environ={}))
+
+    def test_watchdog_of_another_process(self):
+        environ = {
+            "NOTIFY_SOCKET": "@systemd",
+            "WATCHDOG_USEC": "4000000",
+            "WATCHDOG_PID": "1",
+        }
+        notifier = Notifier.from_environment(environ=environ)
+        self.addCleanup(notifier.close)
+        self.assertEqual(notifier.address, "\0systemd")
+        self.assertIsNone(notifier.watchdog_interval)
+
+    def test_ready_once_and_watchdog_only_while_progressing(self):
+        notifier = Notifier(self.systemd.path, watchdog_interval=10)
+        self.addCleanup(notifier.close)
+        notifier.ready()
+        notifier.ready()
+        notifier.tick("1s left", progressing=False)
+        notifier.tick("1s left")
+        notifier.tick("0s left")  # Nothing due yet
+        self.assertEqual(
+            self.systemd.messages(),
+            ["READY=1", "STATUS=1s left", "WATCHDOG=1"],
+        )
+
+    def test_ready_pattern(self):
+        notifier = Notifier(self.systemd.path, ready_pattern=re.compile("^listening"))
+        self.addCleanup(notifier.close)
+        notifier.feed("stdout", "starting\nlisten")
+        self.assertFalse(notifier.is_ready)
+        notifier.feed("stdout", "ing on :8080\n")
+        self.assertEqual(self.systemd.messages(), ["READY=1"])
+
+
+class TestSdNotifyOnCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.systemd = FakeSystemd(self.tmpdir.name)
+        self.addCleanup(self.systemd.close)
+        self.env = dict(
+            os.environ,
+            PTIMEOUT_STATE_DIR=self.tmpdir.name,
+            PTIMEOUT_RUNTIME_DIR=self.tmpdir.name,
+            PTIMEOUT_CONFIG=os.path.join(self.tmpdir.name, "none.ini"),
+            NOTIFY_SOCKET=self.systemd.path,
+            WATCHDOG_USEC="400000",
+        )
+
+    def run_ptimeout(self, *args):
+        return subprocess.run(
+            [sys.executable, PTIMEOUT] + list(args),
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            env=self.env,
+            timeout=30,
+        )
+
+    def test_service_lifecycle(self):
+        result = self.run_ptimeout(
+            "--sd-notify", "10s", "--", "sh", "-c", 'echo "[$NOTIFY_SOCKET]"; sleep 1'
+        )
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout, "[]\n")  # The command does not get our socket
+        messages = self.systemd.messages()
+        self.assertEqual(messages[0], "READY=1")
+        self.assertIn("STATUS=Attempt 1/1: 10s of 10s left", messages[1])
+        self.assertGreaterEqual(sum("WATCHDOG=1" in m for m in messages), 3)
+        self.assertEqual(messages[-1], "STOPPING=1\nSTATUS=Command exited with code 0")
+
+    def test_ready_pattern(self):
+        result = self.run_ptimeout(
+            "--sd-notify",
+            "--ready-pattern",
+            "^ready$",
+            "10s",
+            "--",
+            "sh",
+            "-c",
+            "sleep 0.5; echo ready; sleep 0.5",
+        )
+        self.assertEqual(result.returncode, 0)
+        messages = self.systemd.messages()
+        self.assertEqual(messages.count("READY=1"), 1)
+        self.assertNotEqual(messages[0], "READY=1")  # Not at spawn
+
+    def test_watchdog_pinged_between_retries(self):
+        result = self.run_ptimeout(
+            "--sd-notify", "-r", "1", "--backoff", "2s", "10s", "--", "false"
+        )
+        self.assertEqual(result.returncode, 1)
+        messages = self.systemd.messages()
+        self.assertIn("STATUS=Retrying (1/1) in 2s", "".join(messages))
+        pings = [t for t, m in self.systemd.received if "WATCHDOG=1" in m]
+        # Pinged every 0.2s, also while backing off between the attempts
+        self.assertLess(max(b - a for a, b in zip(pings, pings[1:])), 0.5)
+
+    def test_ready_pattern_needs_sd_notify(self):
+        result = self.run_ptimeout("--ready-pattern", "x", "5s", "--", "true")
+        self.assertEqual(result.returncode, EXIT_PTIMEOUT_ERROR)
+
+
+class TestNotifyUnits(unittest.TestCase):
+    def test_generate_systemd_unit(self):
+        unit = generate_systemd_unit("job", "5m", ["./job.sh"], watchdog_sec="30s")
+        self.assertIn("Type=notify\n", unit)
+        self.assertIn(
+            "ExecStart=/usr/local/bin/ptimeout --sd-notify 5m -- ./job.sh\n", unit
+        )
+        self.assertIn("WatchdogSec=30s\n", unit)
+        unit = generate_systemd_unit("job", "5m", ["./job.sh"])
+        self.assertIn("Type=simple\n", unit)
+        self.assertNotIn("--sd-notify", unit)
+
+    def test_generate_systemd_service(self):
+        args = argparse.Namespace(
+            retries=None,
+            verbose=False,
+            count_direction=None,
+            config=None,
+            timeout="5m",
+            command=["./job.sh"],
+            description="job",
+            after=None,
+            environment=None,
+            working_directory=None,
+            user=None,
+            group=None,
+            restart=None,
+            restart_sec=None,
+            memory_limit=None,
+            cpu_quota=None,
+            stdout_log=None,
+            stderr_log=None,
+            notify=True,
+            watchdog_sec="1min",
+        )
+        service = generate_systemd_service(args)
+        self.assertIn("Type=notify\n", service)
+        self.assertIn("ptimeout --sd-notify 5m -- ./job.sh\n", service)
+        self.assertIn("WatchdogSec=1min\n", service)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Tests for --singleflight: concurrent identical runs share one execution.
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import EXIT_TIMEOUT
+from ptimeout_sync import Flight
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+
+class TestFlight(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_follower_receives_output_and_exit_code(self):
+        leader = Flight("k", self.tmpdir.name)
+        self.assertIsNone(leader.join(time.time() + 5, None))
+
+        received = []
+        result = {}
+        follower = Flight("k", self.tmpdir.name)
+        self.addCleanup(follower.close)
+        thread = threading.Thread(
+            target=lambda: result.update(
+                code=follower.join(
+                    time.time() + 5, lambda *chunk: received.append(chunk)
+                )
+            )
+        )
+        thread.start()
+        leader.publish("stdout", b"one\n")
+        leader.publish("stderr", b"two\n")
+        deadline = time.time() + 5
+        while len(received) < 2 and time.time() < deadline:
+            time.sleep(0.01)  # Finishing first would leave nothing to join
+        leader.finish(3)
+        thread.join(timeout=5)
+        self.assertEqual(result["code"], 3)
+        self.assertEqual(received, [("stdout", b"one\n"), ("stderr", b"two\n")])
+        self.assertEqual(os.listdir(self.tmpdir.name), ["k.lock"])
+
+    def test_follower_deadline(self):
+        leader = Flight("k", self.tmpdir.name)
+        self.addCleanup(leader.close)
+        leader.join(time.time() + 5, None)
+        follower = Flight("k", self.tmpdir.name)
+        self.addCleanup(follower.close)
+        with self.assertRaises(TimeoutError):
+            follower.join(time.time() + 0.2, lambda *chunk: None)
+
+    def test_follower_takes_over_from_a_dead_leader(self):
+        leader = Flight("k", self.tmpdir.name)
+        leader.join(time.time() + 5, None)
+        leader.publish("stdout", b"partial")
+        follower = Flight("k", self.tmpdir.name)
+        self.addCleanup(follower.close)
+        threading.Timer(0.2, leader.close).start()  # Dies without finishing
+        self.assertIsNone(follower.join(time.time() + 5, lambda *chunk: None))
+        self.assertEqual(follower._read_lock()[0], os.getpid())
+
+    def test_abandoned_flight_is_taken_over(self):
+        leader = Flight("k", self.tmpdir.name)
+        leader.join(time.time() + 5, None)
+        leader.abandon()
+        self.assertEqual(os.listdir(self.tmpdir.name), ["k.lock"])
+        follower = Flight("k", self.tmpdir.name)
+        self.addCleanup(follower.close)
+        self.assertIsNone(follower.join(time.time() + 0.2, lambda *chunk: None))
+
+
+class TestSingleflightOnCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.counter = os.path.join(self.tmpdir.name, "runs")
+        self.env = dict(
+            os.environ,
+            PTIMEOUT_STATE_DIR=self.tmpdir.name,
+            PTIMEOUT_CACHE_DIR=self.tmpdir.name,
+            PTIMEOUT_RUNTIME_DIR=self.tmpdir.name,
+            PTIMEOUT_CONFIG=os.path.join(self.tmpdir.name, "none.ini"),
+        )
+
+    def spawn(self, timeout, script):
+        proc = subprocess.Popen(
+            [sys.executable, PTIMEOUT, "--singleflight", timeout, "--", "sh", "-c"]
+            + [f"echo -n x >> {self.counter}; {script}"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=self.env,
+        )
+        self.addCleanup(proc.stdout.close)
+        self.addCleanup(proc.stderr.close)
+        return proc
+
+    def runs(self):
+        with open(self.counter) as f:
+            return len(f.read())
+
+    def test_identical_runs_execute_once(self):
+        script = "for i in 1 2 3; do echo line $i; sleep 0.3; done; exit 4"
+        procs = []
+        for _ in range(4):
+            procs.append(self.spawn("10s", script))
+            time.sleep(0.1)
+        results = [(proc.wait(timeout=30), proc.stdout.read()) for proc in procs]
+        self.assertEqual(self.runs(), 1)
+        self.assertEqual(results, [(4, b"line 1\nline 2\nline 3\n")] * 4)
+
+    def test_followers_get_binary_output_byte_for_byte(self):
+        script = "sleep 0.5; printf '\\377\\376\\000A'"
+        procs = [self.spawn("10s", script)]
+        time.sleep(0.2)
+        procs.append(self.spawn("10s", script))
+        results = [(proc.wait(timeout=30), proc.stdout.read()) for proc in procs]
+        self.assertEqual(self.runs(), 1)
+        self.assertEqual(results, [(0, b"\xff\xfe\x00A")] * 2)
+
+    def test_waiters_deadline_is_enforced(self):
+        leader = self.spawn("10s", "sleep 2; echo done")
+        time.sleep(0.3)
+        start = time.monotonic()
+        waiter = self.spawn("1s", "sleep 2; echo done")
+        self.assertEqual(waiter.wait(timeout=30), EXIT_TIMEOUT)
+        self.assertLess(time.monotonic() - start, 1.9)
+        self.assertIn(b"while waiting for an identical run", waiter.stderr.read())
+        self.assertEqual(leader.wait(timeout=30), 0)
+        self.assertEqual(self.runs(), 1)
+
+    def test_waiter_runs_the_command_if_the_leader_dies(self):
+        leader = self.spawn("10s", "sleep 1")
+        time.sleep(0.3)
+        waiter = self.spawn("10s", "sleep 1")
+        time.sleep(0.3)
+        leader.send_signal(signal.SIGKILL)
+        self.assertEqual(waiter.wait(timeout=30), 0)
+        self.assertEqual(self.runs(), 2)
+
+    def test_leader_that_gives_up_waiting_for_a_lock_ends_the_flight(self):
+        holder = subprocess.Popen(
+            [sys.executable, PTIMEOUT, "--lock", "db", "10s", "--", "sleep", "3"],
+            stdin=subprocess.DEVNULL,
+            env=self.env,
+        )
+        self.addCleanup(holder.wait)
+        time.sleep(0.5)
+        result = subprocess.run(
+            [sys.executable, PTIMEOUT, "--singleflight", "--lock", "db"]
+            + ["--count-wait", "1s", "--", "true"],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            env=self.env,
+            timeout=30,
+        )
+        self.assertEqual(result.returncode, EXIT_TIMEOUT)
+        flights = os.listdir(os.path.join(self.tmpdir.name, "flights"))
+        self.assertEqual([name for name in flights if name.endswith(".out")], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
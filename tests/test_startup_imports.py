@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Startup import budget: which modules each entry path loads, and how long imports take.
+
+Uses `python -X importtime`, which reports every module import on stderr.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import unittest
+
+PTIMEOUT = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "src", "ptimeout.py"
+)
+
+# Import time ptimeout may add on top of a bare interpreter, in microseconds.
+# With room for jitter: these catch a heavy import sneaking onto a path.
+VERSION_BUDGET_US = 20_000
+SYSTEMD_BUDGET_US = 40_000
+DRY_RUN_BUDGET_US = 75_000
+RUN_BUDGET_US = 45_000
+
+# Everything a plain `TIMEOUT -- COMMAND` run needs: the standard library
+# modules below, with whatever they import in turn, and ptimeout's own
+# control (SIGUSR1/SIGUSR2) and history modules
+RUN_STDLIB_IMPORTS = "fcntl, hashlib, math, resource, signal, sqlite3, subprocess"
+RUN_OWN_MODULES = {"ptimeout_control", "ptimeout_history"}
+
+HEAVY_MODULES = {"click", "rich", "argparse", "configparser", "queue", "shutil"}
+
+
+def import_profile(args):
+    """Run args under -X importtime; return (set of top-level modules, total microseconds)."""
+    env = dict(os.environ, PTIMEOUT_CONFIG=os.devnull + ".missing")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        env=env,
+        timeout=30,
+    )
+    modules = set()
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        total += int(self_us)
+        modules.add(name.strip().split(".")[0])
+    return modules, total
+
+
+def median_overhead(args, runs=3):
+    baseline = statistics.median(import_profile(["-c", "pass"])[1] for _ in range(runs))
+    measured = statistics.median(import_profile(args)[1] for _ in range(runs))
+    return measured - baseline
+
+
+class TestStartupImports(unittest.TestCase):
+    def test_version_imports_nothing_heavy(self):
+        modules, _ = import_profile([PTIMEOUT, "--version"])
+        self.assertFalse(modules & (HEAVY_MODULES | {"subprocess", "threading"}))
+        self.assertLess(median_overhead([PTIMEOUT, "--version"]), VERSION_BUDGET_US)
+
+    def test_systemd_generate_skips_click_and_rich(self):
+        args = [
+            PTIMEOUT,
+            "systemd",
+            "generate",
+            "--name",
+            "demo",
+            "--timeout",
+            "5s",
+            "--command",
+            "true",
+        ]
+        modules, _ = import_profile(args)
+        self.assertNotIn("click", modules)
+        self.assertNotIn("rich", modules)
+        self.assertLess(median_overhead(args), SYSTEMD_BUDGET_US)
+
+    def test_dry_run_skips_rich_and_config_parsing(self):
+        args = [PTIMEOUT, "--dry-run", "5s", "--", "echo", "x"]
+        modules, _ = import_profile(args)
+        self.assertFalse(modules & {"rich", "argparse", "configparser", "queue"})
+        self.assertLess(median_overhead(args), DRY_RUN_BUDGET_US)
+
+    def test_non_interactive_run_imports_only_what_it_needs(self):
+        args = [PTIMEOUT, "5s", "--", "true"]
+        modules, _ = import_profile(args)
+        needed, _ = import_profile(["-c", f"import {RUN_STDLIB_IMPORTS}"])
+        self.assertEqual(modules - needed, RUN_OWN_MODULES)
+        self.assertLess(median_overhead(args), RUN_BUDGET_US)
+
+
+if __name__ == "__main__":
+    unittest.main()
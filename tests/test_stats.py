@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Tests for `ptimeout stats`: per-command statistics over the run history.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Add src to path so we can import ptimeout
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, SRC_DIR)
+
+from ptimeout import format_stats_duration
+from ptimeout_history import HistoryStore, parse_window
+
+PTIMEOUT = os.path.join(SRC_DIR, "ptimeout.py")
+
+
+class StatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.store = HistoryStore(os.path.join(self.tmpdir.name, "history.sqlite3"))
+        self.addCleanup(self.store.close)
+        # backup: 10 runs of 1..10s against a 10s timeout, the last one timed out
+        for i in range(1, 11):
+            self.store.record(
+                ["backup"],
+                started_at=1000.0 + i,
+                duration=float(i),
+                exit_code=124 if i == 10 else 0,
+                timed_out=i == 10,
+                attempts=2 if i in (3, 4) else 1,
+                timeout=10.0,
+                peak_rss=i * 1024,
+            )
+        self.store.record(["lint"], 5000.0, 0.5, 1, False)
+
+    def stats(self, **kwargs):
+        return {row["command"]: row for row in self.store.command_stats(**kwargs)}
+
+
+class TestCommandStats(StatsTestCase):
+    def test_rates_and_percentiles(self):
+        backup = self.stats()["backup"]
+        self.assertEqual(backup["runs"], 10)
+        self.assertAlmostEqual(backup["success_rate"], 0.9)
+        self.assertAlmostEqual(backup["timeout_rate"], 0.1)
+        self.assertAlmostEqual(backup["retry_rate"], 0.2)
+        self.assertAlmostEqual(backup["near_timeout_rate"], 0.2)  # 8s and 9s
+        self.assertEqual((backup["p50"], backup["p90"], backup["p99"]), (5, 9, 10))
+        self.assertEqual(backup["peak_rss"], 5 * 1024)
+        self.assertEqual(backup["last_run"], 1010.0)
+
+    def test_time_window(self):
+        backup = self.stats(since=1006.0, until=1009.0)["backup"]
+        self.assertEqual(backup["runs"], 3)  # Runs 6, 7 and 8
+        self.assertEqual((backup["p50"], backup["p99"]), (7, 8))
+        self.assertNotIn("lint", self.stats(until=2000.0))
+
+    def test_command_glob_and_sort(self):
+        self.assertEqual(list(self.stats(command="li*")), ["lint"])
+        rows = self.store.command_stats(sort="near-timeout", limit=1)
+        self.assertEqual([row["command"] for row in rows], ["backup"])
+        rows = self.store.command_stats(sort="recent")
+        self.assertEqual([row["command"] for row in rows], ["lint", "backup"])
+
+    def test_missing_peak_rss(self):
+        self.assertIsNone(self.stats()["lint"]["peak_rss"])
+
+
+class TestFormatting(unittest.TestCase):
+    def test_parse_window(self):
+        self.assertEqual(parse_window("90m", now=10000), 10000 - 5400)
+        self.assertEqual(parse_window("2d", now=200000), 200000 - 172800)
+        self.assertIsInstance(parse_window("2026-01-31"), float)
+        for invalid in ["", "7x", "d", "yesterday"]:
+            with self.assertRaises(ValueError):
+                parse_window(invalid)
+
+    def test_format_stats_duration(self):
+        self.assertEqual(format_stats_duration(0.25), "250ms")
+        self.assertEqual(format_stats_duration(12.44), "12.4s")
+        self.assertEqual(format_stats_duration(185), "3m05s")
+        self.assertEqual(format_stats_duration(3720), "1h02m")
+
+
+class TestStatsOnCommandLine(StatsTestCase):
+    def run_stats(self, *args):
+        return subprocess.run(
+            [sys.executable, PTIMEOUT, "stats"] + list(args),
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            env=dict(os.environ, PTIMEOUT_STATE_DIR=self.tmpdir.name),
+            timeout=30,
+        )
+
+    def test_table(self):
+        result = self.run_stats()
+        self.assertEqual(result.returncode, 0)
+        lines = result.stdout.splitlines()
+        self.assertEqual(lines[0].split()[:3], ["COMMAND", "RUNS", "OK"])
+        self.assertEqual(
+            lines[1].split(),
+            ["backup", "10", "90%", "10%", "20%", "20%", "5.0s", "9.0s", "10.0s"]
+            + ["5.0", "KB"],
+        )
+
+    def test_json(self):
+        result = self.run_stats("--json", "--command", "backup", "--until", "1d")
+        self.assertEqual(result.returncode, 0)
+        commands = json.loads(result.stdout)["commands"]
+        self.assertEqual([c["command"] for c in commands], ["backup"])
+        self.assertEqual(commands[0]["p90"], 9.0)
+
+    def test_invalid_window(self):
+        result = self.run_stats("--since", "soon")
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("Invalid time: 'soon'", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()